@@ -29,7 +29,6 @@ setup(
         "sphinx >= 2.0",
         "sphinxcontrib-httpdomain >= 1.5.0",
         "PyYAML >= 3.12",
-        "jsonschema >= 2.5.1",
         "m2r >= 0.2",
     ],
     project_urls={
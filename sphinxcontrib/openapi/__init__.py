@@ -21,6 +21,7 @@ except DistributionNotFound:
 
 _BUILTIN_RENDERERS = {
     "httpdomain:old": renderers.HttpdomainOldRenderer,
+    "httpdomain": renderers.HttpdomainRenderer,
 }
 _DEFAULT_RENDERER_NAME = "httpdomain:old"
 
@@ -53,8 +54,20 @@ def _register_rendering_directives(app, conf):
 def setup(app):
     app.add_config_value("openapi_default_renderer", _DEFAULT_RENDERER_NAME, "html")
     app.add_config_value("openapi_renderers", {}, "html")
+    app.add_config_value("openapi_cache_dir", None, "")
+    app.add_config_value("openapi_cache_memory_limit", 512 * 1024 * 1024, "")
+    app.add_config_value("openapi_cache_markup", False, "")
+    app.add_config_value("openapi_lazy_loading", False, "")
+    app.add_config_value("openapi_mirror_dir", None, "")
 
     app.setup_extension("sphinxcontrib.httpdomain")
     app.connect("config-inited", _register_rendering_directives)
+    app.connect("config-inited", directive._configure_cache)
+    app.connect("builder-inited", directive._note_cache_dir)
+    app.connect("env-get-outdated", directive._get_outdated)
+    app.connect("env-before-read-docs", directive._prewarm_specs)
+    app.connect("env-purge-doc", directive._purge_doc)
+    app.connect("env-merge-info", directive._merge_info)
+    app.connect("env-updated", directive._evict_unused_specs)
 
     return {"version": __version__, "parallel_read_safe": True}
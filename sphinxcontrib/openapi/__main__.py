@@ -60,7 +60,8 @@ def main():
         openapi_options['group'] = True
 
     openapi_options.setdefault('uri', 'file://%s' % options.input)
-    spec = directive._get_spec(options.input, options.encoding)
+    spec = directive._get_normalized_spec(
+        options.input, options.encoding, openapi_options['uri'], None)
     renderer = renderers.HttpdomainOldRenderer(None, openapi_options)
 
     for line in renderer.render_restructuredtext_markup(spec):
@@ -0,0 +1,176 @@
+"""Caches used to avoid loading and normalizing the same specs repeatedly."""
+
+import collections
+import hashlib
+import os
+import pickle
+import sys
+import tempfile
+
+from sphinx.util import logging
+
+
+LOG = logging.getLogger(__name__)
+
+
+def digest(data):
+    """Return a digest of given bytes suitable to be used as a cache key."""
+    return hashlib.sha256(data).hexdigest()
+
+
+def sizeof(obj):
+    """Estimate memory occupied by a given object and the objects it holds.
+
+    Only containers that may be found in loaded specs are traversed, other
+    objects may count what they hold via ``__sizeof__()``. Objects referenced
+    multiple times are counted once.
+    """
+    seen = set()
+    stack = [obj]
+    total = 0
+
+    while stack:
+        obj = stack.pop()
+        if id(obj) in seen:
+            continue
+        seen.add(id(obj))
+        total += sys.getsizeof(obj)
+
+        if isinstance(obj, dict):
+            stack.extend(obj.keys())
+            stack.extend(obj.values())
+        elif isinstance(obj, (list, tuple)):
+            stack.extend(obj)
+    return total
+
+
+class MemoryCache:
+    """In-memory LRU cache bounded by the total size of its values.
+
+    Values are evicted in least recently used order once their total size
+    exceeds the limit. The most recently stored value is never evicted
+    though, even if it alone exceeds the limit, as it's about to be used.
+    """
+
+    def __init__(self, limit=None):
+        self._entries = collections.OrderedDict()
+        self._limit = limit
+        self._size = 0
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def __iter__(self):
+        return iter(list(self._entries))
+
+    @property
+    def size(self):
+        return self._size
+
+    def get(self, key):
+        try:
+            value, _ = self._entries[key]
+        except KeyError:
+            return None
+
+        self._entries.move_to_end(key)
+        return value
+
+    def set(self, key, value, size):
+        self.discard(key)
+        self._entries[key] = (value, size)
+        self._size += size
+        self._evict()
+
+    def grow(self, key, value, size):
+        """Add a given size to the one of a value, e.g. once the value's grown.
+
+        Nothing happens if the value is not stored under the key anymore.
+        """
+        try:
+            stored, stored_size = self._entries[key]
+        except KeyError:
+            return
+        if stored is not value:
+            return
+
+        self._entries[key] = (stored, stored_size + size)
+        self._size += size
+        self._evict()
+
+    def discard(self, key):
+        _, size = self._entries.pop(key, (None, 0))
+        self._size -= size
+
+    def resize(self, limit):
+        self._limit = limit
+        self._evict()
+
+    def _evict(self):
+        while (
+            self._limit is not None
+            and self._size > self._limit
+            and len(self._entries) > 1
+        ):
+            _, (_, size) = self._entries.popitem(last=False)
+            self._size -= size
+
+
+class DiskCache:
+    """Persistent key-value storage backed by pickle files.
+
+    Each key is stored in a separate file, and writes are atomic, so the
+    cache can be shared by concurrent Sphinx processes (e.g. parallel CI
+    jobs or ``-j N`` workers). Any entry that cannot be read is treated as
+    missing, the caller is expected to re-create and re-store it.
+    """
+
+    def __init__(self, directory):
+        self._directory = directory
+
+    def _path(self, key):
+        return os.path.join(self._directory, digest(repr(key).encode("utf-8")))
+
+    def get(self, key):
+        try:
+            with open(self._path(key), "rb") as stream:
+                stored_key, value = pickle.load(stream)
+        except FileNotFoundError:
+            return None
+        except Exception as exc:
+            LOG.debug("[openapi] ignoring broken cache entry for %r: %s", key, exc)
+            return None
+
+        # Digests may collide, however unlikely that is.
+        if stored_key != key:
+            return None
+        return value
+
+    def set(self, key, value):
+        """Store a given value under a given key.
+
+        The cache is an optimization only, so values that cannot be stored
+        (e.g. the directory is not writable, or the value is not picklable)
+        are reported and skipped.
+        """
+        try:
+            os.makedirs(self._directory, exist_ok=True)
+            fd, tmppath = tempfile.mkstemp(dir=self._directory, suffix=".tmp")
+        except OSError as exc:
+            LOG.warning("[openapi] cannot write cache to %s: %s", self._directory, exc)
+            return
+
+        try:
+            with os.fdopen(fd, "wb") as stream:
+                pickle.dump((key, value), stream, pickle.HIGHEST_PROTOCOL)
+            os.replace(tmppath, self._path(key))
+        except BaseException as exc:
+            try:
+                os.unlink(tmppath)
+            except OSError:
+                pass
+            # Pickling fails with various errors, e.g. TypeError for objects
+            # that cannot be pickled, or RecursionError for deep values.
+            if not isinstance(exc, Exception):
+                raise
+            LOG.warning("[openapi] cannot write cache to %s: %s", self._directory, exc)
@@ -0,0 +1,162 @@
+"""Store of external documents referred by OpenAPI specs.
+
+Specs may be split into many files that refer to each other. Instead of
+fetching and parsing them one by one while references are being resolved,
+the documents a spec refers to, directly or not, are prefetched in parallel
+beforehand. Parsed documents are kept in memory and on disk, so documents
+shared by multiple specs, or left untouched between builds, are parsed once.
+"""
+
+import collections
+import concurrent.futures
+import os
+import pickle
+import threading
+from urllib import parse, request
+
+from . import _cache
+
+
+# A loaded document. The path is the one of a local file the document has
+# been read from, if any, and the digest is the one of its contents.
+Document = collections.namedtuple("Document", ["path", "digest", "value"])
+
+# Only documents served via these schemes are loaded by the store.
+SCHEMES = ("file", "http", "https")
+
+
+def _read(path):
+    with open(path, "rb") as stream:
+        return stream.read()
+
+
+def _fetch(url):
+    with request.urlopen(url) as response:
+        return response.read()
+
+
+def _external_refs(node, base_url):
+    """Yield URLs of external documents a given node refers to."""
+
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, dict):
+            ref = node.get("$ref")
+            if isinstance(ref, str):
+                url, _ = parse.urldefrag(parse.urljoin(base_url, ref))
+                if url and url != base_url:
+                    yield url
+            stack.extend(node.values())
+        elif isinstance(node, list):
+            stack.extend(node)
+
+
+class DocumentStore:
+    """Load external documents, sharing parsed ones between specs.
+
+    Documents are parsed by ``parser`` callable that accepts raw bytes.
+    Parsed documents are cached in memory by digests of their contents, so a
+    document is not parsed again unless it has been changed, and the cache
+    is shared no matter which spec and how refers to a document. On disk,
+    they are cached by their URLs, so there's one entry per document. Callers get their own
+    copies of documents, since resolving references modifies them.
+
+    Documents served via HTTP(S) are read from a local ``mirror`` directory
+    if it has them, e.g. ``https://example.com/specs/pet.yml`` is read from
+    ``example.com/specs/pet.yml`` within the directory.
+    """
+
+    def __init__(self, parser, version, limit=None, mirror=None, max_workers=None):
+        self._parser = parser
+        self._version = version
+        self._parsed = _cache.MemoryCache(limit)
+        self._lock = threading.Lock()
+        self._max_workers = max_workers
+        self.mirror = mirror
+
+    def resize(self, limit):
+        with self._lock:
+            self._parsed.resize(limit)
+
+    def _mirrored(self, url):
+        scheme, netloc, path, _, _ = parse.urlsplit(url)
+        if scheme not in ("http", "https") or self.mirror is None:
+            return None
+
+        path = os.path.join(
+            self.mirror, netloc, *parse.unquote(path).lstrip("/").split("/")
+        )
+        return path if os.path.isfile(path) else None
+
+    def _parsed_value(self, url, data, cache):
+        digest = _cache.digest(data)
+        key = ("document", self._version, digest)
+
+        with self._lock:
+            blob = self._parsed.get(key)
+
+        if blob is None:
+            # On disk, a document is stored under its URL, so the entry is
+            # replaced once the document is changed, rather than left behind.
+            disk_key = ("document", self._version, url)
+            if cache is not None:
+                stored_digest, blob = cache.get(disk_key) or (None, None)
+                if stored_digest != digest:
+                    blob = None
+            if blob is None:
+                blob = pickle.dumps(self._parser(data), pickle.HIGHEST_PROTOCOL)
+                if cache is not None:
+                    cache.set(disk_key, (digest, blob))
+
+            with self._lock:
+                self._parsed.set(key, blob, len(blob))
+        return digest, pickle.loads(blob)
+
+    def load(self, url, cache=None):
+        """Load a document from a given URL.
+
+        Parsed documents are looked up in a given disk cache too, if any.
+        """
+        path = self._mirrored(url)
+        if path is None and parse.urlsplit(url).scheme == "file":
+            path = request.url2pathname(parse.urlsplit(url).path)
+
+        data = _fetch(url) if path is None else _read(path)
+        digest, value = self._parsed_value(url, data, cache)
+        return Document(path, digest, value)
+
+    def prefetch(self, document, url, cache=None):
+        """Load documents a given document refers to, directly or not.
+
+        Documents are loaded in parallel. Returns a mapping of URLs to
+        documents, or to exceptions raised while loading them. Failures
+        are not raised right away, as some references may be never used.
+        """
+        loaded = {}
+        pending = {}
+
+        def _submit(node, base_url):
+            for ref_url in _external_refs(node, base_url):
+                if ref_url in loaded or ref_url == url:
+                    continue
+                if parse.urlsplit(ref_url).scheme not in SCHEMES:
+                    continue
+                loaded[ref_url] = None
+                pending[executor.submit(self.load, ref_url, cache)] = ref_url
+
+        with concurrent.futures.ThreadPoolExecutor(self._max_workers) as executor:
+            _submit(document, url)
+            while pending:
+                done, _ = concurrent.futures.wait(
+                    pending, return_when=concurrent.futures.FIRST_COMPLETED
+                )
+                for future in done:
+                    ref_url = pending.pop(future)
+                    try:
+                        loaded[ref_url] = future.result()
+                    except Exception as exc:
+                        loaded[ref_url] = exc
+                    else:
+                        _submit(loaded[ref_url].value, ref_url)
+        return loaded
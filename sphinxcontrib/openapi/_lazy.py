@@ -0,0 +1,263 @@
+"""Lazy loading of OpenAPI specs.
+
+Huge specs are expensive to load even if only a handful of endpoints are
+about to be rendered. This module allows to scan a spec once in order to
+find out where its path items and components are located within the spec
+source, and then load only the ones required to render selected paths.
+"""
+
+import collections
+import json
+import re
+import sys
+from urllib import parse
+
+import yaml
+
+from . import _cache
+
+
+# Top-level collections to index, and the depth of indexing. For instance,
+# 'components' contains sections (e.g. 'schemas'), and only then entries.
+_INDEXED = {
+    "paths": 1,
+    "components": 2,
+    # OpenAPI 2.0 (f.k.a. Swagger)
+    "definitions": 1,
+    "parameters": 1,
+    "responses": 1,
+}
+
+_JSON_WHITESPACE = re.compile(r"[ \t\n\r]*")
+
+
+# A location of a node within spec source, and the index of its children if
+# the node is an indexed collection.
+_Node = collections.namedtuple("_Node", ["start", "end", "column", "children"])
+
+
+def _index_yaml(text, loader):
+    events = yaml.parse(text, Loader=loader)
+
+    def _next():
+        event = next(events)
+        # Anchors and aliases may cross node boundaries, so nodes cannot be
+        # loaded separately if they are used.
+        if isinstance(event, yaml.AliasEvent) or getattr(event, "anchor", None):
+            raise ValueError("YAML anchors and aliases cannot be indexed")
+        return event
+
+    def _skip(event):
+        if isinstance(event, (yaml.MappingStartEvent, yaml.SequenceStartEvent)):
+            depth = 1
+            while depth:
+                event = _next()
+                if isinstance(event, yaml.CollectionStartEvent):
+                    depth += 1
+                elif isinstance(event, yaml.CollectionEndEvent):
+                    depth -= 1
+        return event
+
+    def _index_mapping(depths):
+        nodes = collections.OrderedDict()
+        while True:
+            event = _next()
+            if isinstance(event, yaml.MappingEndEvent):
+                return nodes, event
+            if not isinstance(event, yaml.ScalarEvent):
+                raise ValueError("only scalar keys can be indexed")
+
+            key = event.value
+            start = _next()
+            depth = depths.get(key, 0) if isinstance(depths, dict) else depths
+            if depth and isinstance(start, yaml.MappingStartEvent):
+                children, end = _index_mapping(depth - 1)
+            else:
+                children, end = None, _skip(start)
+
+            nodes[key] = _Node(
+                start.start_mark.index,
+                end.end_mark.index,
+                start.start_mark.column,
+                children,
+            )
+
+    for event in events:
+        if isinstance(event, yaml.MappingStartEvent):
+            nodes, _ = _index_mapping(_INDEXED)
+            return nodes
+        if isinstance(event, yaml.CollectionStartEvent):
+            break
+    raise ValueError("spec must be a mapping")
+
+
+def _index_json(text, decoder):
+    def _skip_whitespace(idx):
+        return _JSON_WHITESPACE.match(text, idx).end()
+
+    def _expect(idx, char):
+        if not text.startswith(char, idx):
+            raise ValueError("expecting '%s' at char %d" % (char, idx))
+        return _skip_whitespace(idx + 1)
+
+    def _index_object(idx, depths):
+        nodes = collections.OrderedDict()
+        idx = _expect(idx, "{")
+        if text.startswith("}", idx):
+            return nodes, idx + 1
+
+        while True:
+            if not text.startswith('"', idx):
+                raise ValueError("expecting property name at char %d" % idx)
+            key, idx = json.decoder.scanstring(text, idx + 1)
+            idx = _expect(_skip_whitespace(idx), ":")
+
+            start = idx
+            depth = depths.get(key, 0) if isinstance(depths, dict) else depths
+            if depth and text.startswith("{", idx):
+                children, idx = _index_object(idx, depth - 1)
+            else:
+                # The value is decoded and thrown away right away, so only
+                # one value at a time is kept in memory.
+                children, (_, idx) = None, decoder.raw_decode(text, idx)
+            nodes[key] = _Node(start, idx, 0, children)
+
+            idx = _skip_whitespace(idx)
+            if text.startswith("}", idx):
+                return nodes, idx + 1
+            idx = _expect(idx, ",")
+
+    nodes, _ = _index_object(_skip_whitespace(0), _INDEXED)
+    return nodes
+
+
+class SpecIndex:
+    """Index of nodes of an OpenAPI spec within its source.
+
+    The index is built by a streaming scan that keeps nothing but locations
+    of top-level entries, path items and components. These nodes may then
+    be loaded on demand. Raises :exc:`ValueError` if the spec cannot be
+    indexed, in which case it must be loaded as a whole.
+    """
+
+    def __init__(self, text, yaml_loader, json_decoder):
+        self._text = text
+        self._yaml_loader = yaml_loader
+        self._json_decoder = json_decoder
+
+        nodes = None
+        if text.lstrip().startswith("{"):
+            try:
+                nodes = _index_json(text, json_decoder)
+                self._load_node = self._load_json_node
+            except ValueError:
+                pass
+
+        if nodes is None:
+            try:
+                nodes = _index_yaml(text, yaml_loader)
+            except yaml.YAMLError as exc:
+                raise ValueError(str(exc))
+            self._load_node = self._load_yaml_node
+
+        if not isinstance(nodes.get("paths"), _Node):
+            raise ValueError("spec has no paths")
+        self._nodes = nodes
+
+    def __sizeof__(self):
+        return (
+            object.__sizeof__(self)
+            + sys.getsizeof(self._text)
+            + _cache.sizeof(self._nodes)
+        )
+
+    @property
+    def paths(self):
+        """Paths defined in the spec, in the order they are defined."""
+        return list(self._nodes["paths"].children or ())
+
+    def _load_json_node(self, node):
+        value, _ = self._json_decoder.raw_decode(self._text, node.start)
+        return value
+
+    def _load_yaml_node(self, node):
+        # Nested block nodes are indented, and they must remain indented the
+        # same way in order to be parsed properly.
+        start, end = node.start, node.end
+        source = " " * node.column + self._text[start:end]
+        return yaml.load(source, self._yaml_loader)
+
+    def _locate(self, pointer):
+        """Return the indexed node that holds a given JSON pointer."""
+
+        location = ()
+        nodes = self._nodes
+        for token in pointer:
+            if nodes is None or token not in nodes:
+                break
+            location += (token,)
+            nodes = nodes[token].children
+        return location
+
+    def materialize(self, paths):
+        """Load a spec with given paths only.
+
+        Components are loaded only if they are referred, directly or not,
+        by the path items loaded. Paths that are not defined in the spec
+        are ignored.
+        """
+
+        loaded = {}
+        defined = self._nodes["paths"].children or {}
+        pending = [("paths", path) for path in paths if path in defined]
+        pending.extend(
+            (key,) for key, node in self._nodes.items() if node.children is None
+        )
+
+        while pending:
+            location = pending.pop()
+            if not location or location in loaded:
+                continue
+
+            node = self._nodes[location[0]]
+            for token in location[1:]:
+                node = node.children[token]
+
+            # Indexed collections are referred as a whole rarely, yet if it
+            # happens, load their entries one by one.
+            if node.children is not None:
+                pending.extend(location + (key,) for key in node.children)
+                continue
+
+            value = loaded[location] = self._load_node(node)
+            for ref in _local_refs(value):
+                pending.append(self._locate(ref))
+
+        return self._assemble(self._nodes, (), loaded)
+
+    def _assemble(self, nodes, location, loaded):
+        spec = collections.OrderedDict()
+        for key, node in nodes.items():
+            if location + (key,) in loaded:
+                spec[key] = loaded[location + (key,)]
+            elif node.children is not None:
+                spec[key] = self._assemble(node.children, location + (key,), loaded)
+        return spec
+
+
+def _local_refs(node):
+    """Yield JSON pointers of local references found in a given node."""
+
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, dict):
+            ref = node.get("$ref")
+            if isinstance(ref, str) and ref.startswith("#/"):
+                yield [
+                    parse.unquote(token).replace("~1", "/").replace("~0", "~")
+                    for token in ref[2:].split("/")
+                ]
+            stack.extend(node.values())
+        elif isinstance(node, list):
+            stack.extend(node)
@@ -0,0 +1,220 @@
+"""Markup of operations shared by OpenAPI 2.0 and 3.0 renderers.
+
+Operations are described by a handful of blocks, such as fields and code
+blocks, that are turned into httpdomain markup by :func:`to_lines`, or into
+nodes by renderers that build them directly. Operations of both versions are
+described by the same blocks, and differ in a few sections only, such as
+request bodies. The sections that differ are rendered by subclasses of
+:class:`OperationMarkup`.
+"""
+
+import abc
+import collections
+
+
+INDENT = "   "
+
+# A header of a group of operations.
+Header = collections.namedtuple("Header", ["title"])
+
+# An operation, rendered into an httpdomain directive with a given content.
+Resource = collections.namedtuple("Resource", ["method", "path", "synopsis", "blocks"])
+
+# Lines of text to be emphasized, e.g. a summary of an operation.
+Strong = collections.namedtuple("Strong", ["lines"])
+
+# Lines of free-form text, e.g. a description of an operation.
+Text = collections.namedtuple("Text", ["lines"])
+
+# A field whose body consists of lines of text followed by code blocks.
+Field = collections.namedtuple("Field", ["name", "lines", "blocks"])
+
+# Fields, along with one-line texts, that are separated from others.
+InlineFields = collections.namedtuple("InlineFields", ["fields"])
+
+# Lines of code in a given language, preceded by a title.
+Code = collections.namedtuple("Code", ["title", "language", "lines"])
+
+# An admonition operations are nested into, e.g. callbacks.
+Admonition = collections.namedtuple("Admonition", ["title", "resources"])
+
+
+def _indented(lines, indent):
+    for line in lines:
+        yield indent + line if line else ""
+
+
+def _block_lines(block, indent):
+    if isinstance(block, Strong):
+        yield from _indented(["**%s**" % line for line in block.lines], indent)
+        yield ""
+
+    elif isinstance(block, Text):
+        yield from _indented(block.lines, indent)
+        yield ""
+
+    elif isinstance(block, Field):
+        yield "%s:%s:" % (indent, block.name)
+        yield from _indented(block.lines, indent + INDENT)
+        for code in block.blocks:
+            yield from _block_lines(code, indent + INDENT)
+
+    elif isinstance(block, InlineFields):
+        yield ""
+        for name, text in block.fields:
+            yield "%s:%s:%s" % (indent, name, " " + text if text else "")
+        yield ""
+
+    elif isinstance(block, Code):
+        yield ""
+        yield "%s**%s:**" % (indent, block.title)
+        yield ""
+        yield "%s.. sourcecode:: %s" % (indent, block.language)
+        yield ""
+        yield from _indented(block.lines, indent + INDENT)
+        if not block.lines or block.lines[-1]:
+            yield ""
+
+    elif isinstance(block, Admonition):
+        yield ""
+        yield "%s.. admonition:: %s" % (indent, block.title)
+        yield ""
+        for resource in block.resources:
+            yield from _resource_lines(resource, indent + INDENT)
+
+    else:
+        raise ValueError("Unknown block (%r)" % (block,))
+
+
+def _resource_lines(resource, pad):
+    yield "%s.. http:%s:: %s" % (pad, resource.method, resource.path)
+    yield "%s   :synopsis: %s" % (pad, resource.synopsis)
+    yield ""
+    for block in resource.blocks:
+        yield from _block_lines(block, pad + INDENT)
+    yield ""
+
+
+def to_lines(item):
+    """Return lines of markup of a given header or resource."""
+    if isinstance(item, Header):
+        return [item.title, "=" * len(item.title), ""]
+    return list(_resource_lines(item, ""))
+
+
+class Buckets:
+    """Responses of an operation bucketed by sections they are rendered in.
+
+    Subclasses may collect whatever they need along the way too, e.g.
+    examples of query parameters to be put in a request example.
+    """
+
+    def __init__(self, operation):
+        self.responses = []
+        self.headers = []
+        self.successful = []
+        self.query_examples = []
+
+        for response in operation.responses:
+            self.responses.append(response)
+            self.headers.extend(response.headers)
+            if is_2xx_response(response.status):
+                self.successful.append(response)
+
+
+def is_2xx_response(status):
+    try:
+        status = int(status)
+        return 200 <= status < 300
+    except ValueError:
+        pass
+    return False
+
+
+class OperationMarkup(metaclass=abc.ABCMeta):
+    """Render operations into blocks of httpdomain markup, section by section.
+
+    Operations nested into others (i.e. callbacks) are rendered into
+    resources of their own, that end up in blocks of the outer ones.
+    """
+
+    def __init__(self, convert):
+        self.convert = convert
+
+    def render(self, operation):
+        """Return a resource describing a given operation."""
+        buckets = Buckets(operation)
+        blocks = []
+
+        if operation.summary is not None:
+            blocks.append(Strong(operation.summary.splitlines()))
+
+        if operation.description is not None:
+            blocks.append(Text(self.text(operation.description)))
+
+        for param in operation.parameters_in("path"):
+            name = "param %s %s" % (self.param_type(param), param.name)
+            blocks.append(Field(name, self.text(param.description), ()))
+
+        for param in operation.parameters_in("query"):
+            name = "query %s %s" % (self.param_type(param), param.name)
+            lines = self.text(param.description)
+            lines.extend(self.render_query_param(operation, param, buckets))
+            blocks.append(Field(name, lines, ()))
+
+        blocks.extend(self.render_request(operation, buckets))
+
+        for response in self.order_responses(buckets.responses):
+            blocks.append(
+                Field(
+                    "status %s" % response.status,
+                    self.text(response.description),
+                    self.render_response(response),
+                )
+            )
+
+        for param in operation.parameters_in("header"):
+            lines = self.text(param.description)
+            lines.extend(self.render_request_header(param))
+            blocks.append(Field("reqheader %s" % param.name, lines, ()))
+
+        for name, header in buckets.headers:
+            lines = self.text(header["description"])
+            blocks.append(Field("resheader %s" % name, lines, ()))
+
+        blocks.extend(self.render_trailer(operation, buckets))
+
+        synopsis = "null" if operation.summary is None else operation.summary
+        return Resource(operation.method, operation.path, synopsis, blocks)
+
+    def text(self, text):
+        """Return lines of a given text converted into reStructuredText."""
+        return self.convert(text).splitlines()
+
+    @abc.abstractmethod
+    def param_type(self, param):
+        """Return a type of a given parameter to be rendered."""
+
+    def order_responses(self, responses):
+        """Return responses in the order their statuses are rendered in."""
+        return responses
+
+    def render_query_param(self, operation, param, buckets):
+        """Return lines that follow a description of a query parameter."""
+        return []
+
+    def render_request(self, operation, buckets):
+        """Return blocks describing a request, once parameters are rendered."""
+        return []
+
+    def render_response(self, response):
+        """Return blocks that follow a description of a response."""
+        return []
+
+    def render_request_header(self, param):
+        """Return lines that follow a description of a request header."""
+        return []
+
+    def render_trailer(self, operation, buckets):
+        """Return blocks that follow the rest of sections."""
+        return []
@@ -0,0 +1,342 @@
+"""Compact internal model of OpenAPI operations.
+
+Normalized specs are nested dictionaries, and renderers used to look up the
+same keys in them over and over again. Operations are converted into the
+immutable objects below instead, once per spec, so renderers access plain
+attributes and find parameters already grouped by their location.
+
+Schemas, examples and other free-form nodes are not converted and are kept
+as they are in the spec.
+"""
+
+import collections
+import sys
+import types
+
+from . import utils
+
+
+# Marks attributes that are not defined in the spec, for cases when ``None``
+# is a legit value (e.g. ``example: null``).
+MISSING = object()
+
+_EMPTY = types.MappingProxyType({})
+
+
+class _Model:
+    __slots__ = ()
+    # Attributes holding tuples and objects the model is built of.
+    _owned = ()
+
+    def __init__(self, **attributes):
+        for name in self.__slots__:
+            object.__setattr__(self, name, attributes.pop(name))
+        if attributes:
+            raise TypeError("unexpected attributes: %s" % ", ".join(attributes))
+
+    def __setattr__(self, name, value):
+        raise AttributeError("'%s' object is immutable" % type(self).__name__)
+
+    def __delattr__(self, name):
+        raise AttributeError("'%s' object is immutable" % type(self).__name__)
+
+    def __sizeof__(self):
+        # Schemas, texts and other nodes are shared with the spec, so only
+        # tuples and objects the model is built of are counted.
+        return object.__sizeof__(self) + sum(
+            _owned_size(getattr(self, name)) for name in self._owned
+        )
+
+    def replace(self, **attributes):
+        """Return a copy of the object with given attributes replaced."""
+        for name in self.__slots__:
+            attributes.setdefault(name, getattr(self, name))
+        return type(self)(**attributes)
+
+    def __repr__(self):
+        return "<%s %s>" % (
+            type(self).__name__,
+            " ".join("%s=%r" % (name, getattr(self, name)) for name in self.__slots__),
+        )
+
+
+def _owned_size(value):
+    if isinstance(value, _Model):
+        return sys.getsizeof(value)
+    if isinstance(value, tuple):
+        return sys.getsizeof(value) + sum(_owned_size(item) for item in value)
+    if isinstance(value, types.MappingProxyType) and value is not _EMPTY:
+        return sys.getsizeof(value) + sum(_owned_size(item) for item in value.values())
+    return 0
+
+
+class MediaType(_Model):
+    """A media type of a request or response body."""
+
+    __slots__ = ("content_type", "schema", "example", "examples")
+
+    @classmethod
+    def from_spec(cls, content_type, media_type):
+        return cls(
+            content_type=content_type,
+            schema=media_type.get("schema"),
+            example=media_type.get("example"),
+            examples=media_type.get("examples"),
+        )
+
+
+class Parameter(_Model):
+    """An operation parameter."""
+
+    __slots__ = (
+        "name",
+        "location",
+        "description",
+        "required",
+        # OpenAPI 2.0 (f.k.a. Swagger) defines types of non-body parameters
+        # in place, while OpenAPI 3.x always defines them via schema.
+        "type",
+        "schema",
+        "example",
+        "explode",
+    )
+
+    @classmethod
+    def from_spec(cls, parameter):
+        return cls(
+            name=parameter["name"],
+            location=parameter["in"],
+            description=parameter.get("description", ""),
+            required=parameter.get("required", False),
+            type=parameter.get("type"),
+            schema=parameter.get("schema"),
+            example=parameter.get("example", MISSING),
+            explode=parameter.get("explode", False),
+        )
+
+
+class Response(_Model):
+    """A response of an operation."""
+
+    __slots__ = ("status", "description", "headers", "content", "schema")
+    _owned = ("headers", "content")
+
+    @classmethod
+    def from_spec(cls, status, response):
+        return cls(
+            status=status,
+            description=response["description"],
+            headers=tuple(response.get("headers", _EMPTY).items()),
+            content=tuple(
+                MediaType.from_spec(content_type, media_type)
+                for content_type, media_type in response.get("content", _EMPTY).items()
+                # OpenAPI 2.0 has no 'content', so whatever is there is not
+                # necessarily a valid media type object.
+                if isinstance(media_type, dict)
+            ),
+            # OpenAPI 2.0 (f.k.a. Swagger)
+            schema=response.get("schema"),
+        )
+
+
+class Operation(_Model):
+    """An HTTP operation, i.e. an endpoint's method."""
+
+    __slots__ = (
+        "path",
+        "method",
+        "summary",
+        "description",
+        "tags",
+        "operation_id",
+        "parameters",
+        "request_body",
+        "responses",
+        "callbacks",
+    )
+    _owned = ("tags", "parameters", "request_body", "responses", "callbacks")
+
+    @classmethod
+    def from_spec(cls, path, method, operation):
+        parameters = collections.OrderedDict()
+        for parameter in operation.get("parameters", ()):
+            parameter = Parameter.from_spec(parameter)
+            parameters.setdefault(parameter.location, []).append(parameter)
+
+        return cls(
+            path=path,
+            method=method,
+            summary=operation.get("summary"),
+            description=operation.get("description"),
+            tags=tuple(operation.get("tags", ())),
+            operation_id=operation.get("operationId"),
+            parameters=types.MappingProxyType(
+                {location: tuple(bucket) for location, bucket in parameters.items()}
+            ),
+            request_body=tuple(
+                MediaType.from_spec(content_type, media_type)
+                for content_type, media_type in operation.get("requestBody", _EMPTY)
+                .get("content", _EMPTY)
+                .items()
+            ),
+            responses=tuple(
+                Response.from_spec(status, response)
+                for status, response in operation["responses"].items()
+            ),
+            callbacks=tuple(
+                (
+                    name,
+                    tuple(
+                        cls.from_spec(cb_path, cb_method, cb_operation)
+                        for cb_path, cb_path_item in callback.items()
+                        for cb_method, cb_operation in cb_path_item.items()
+                    ),
+                )
+                for name, callback in operation.get("callbacks", _EMPTY).items()
+            ),
+        )
+
+    def parameters_in(self, location):
+        """Return parameters of a given location (e.g. ``query``)."""
+        return self.parameters.get(location, ())
+
+
+def _build_operations(spec, path):
+    return collections.OrderedDict(
+        (method, Operation.from_spec(path, method, operation))
+        for method, operation in spec["paths"][path].items()
+    )
+
+
+def get_operations(spec, path):
+    """Return operations of a given path, keyed by HTTP method.
+
+    Operations are built once per normalized spec and path, and are shared
+    by all the renderers that use the spec.
+    """
+    return spec.derive(("operations", path), _build_operations, path)
+
+
+def _build_tag_index(spec):
+    index = collections.OrderedDict()
+    position = 0
+    for path in spec["paths"]:
+        for operation in get_operations(spec, path).values():
+            for tag in collections.OrderedDict.fromkeys(operation.tags):
+                index.setdefault(tag, []).append((position, operation))
+            position += 1
+    return collections.OrderedDict(
+        (tag, tuple(tagged)) for tag, tagged in index.items()
+    )
+
+
+def get_tag_index(spec):
+    """Return operations of a given spec keyed by tags.
+
+    Operations are listed under each of their tags, along with their
+    positions within the spec. The index is built once per normalized spec.
+    """
+    return spec.derive("tags", _build_tag_index)
+
+
+def _get_tagged_operations(spec, tags):
+    index = get_tag_index(spec)
+    declared = {tag["name"] for tag in spec.get("tags", ())}
+    undefined = [tag for tag in tags if tag not in index and tag not in declared]
+    if undefined:
+        raise ValueError(
+            "One or more tags are not defined in the spec: %s." % ", ".join(undefined)
+        )
+
+    tagged = dict(entry for tag in tags for entry in index.get(tag, ()))
+    return [tagged[position] for position in sorted(tagged)]
+
+
+def _build_operation_id_index(spec):
+    index = {}
+    for path, path_item in spec["paths"].items():
+        for method, operation in path_item.items():
+            # Operation IDs must be unique, yet if they are not, the first
+            # operation wins.
+            index.setdefault(operation.get("operationId"), (path, method))
+    index.pop(None, None)
+    return index
+
+
+def get_operation_id_index(spec):
+    """Return paths and methods of operations of a given spec keyed by IDs.
+
+    The index is built once per normalized spec, so an operation is found
+    by its ID without building the rest of operations.
+    """
+    return spec.derive("operation-ids", _build_operation_id_index)
+
+
+def _get_identified_operations(spec, operation_ids):
+    index = get_operation_id_index(spec)
+    undefined = [op_id for op_id in operation_ids if op_id not in index]
+    if undefined:
+        raise ValueError(
+            "One or more operation IDs are not defined in the spec: %s."
+            % ", ".join(undefined)
+        )
+
+    return [
+        get_operations(spec, path)[method]
+        for path, method in collections.OrderedDict.fromkeys(
+            index[op_id] for op_id in operation_ids
+        )
+    ]
+
+
+def select_operations(spec, options):
+    """Return operations to be rendered according to given options.
+
+    Operations are built once per normalized spec and path, and they're
+    picked out of indexes, if options allow, so there's no need to go
+    through all the paths.
+    """
+    # Operations picked via indexes, if any.
+    indexed = None
+    if "operation-ids" in options:
+        indexed = _get_identified_operations(spec, options["operation-ids"])
+    if "tags" in options:
+        tagged = _get_tagged_operations(spec, options["tags"])
+        if indexed is None:
+            indexed = tagged
+        else:
+            tagged = set(map(id, tagged))
+            indexed = [op for op in indexed if id(op) in tagged]
+
+    if indexed is not None and "paths" not in options and "include" not in options:
+        # Operations are taken right from the indexes, so there's no need to
+        # go through all the paths.
+        exclude = utils._compile_patterns(tuple(options.get("exclude", ())))
+        operations = [op for op in indexed if not utils._matches_any(exclude, op.path)]
+    else:
+        operations = [
+            operation
+            for path in utils._select_paths(
+                spec["paths"], options, utils._get_path_trie(spec)
+            )
+            for operation in get_operations(spec, path).values()
+        ]
+        if indexed is not None:
+            indexed = set(map(id, indexed))
+            operations = [op for op in operations if id(op) in indexed]
+
+    methods = options.get("methods")
+    return tuple(op for op in operations if not methods or op.method in methods)
+
+
+def group_operations(spec, options):
+    """Return operations to be rendered grouped by their first tags.
+
+    Operations without tags are grouped under an empty tag.
+    """
+    # Tags declared on the spec level come first, in the order they are
+    # declared, even if none of the selected operations uses them.
+    groups = collections.OrderedDict((tag["name"], []) for tag in spec.get("tags", ()))
+    for operation in select_operations(spec, options):
+        groups.setdefault((operation.tags or ("",))[0], []).append(operation)
+    return collections.OrderedDict((tag, tuple(group)) for tag, group in groups.items())
@@ -0,0 +1,150 @@
+"""Cache of markup rendered for individual operations.
+
+Markup of an operation depends on nothing but the operation itself, once
+references in it are resolved, and on rendering options. So it's cached
+under a digest of the operation's content, and unchanged operations of a
+changed spec, or ones rendered by several directives, are not rendered
+again. Neither the spec an operation comes from nor its path are a part of
+the digest, so identical operations of different specs (e.g. of different
+API versions) are rendered once as well. Doctrees are not cached, since
+httpdomain directives register objects with the domain and the document as
+they are parsed.
+"""
+
+import json
+
+from . import _cache, _model, _upconvert
+
+
+# The version of rendering routines. It must be bumped each time they are
+# changed in a way that affects the result, so previously cached markup is
+# not used anymore.
+_RENDER_VERSION = 4
+
+# Operations are rendered with this path, which is replaced with their own
+# path afterwards. It's not a valid path, so it's not found anywhere else.
+_PATH = "\x00path\x00"
+
+# Options that affect the markup of each operation.
+_RENDER_OPTIONS = ("examples", "request", "format", "schema-depth")
+
+
+def _digest(node):
+    # Serializing via JSON encoder is implemented in C, and is way faster
+    # than walking the tree in Python. Nodes shared by many operations, such
+    # as schemas, are serialized each time though, and values that are not
+    # JSON serializable (e.g. dates in YAML specs) are serialized via repr.
+    data = json.dumps(node, check_circular=False, default=repr)
+    return _cache.digest(data.encode("utf-8"))
+
+
+def _build_operation_digests(spec):
+    return {}
+
+
+def _operation_digest(spec, operation):
+    # Documents are checked for changes by digests of operations they
+    # render, so each operation is digested once per spec.
+    digests = spec.derive("operation-digests", _build_operation_digests)
+    key = (operation.path, operation.method)
+    try:
+        return digests[key]
+    except KeyError:
+        digest = digests[key] = _digest(spec["paths"][operation.path][operation.method])
+        return digest
+
+
+def operation_key(spec, operation, options):
+    """Return a cache key of markup of a given operation.
+
+    The key is made of the content of the operation, including objects it
+    refers to, and of the options that affect its markup. The operation's
+    path is not a part of the key.
+    """
+    return (
+        "rendered",
+        _RENDER_VERSION,
+        # Specs converted from OpenAPI 2.0 keep their original version, since
+        # their operations are rendered differently.
+        spec.get("swagger", spec.get("openapi", "2.0")).split(".")[0],
+        operation.method,
+        tuple((name, options[name]) for name in _RENDER_OPTIONS if name in options),
+        _operation_digest(spec, operation),
+    )
+
+
+def slice_digest(spec, options):
+    """Return a digest of operations rendered out of a spec with given options.
+
+    Markup rendered out of the spec depends on nothing else, so it's the
+    same as long as the digest is.
+    """
+    # OpenAPI 2.0 specs are rendered once converted, and the conversion
+    # depends on the spec as a whole, e.g. on media types it declares.
+    spec = _upconvert.get_openapi3(spec)
+    if "group" in options:
+        groups = _model.group_operations(spec, options).items()
+    else:
+        groups = [(None, _model.select_operations(spec, options))]
+
+    tokens = []
+    for tag, operations in groups:
+        tokens.append(repr(tag))
+        tokens.extend(
+            repr((op.path, operation_key(spec, op, options))) for op in operations
+        )
+    return _cache.digest("\n".join(tokens).encode("utf-8"))
+
+
+class RenderCache:
+    """Markup of operations, kept in memory and optionally on disk.
+
+    The in-memory cache is bounded by the total size of markup, while the
+    disk one, if any, is expected to be shared by Sphinx processes.
+    """
+
+    def __init__(self, limit=None):
+        self._memory = _cache.MemoryCache(limit)
+        self.disk = None
+
+    def resize(self, limit):
+        self._memory.resize(limit)
+
+    def lines(self, spec, operation, options, render):
+        """Return lines of markup of a given operation.
+
+        The ``render`` callable is called with the operation to produce the
+        markup if it's not cached yet.
+        """
+        key = operation_key(spec, operation, options)
+        entry = self._memory.get(key)
+        if entry is None and self.disk is not None:
+            entry = self.disk.get(key)
+            if entry is not None:
+                self._memory.set(key, entry, _cache.sizeof(entry))
+        if entry is None:
+            lines = tuple(render(operation.replace(path=_PATH)))
+            # Indexes of lines with the path, so it's put in place quickly.
+            entry = (lines, tuple(i for i, line in enumerate(lines) if _PATH in line))
+            if self.disk is not None:
+                self.disk.set(key, entry)
+            self._memory.set(key, entry, _cache.sizeof(entry))
+
+        lines, with_path = entry
+        if not with_path:
+            return lines
+
+        lines = list(lines)
+        for index in with_path:
+            lines[index] = lines[index].replace(_PATH, operation.path)
+        return lines
+
+
+def render_operation(cache, spec, operation, options, render):
+    """Return lines of markup of a given operation, rendered by ``render``.
+
+    The markup is looked up in a given cache first, if any.
+    """
+    if cache is None:
+        return render(operation)
+    return cache.lines(spec, operation, options, render)
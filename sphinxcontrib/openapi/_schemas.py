@@ -0,0 +1,96 @@
+"""Composed schemas as they are rendered.
+
+Schemas composed via ``allOf`` are rendered merged, and only the first
+alternative of ``oneOf`` and ``anyOf`` ones is rendered. Composed schemas
+are usually shared by many operations, so they are composed once per spec
+rather than each time they are rendered.
+"""
+
+import collections.abc
+import copy
+
+
+def _dict_merge(dct, merge_dct):
+    """Recursive dict merge.
+
+    Inspired by :meth:``dict.update()``, instead of updating only top-level
+    keys, dict_merge recurses down into dicts nested to an arbitrary depth,
+    updating keys. The ``merge_dct`` is merged into ``dct``. Values of
+    ``merge_dct`` are copied, so they are not modified by merges that follow.
+
+    From https://gist.github.com/angstwad/bf22d1822c38a92ec0a9
+
+    Arguments:
+        dct: dict onto which the merge is executed
+        merge_dct: dct merged into dct
+    """
+    for k, v in merge_dct.items():
+        if (
+            k in dct
+            and isinstance(dct[k], dict)
+            and isinstance(merge_dct[k], collections.abc.Mapping)
+        ):
+            _dict_merge(dct[k], merge_dct[k])
+        else:
+            dct[k] = copy.deepcopy(merge_dct[k])
+
+
+class Schemas:
+    """Cache of composed schemas, keyed by identity of composing ones.
+
+    Composed schemas are shared by all their users, so they must not be
+    modified. Merged ``allOf`` schemas are passed to ``account`` callable,
+    if any, since the cache holds them.
+    """
+
+    def __init__(self, account=None):
+        self._composed = {}
+        self._account = account
+
+    def compose(self, schema):
+        """Apply composition keywords of a given schema, if any.
+
+        Only the outermost keyword is applied, so the result may be a
+        composing schema too. The schema itself is returned if it's not
+        composing.
+        """
+        try:
+            return self._composed[id(schema)][1]
+        except KeyError:
+            pass
+
+        if "allOf" in schema:
+            composed = copy.deepcopy(schema["allOf"][0])
+            for subschema in schema["allOf"][1:]:
+                _dict_merge(composed, subschema)
+            if self._account is not None:
+                self._account(composed)
+        elif "oneOf" in schema:
+            # we only show the first one since we can't show everything
+            composed = schema["oneOf"][0]
+        elif "anyOf" in schema:
+            composed = schema["anyOf"][0]
+        else:
+            return schema
+
+        # The composing schema is kept along, so its identity is not reused
+        # by another object as long as the cache is alive.
+        self._composed[id(schema)] = (schema, composed)
+        return composed
+
+    def effective(self, schema):
+        """Return a schema with all composition keywords applied."""
+        while True:
+            composed = self.compose(schema)
+            if composed is schema:
+                return schema
+            schema = composed
+
+
+def _build_schemas(spec):
+    return Schemas(spec.account)
+
+
+def get_schemas(spec):
+    """Return the cache of composed schemas of a given normalized spec."""
+    return spec.derive("schemas", _build_schemas)
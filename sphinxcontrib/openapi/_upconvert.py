@@ -0,0 +1,229 @@
+"""Conversion of OpenAPI 2.0 (f.k.a. Swagger) specs into OpenAPI 3.0 ones.
+
+Specs of both versions are rendered by the same routines, that expect
+OpenAPI 3.0 specs. OpenAPI 2.0 specs are converted once per normalized spec,
+and only what is rendered is converted: operations and the top-level objects
+the rendering routines look up, such as tags. Schemas are rendered the same
+way in both versions, so they are not converted and are shared with the
+original spec.
+"""
+
+import collections
+
+from . import utils
+
+
+# Media types assumed when neither an operation nor the spec declares them.
+_DEFAULT_MEDIA_TYPES = ["application/json"]
+
+# Media types of request bodies made of 'formData' parameters.
+FORM_MEDIA_TYPES = ("application/x-www-form-urlencoded", "multipart/form-data")
+
+# Properties of non-body parameters and headers that describe their values,
+# which are described by schemas in OpenAPI 3.0.
+_SCHEMA_PROPERTIES = (
+    "type",
+    "format",
+    "items",
+    "default",
+    "maximum",
+    "exclusiveMaximum",
+    "minimum",
+    "exclusiveMinimum",
+    "maxLength",
+    "minLength",
+    "pattern",
+    "maxItems",
+    "minItems",
+    "uniqueItems",
+    "enum",
+    "multipleOf",
+)
+
+# Top-level objects that have no counterpart the rendering routines use.
+_OPENAPI2_ONLY = {
+    "host",
+    "basePath",
+    "schemes",
+    "consumes",
+    "produces",
+    "definitions",
+    "parameters",
+    "responses",
+    "securityDefinitions",
+}
+
+
+def is_openapi2(spec):
+    """Tell whether a given spec is an OpenAPI 2.0 one."""
+    return spec.get("openapi", spec.get("swagger", "2.0")).startswith("2.")
+
+
+def _convert_file(schema):
+    """Return a schema of a file, if it is one, as it's defined in OpenAPI 3.0."""
+    if schema.get("type") != "file":
+        return schema
+    # The schema may be shared with the original spec, so it's copied.
+    converted = collections.OrderedDict(schema)
+    converted["type"], converted["format"] = "string", "binary"
+    return converted
+
+
+def _convert_value(value):
+    """Return a parameter or a header with its value described by a schema."""
+    converted = collections.OrderedDict(
+        (key, item)
+        for key, item in value.items()
+        if key not in _SCHEMA_PROPERTIES and key != "collectionFormat"
+    )
+    converted["schema"] = collections.OrderedDict(
+        (key, value[key]) for key in _SCHEMA_PROPERTIES if key in value
+    )
+    return converted
+
+
+def _convert_parameter(parameter):
+    converted = _convert_value(parameter)
+    # Each value of a 'multi' array is passed as a parameter of its own.
+    if parameter.get("collectionFormat") == "multi":
+        converted["explode"] = True
+    return converted
+
+
+def _convert_form(parameters, consumes):
+    schema = collections.OrderedDict([("type", "object")])
+    schema["properties"] = collections.OrderedDict()
+    required = []
+    for parameter in parameters:
+        prop = _convert_file(_convert_value(parameter)["schema"])
+        if "description" in parameter:
+            prop["description"] = parameter["description"]
+        schema["properties"][parameter["name"]] = prop
+        if parameter.get("required", False):
+            required.append(parameter["name"])
+    if required:
+        schema["required"] = required
+
+    media_types = [
+        media_type for media_type in consumes if media_type in FORM_MEDIA_TYPES
+    ]
+    if not media_types:
+        files = any(parameter.get("type") == "file" for parameter in parameters)
+        media_types = [FORM_MEDIA_TYPES[1] if files else FORM_MEDIA_TYPES[0]]
+
+    return collections.OrderedDict(
+        [
+            (
+                "content",
+                collections.OrderedDict(
+                    (media_type, {"schema": schema}) for media_type in media_types
+                ),
+            )
+        ]
+    )
+
+
+def _convert_body(parameter, consumes):
+    body = collections.OrderedDict(
+        (key, parameter[key]) for key in ("description", "required") if key in parameter
+    )
+    media_type = {"schema": parameter["schema"]} if "schema" in parameter else {}
+    body["content"] = collections.OrderedDict(
+        (content_type, media_type) for content_type in consumes
+    )
+    return body
+
+
+def _convert_response(response, produces):
+    converted = collections.OrderedDict(
+        (key, value)
+        for key, value in response.items()
+        if key not in ("headers", "schema", "examples", "content")
+    )
+    if "headers" in response:
+        converted["headers"] = collections.OrderedDict(
+            (name, _convert_value(header))
+            for name, header in response["headers"].items()
+        )
+
+    content = collections.OrderedDict()
+    if response.get("schema") is not None:
+        schema = _convert_file(response["schema"])
+        for media_type in produces:
+            content[media_type] = {"schema": schema}
+    for media_type, example in response.get("examples", {}).items():
+        content.setdefault(media_type, {})["example"] = example
+    if content:
+        converted["content"] = content
+    return converted
+
+
+def _convert_operation(operation, consumes, produces):
+    consumes = operation.get("consumes", consumes) or _DEFAULT_MEDIA_TYPES
+    produces = operation.get("produces", produces) or _DEFAULT_MEDIA_TYPES
+
+    converted = collections.OrderedDict()
+    for key, value in operation.items():
+        if key in ("consumes", "produces", "schemes"):
+            continue
+        elif key == "parameters":
+            form = [parameter for parameter in value if parameter["in"] == "formData"]
+            for parameter in value:
+                if parameter["in"] == "body":
+                    converted["requestBody"] = _convert_body(parameter, consumes)
+            if form:
+                converted["requestBody"] = _convert_form(form, consumes)
+            converted["parameters"] = [
+                _convert_parameter(parameter)
+                for parameter in value
+                if parameter["in"] not in ("body", "formData")
+            ]
+        elif key == "responses":
+            converted["responses"] = collections.OrderedDict(
+                (status, _convert_response(response, produces))
+                for status, response in value.items()
+            )
+        else:
+            converted[key] = value
+    return converted
+
+
+def _build_openapi3(spec):
+    consumes = spec.get("consumes")
+    produces = spec.get("produces")
+
+    converted = utils._NormalizedSpec(
+        (key, value) for key, value in spec.items() if key not in _OPENAPI2_ONLY
+    )
+    # The original 'swagger' version is kept along, since operations of
+    # converted specs are rendered a bit differently.
+    converted["swagger"] = spec.get("swagger", "2.0")
+    converted["openapi"] = "3.0.0"
+    converted["paths"] = collections.OrderedDict(
+        (
+            path,
+            collections.OrderedDict(
+                (
+                    key,
+                    _convert_operation(value, consumes, produces)
+                    if key in utils._HTTP_METHODS
+                    else value,
+                )
+                for key, value in path_item.items()
+            ),
+        )
+        for path, path_item in spec["paths"].items()
+    )
+    return converted
+
+
+def get_openapi3(spec):
+    """Return an OpenAPI 3.0 version of a given normalized spec.
+
+    OpenAPI 2.0 specs are converted once per spec, and the conversion is
+    shared by all the renderers that use the spec. Other specs are returned
+    as they are.
+    """
+    if not is_openapi2(spec):
+        return spec
+    return spec.derive("openapi3", _build_openapi3)
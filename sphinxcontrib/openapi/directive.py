@@ -9,12 +9,29 @@
 """
 
 import collections
-import functools
+import io
+import json
+import os
+import re
+import sys
+from urllib import parse
 
 from docutils.parsers.rst import directives
+from sphinx.util import logging, parallel
 from sphinx.util.docutils import SphinxDirective
 import yaml
 
+from sphinxcontrib.openapi import _cache, _documents, _lazy, _rendered, utils
+
+
+LOG = logging.getLogger(__name__)
+
+
+# The version of both loading and normalization routines. It must be bumped
+# each time they are changed in a way that affects the result, so previously
+# cached specs are not used anymore.
+_LOADER_VERSION = 5
+
 
 # Dictionaries do not guarantee to preserve the keys order so when we load
 # JSON or YAML - we may loose the order. In most cases it's not important
@@ -31,12 +48,479 @@ _YamlOrderedLoader.add_constructor(
 )
 
 
-# Locally cache spec to speedup processing of same spec file in multiple
-# openapi directives
-@functools.lru_cache()
-def _get_spec(abspath, encoding):
-    with open(abspath, 'rt', encoding=encoding) as stream:
-        return yaml.load(stream, _YamlOrderedLoader)
+# PyYAML may be built without libyaml bindings, in which case there's no
+# C-accelerated loader and we have to stick to the pure Python one.
+if hasattr(yaml, 'CSafeLoader'):
+    class _YamlOrderedCLoader(yaml.CSafeLoader):
+        pass
+
+    _YamlOrderedCLoader.add_constructor(
+        yaml.resolver.BaseResolver.DEFAULT_MAPPING_TAG,
+        lambda loader, node: collections.OrderedDict(
+            loader.construct_pairs(node))
+    )
+else:
+    _YamlOrderedCLoader = _YamlOrderedLoader
+
+
+_YAML_RESOLVER = yaml.resolver.Resolver()
+_YAML_FLOAT_TAG = 'tag:yaml.org,2002:float'
+
+
+def _json_float(value):
+    # Historically JSON specs were loaded by YAML parser, and PyYAML follows
+    # YAML 1.1 which is way more strict about floats than JSON. For instance,
+    # '1e5' is a string for PyYAML. We want to produce exactly the same
+    # objects no matter which parser is used, hence this hook.
+    tag = _YAML_RESOLVER.resolve(yaml.ScalarNode, value, (True, False))
+    if tag == _YAML_FLOAT_TAG:
+        return float(value)
+    return value
+
+
+_JSON_DECODER = json.JSONDecoder(
+    object_pairs_hook=collections.OrderedDict,
+    parse_float=_json_float,
+    # NaN and Infinity are not valid JSON, and YAML treats them as regular
+    # strings.
+    parse_constant=str,
+)
+
+
+def _load_json(text):
+    return _JSON_DECODER.decode(text)
+
+
+def _load_yaml(text):
+    return yaml.load(text, _YamlOrderedCLoader)
+
+
+def _load_spec(text):
+    """Parse a given OpenAPI spec using the fastest available parser."""
+
+    # JSON is a subset of YAML, so YAML parser may be used for both. However,
+    # stdlib's JSON parser is implemented in C and it's an order of magnitude
+    # faster than any YAML parser available. So try it first if the spec
+    # looks like JSON, and fallback to YAML parser if we were wrong.
+    if text.lstrip().startswith('{'):
+        try:
+            return _load_json(text)
+        except ValueError:
+            pass
+    return _load_yaml(text)
+
+
+def _decode(data, encoding):
+    # Decode the same way 'open()' does in text mode, i.e. with universal
+    # newlines, so the result is the same no matter how the file is read.
+    return io.TextIOWrapper(io.BytesIO(data), encoding=encoding).read()
+
+
+# A cached value along with digests of files it was loaded from, and an
+# estimated amount of memory it occupies.
+_CacheEntry = collections.namedtuple('_CacheEntry', ['value', 'files', 'size'])
+
+
+def _read_file(path):
+    with open(path, 'rb') as stream:
+        return stream.read()
+
+
+def _stamp(path):
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+def _load_document(data):
+    return _load_spec(data.decode('utf-8'))
+
+
+# External documents referred by specs. Parsed documents are shared by all
+# the specs, and are bounded by 'openapi_cache_memory_limit' on their own.
+_DOCUMENTS = _documents.DocumentStore(_load_document, _LOADER_VERSION)
+
+
+def _normalize(spec, uri, files, options=None, cache=None, remote=None):
+    """Normalize a spec, and record digests of external files it refers to.
+
+    External documents are prefetched all at once, and parsed documents are
+    looked up in a given disk cache too. URLs of documents that are not read
+    from local files are added to ``remote`` set, if passed.
+    """
+    if options is not None:
+        spec = utils._pruned(spec, options)
+
+    url, _ = parse.urldefrag(uri)
+    prefetched = _DOCUMENTS.prefetch(spec, url, cache)
+
+    def _fetch(url):
+        document = prefetched.get(url)
+        if document is None:
+            document = _DOCUMENTS.load(url, cache)
+        elif isinstance(document, Exception):
+            raise document
+
+        if document.path is not None:
+            files[document.path] = document.digest
+        elif remote is not None:
+            remote.add(url)
+        return document.value
+
+    handlers = dict.fromkeys(_documents.SCHEMES, _fetch)
+    return utils._normalized(spec, uri, handlers=handlers)
+
+
+def _load_normalized_spec(abspath, encoding, uri, cache):
+    """Load and normalize a spec, or fetch it from a given disk cache.
+
+    A cached spec is used only if neither the spec file nor any external
+    document it refers to has changed since the spec was cached. Specs that
+    refer to remote documents, which are not mirrored locally, are not
+    cached, since there's no telling whether the documents have changed
+    without fetching them.
+    """
+    data = _read_file(abspath)
+    key = (abspath, encoding, uri)
+    digest = _cache.digest(data)
+
+    if cache is not None:
+        version, entry = cache.get(key) or (None, None)
+        if version == _LOADER_VERSION \
+                and entry.files[abspath] == digest \
+                and all(_cache.digest(_read_file(path)) == expected
+                        for path, expected in entry.files.items()
+                        if path != abspath):
+            return entry
+
+    files, remote = {abspath: digest}, set()
+    spec = _normalize(
+        _load_spec(_decode(data, encoding)), uri, files, cache=cache,
+        remote=remote)
+    entry = _CacheEntry(spec, files, _cache.sizeof(spec))
+
+    if cache is not None and not remote:
+        cache.set(key, (_LOADER_VERSION, entry))
+    return entry
+
+
+def _files_unchanged(files, stamps):
+    # Reading and hashing files is way cheaper than parsing them, however
+    # it's not free either. So trust files that seem to be untouched, and
+    # fallback to comparing digests only if a file's been touched.
+    for path, digest in files.items():
+        try:
+            stamp = _stamp(path)
+            if stamp == stamps[path]:
+                continue
+            if stamp[1] != stamps[path][1] \
+                    or _cache.digest(_read_file(path)) != digest:
+                return False
+        except OSError:
+            return False
+        stamps[path] = stamp
+    return True
+
+
+# Locally cache normalized specs to speedup processing of same spec file in
+# multiple openapi directives, and across rebuilds in long-running processes
+# such as sphinx-autobuild. Specs are shared, so renderers must not modify
+# them. The cache is bounded by 'openapi_cache_memory_limit'.
+_SPECS = _cache.MemoryCache()
+
+
+def _cached(key, abspath, load):
+    """Return an in-memory cache entry, (re)loading it if needed.
+
+    The entry is reloaded if any file it was loaded from has been changed.
+    The ``load`` callable must return :class:`_CacheEntry`.
+    """
+    cached = _SPECS.get(key)
+    if cached is not None:
+        entry, stamps = cached
+        if _files_unchanged(entry.files, stamps):
+            return entry
+
+    # Stamp the spec before reading it, so if it's changed in the meantime,
+    # the change will be noticed next time.
+    stamps = {abspath: _stamp(abspath)}
+    entry = load()
+    for path in entry.files:
+        stamps.setdefault(path, _stamp(path))
+
+    cached = (entry, stamps)
+    _SPECS.set(key, cached, entry.size)
+    # Structures derived from the spec live as long as the spec does, so
+    # they're counted along with it.
+    if isinstance(entry.value, utils._NormalizedSpec):
+        entry.value.track_size(
+            lambda size: _SPECS.grow(key, cached, size))
+    return entry
+
+
+def _get_normalized_spec(abspath, encoding, uri, cache_dir):
+    def _load():
+        cache = _cache.DiskCache(cache_dir) if cache_dir else None
+        return _load_normalized_spec(abspath, encoding, uri, cache)
+
+    return _cached((abspath, encoding, uri), abspath, _load).value
+
+
+def _get_spec_index(abspath, encoding):
+    """Return spec's lazy loading index, or None if it can't be indexed."""
+
+    def _load():
+        data = _read_file(abspath)
+        try:
+            index = _lazy.SpecIndex(
+                _decode(data, encoding), _YamlOrderedCLoader, _JSON_DECODER)
+        except ValueError:
+            index = None
+        return _CacheEntry(
+            index, {abspath: _cache.digest(data)}, sys.getsizeof(index))
+
+    return _cached(('index', abspath, encoding), abspath, _load)
+
+
+def _get_lazy_spec(abspath, encoding, uri, options, cache_dir=None):
+    """Return a normalized spec with paths selected by given options only.
+
+    Returns a pair of cache keys the spec depends on and the spec itself.
+    Components that are not referred by selected paths are not loaded at
+    all, as well as paths that are not selected. If the spec cannot be
+    loaded lazily, it's loaded as a whole.
+    """
+    index_key = ('index', abspath, encoding)
+    index_entry = _get_spec_index(abspath, encoding)
+    index = index_entry.value
+    if index is None:
+        return [index_key], None
+
+    defined = collections.OrderedDict.fromkeys(index.paths)
+    paths = tuple(utils._select_paths(defined, options))
+    methods = tuple(options.get('methods', ()))
+
+    def _load():
+        cache = _cache.DiskCache(cache_dir) if cache_dir else None
+        files = dict(index_entry.files)
+        spec = _normalize(index.materialize(paths), uri, files, options, cache)
+        return _CacheEntry(spec, files, _cache.sizeof(spec))
+
+    key = (abspath, encoding, uri, paths, methods)
+    return [index_key, key], _cached(key, abspath, _load).value
+
+
+# Markup of operations, shared by all the directives. Unlike specs, markup is
+# looked up by content, so it's never outdated and unchanged operations are
+# not rendered again even if their spec is changed. The cache is bounded by
+# 'openapi_cache_memory_limit', and is passed to renderers that render
+# operations.
+_RENDERED = _rendered.RenderCache()
+
+
+def _note_spec(env, docname, key):
+    if not hasattr(env, 'openapi_specs'):
+        env.openapi_specs = {}
+    env.openapi_specs.setdefault(docname, set()).add(key)
+
+
+# What a document rendered out of a spec: the spec's files along with their
+# digests, directive options, and a digest of the rendered operations made
+# by 'digest' function.
+_Slice = collections.namedtuple(
+    '_Slice', ['abspath', 'encoding', 'uri', 'options', 'files', 'digest'])
+
+
+def _note_slice(env, docname, slice_):
+    if not hasattr(env, 'openapi_slices'):
+        env.openapi_slices = {}
+    env.openapi_slices.setdefault(docname, []).append(slice_)
+
+
+def _get_spec(env, abspath, encoding, uri, options):
+    """Return a spec to be rendered with given options.
+
+    Returns a pair of cache keys the spec depends on and its cache entry.
+    """
+    # Huge specs may be loaded partially, if only a few paths are about to
+    # be rendered.
+    keys, spec = [], None
+    if env.config.openapi_lazy_loading \
+            and ('paths' in options or 'include' in options):
+        keys, spec = _get_lazy_spec(
+            abspath, encoding, uri, options, env.openapi_cache_dir)
+
+    if spec is None:
+        spec = _get_normalized_spec(
+            abspath, encoding, uri, env.openapi_cache_dir)
+        keys.append((abspath, encoding, uri))
+
+    # The entry's just been used, so it's not evicted yet.
+    entry, _ = _SPECS.get(keys[-1])
+    return keys, entry
+
+
+def _slice_changed(env, slice_, digests):
+    for path, expected in slice_.files.items():
+        if path not in digests:
+            try:
+                digests[path] = _cache.digest(_read_file(path))
+            except OSError:
+                digests[path] = None
+        if digests[path] != expected:
+            break
+    else:
+        return False
+
+    # Specs are often changed in a few operations only, so the document is
+    # re-read only if what it rendered has changed.
+    try:
+        _, entry = _get_spec(
+            env, slice_.abspath, slice_.encoding, slice_.uri, slice_.options)
+        return _rendered.slice_digest(entry.value, slice_.options) \
+            != slice_.digest
+    except Exception:
+        # Let the document be re-read and report the error.
+        return True
+
+
+def _get_outdated(app, env, added, changed, removed):
+    digests = {}
+    return [
+        docname
+        for docname, slices in getattr(env, 'openapi_slices', {}).items()
+        if docname not in changed and docname not in removed
+        and any(_slice_changed(env, slice_, digests) for slice_ in slices)
+    ]
+
+
+def _configure_cache(app, conf):
+    _SPECS.resize(conf.openapi_cache_memory_limit)
+    _DOCUMENTS.resize(conf.openapi_cache_memory_limit)
+    _RENDERED.resize(conf.openapi_cache_memory_limit)
+    _RENDERED.disk = None
+    if conf.openapi_cache_markup:
+        _RENDERED.disk = _cache.DiskCache(_get_cache_dir(app))
+
+    _DOCUMENTS.mirror = None
+    if conf.openapi_mirror_dir is not None:
+        _DOCUMENTS.mirror = os.path.join(app.confdir, conf.openapi_mirror_dir)
+
+
+def _purge_doc(app, env, docname):
+    if hasattr(env, 'openapi_specs'):
+        env.openapi_specs.pop(docname, None)
+    if hasattr(env, 'openapi_slices'):
+        env.openapi_slices.pop(docname, None)
+
+
+def _merge_info(app, env, docnames, other):
+    for docname in docnames:
+        for key in getattr(other, 'openapi_specs', {}).get(docname, ()):
+            _note_spec(env, docname, key)
+        for slice_ in getattr(other, 'openapi_slices', {}).get(docname, ()):
+            _note_slice(env, docname, slice_)
+
+
+def _evict_unused_specs(app, env):
+    # Once all documents are read, specs that are not referred by any of
+    # them anymore (e.g. documents were removed or changed to render other
+    # specs) are just a waste of memory.
+    used = set()
+    for keys in getattr(env, 'openapi_specs', {}).values():
+        used.update(keys)
+
+    for key in _SPECS:
+        if key not in used:
+            _SPECS.discard(key)
+
+
+_DIRECTIVE = re.compile(r'(\s*)\.\. openapi(?::\S+)?::\s+(.+?)\s*$')
+_DIRECTIVE_OPTION = re.compile(r'(\s+):([^:]+):\s*(.*?)\s*$')
+
+
+def _find_directives(text):
+    """Find openapi directives in a given reStructuredText source.
+
+    Returns a list of pairs of directives' arguments and raw options.
+    """
+    found = []
+    lines = iter(text.splitlines())
+    for line in lines:
+        match = _DIRECTIVE.match(line)
+        while match:
+            indent, argument = match.groups()
+            options = {}
+            found.append((argument, options))
+
+            match = None
+            for line in lines:
+                option = _DIRECTIVE_OPTION.match(line)
+                if option is None or len(option.group(1)) <= len(indent):
+                    # Directives may follow each other without a line in
+                    # between.
+                    match = _DIRECTIVE.match(line)
+                    break
+                options[option.group(2)] = option.group(3)
+    return found
+
+
+def _prewarm_specs(app, env, docnames):
+    """Load specs rendered by documents that are about to be read.
+
+    Documents are read by worker processes forked off this one in parallel
+    builds, and each of them would load the specs on its own. Specs loaded
+    beforehand are inherited by workers instead.
+    """
+    # Sphinx checks the same, yet it warns about each extension that's not
+    # safe for parallel reading on its way.
+    if app.parallel <= 1 or not parallel.parallel_available or not all(
+            getattr(extension, 'parallel_read_safe', None)
+            for extension in app.extensions.values()):
+        return
+
+    seen = set()
+    for docname in docnames:
+        path = env.doc2path(docname)
+        try:
+            with open(path, encoding=app.config.source_encoding) as stream:
+                text = stream.read()
+        except (OSError, ValueError):
+            continue
+
+        for argument, options in _find_directives(text):
+            _, abspath = env.relfn2path(directives.path(argument), docname)
+            encoding = options.get('encoding', app.config.source_encoding)
+            # Lazily loaded specs are indexed only, as they are loaded
+            # partially by each directive.
+            lazy = app.config.openapi_lazy_loading \
+                and ('paths' in options or 'include' in options)
+            if (abspath, encoding, lazy) in seen:
+                continue
+            seen.add((abspath, encoding, lazy))
+
+            try:
+                if lazy:
+                    _get_spec_index(abspath, encoding)
+                else:
+                    _get_normalized_spec(
+                        abspath, encoding, 'file://%s' % abspath,
+                        _get_cache_dir(app))
+            except Exception as exc:
+                # The directive reports the error once the document is read.
+                LOG.debug('[openapi] cannot prewarm %s: %s', abspath, exc)
+
+
+def _get_cache_dir(app):
+    """Return the directory to store parsed specs in between builds."""
+    if app.config.openapi_cache_dir is None:
+        return os.path.join(app.doctreedir, 'openapi')
+    return os.path.join(app.confdir, app.config.openapi_cache_dir)
+
+
+def _note_cache_dir(app):
+    # Directives have no access to the application, so the directory is
+    # kept by the environment.
+    app.env.openapi_cache_dir = _get_cache_dir(app)
 
 
 def create_directive_from_renderer(renderer_cls):
@@ -60,15 +544,44 @@ def create_directive_from_renderer(renderer_cls):
             # stack.
             self.options.setdefault('uri', 'file://%s' % abspath)
 
-            # Add a given OpenAPI spec as a dependency of the referring
-            # reStructuredText document, so the document is rebuilt each time
-            # the spec is changed.
-            self.env.note_dependency(relpath)
-
             # Read the spec using encoding passed to the directive or fallback to
             # the one specified in Sphinx's config.
             encoding = self.options.get('encoding', self.config.source_encoding)
-            spec = _get_spec(abspath, encoding)
-            return renderer_cls(self.state, self.options).render(spec)
+            uri = self.options['uri']
+
+            # Add a given OpenAPI spec as a dependency of the referring
+            # reStructuredText document, so the document is rebuilt each time
+            # the spec is changed. Renderers that render nothing but selected
+            # operations make the document depend on the operations instead,
+            # so it's rebuilt only if they are changed.
+            # The flag is not inherited, since subclasses of such renderers
+            # may render more than operations.
+            renders_operations = vars(renderer_cls).get(
+                'renders_operations', False)
+            if not renders_operations:
+                self.env.note_dependency(relpath)
+
+            try:
+                keys, entry = _get_spec(
+                    self.env, abspath, encoding, uri, self.options)
+                for key in keys:
+                    _note_spec(self.env, self.env.docname, key)
+                if renders_operations:
+                    renderer = renderer_cls(
+                        self.state, self.options, render_cache=_RENDERED)
+                else:
+                    renderer = renderer_cls(self.state, self.options)
+                result = renderer.render(entry.value)
+            except Exception:
+                # The document is to be rebuilt once the spec is fixed.
+                if renders_operations:
+                    self.env.note_dependency(relpath)
+                raise
+
+            if renders_operations:
+                _note_slice(self.env, self.env.docname, _Slice(
+                    abspath, encoding, uri, dict(self.options), entry.files,
+                    _rendered.slice_digest(entry.value, self.options)))
+            return result
 
     return _RenderingDirective
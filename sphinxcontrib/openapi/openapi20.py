@@ -9,109 +9,103 @@
     :license: BSD, see LICENSE for details.
 """
 
-import collections
 import itertools
-import re
-
-from sphinxcontrib.openapi import utils
-
-
-def _httpresource(endpoint, method, properties, convert):
-    parameters = properties.get('parameters', [])
-    responses = properties['responses']
-    indent = '   '
-
-    yield '.. http:{0}:: {1}'.format(method, endpoint)
-    yield '   :synopsis: {0}'.format(properties.get('summary', 'null'))
-    yield ''
-
-    if 'summary' in properties:
-        for line in properties['summary'].splitlines():
-            yield '{indent}**{line}**'.format(**locals())
-        yield ''
-
-    if 'description' in properties:
-        for line in convert(properties['description']).splitlines():
-            yield '{indent}{line}'.format(**locals())
-        yield ''
-
-    for param in filter(lambda p: p['in'] == 'path', parameters):
-        yield indent + ':param {type} {name}:'.format(**param)
-        for line in convert(param.get('description', '')).splitlines():
-            yield '{indent}{indent}{line}'.format(**locals())
-
-    # print request's query params
-    for param in filter(lambda p: p['in'] == 'query', parameters):
-        yield indent + ':query {type} {name}:'.format(**param)
-        for line in convert(param.get('description', '')).splitlines():
-            yield '{indent}{indent}{line}'.format(**locals())
-
-    # print the json body params
-    for param in filter(lambda p: p['in'] == 'body', parameters):
-        if 'schema' in param:
-            yield ''
-            for line in convert_json_schema(param['schema']):
-                yield '{indent}{line}'.format(**locals())
-            yield ''
-
-    # print response status codes
-    for status, response in sorted(responses.items()):
-        yield '{indent}:status {status}:'.format(**locals())
-        for line in convert(response['description']).splitlines():
-            yield '{indent}{indent}{line}'.format(**locals())
-
-    # print request header params
-    for param in filter(lambda p: p['in'] == 'header', parameters):
-        yield indent + ':reqheader {name}:'.format(**param)
-        for line in convert(param.get('description', '')).splitlines():
-            yield '{indent}{indent}{line}'.format(**locals())
-
-    # print response headers
-    for status, response in responses.items():
-        for headername, header in response.get('headers', {}).items():
-            yield indent + ':resheader {name}:'.format(name=headername)
-            for line in convert(header['description']).splitlines():
-                yield '{indent}{indent}{line}'.format(**locals())
-
-    for status, response in responses.items():
-        if not is_2xx_response(status):
-            continue
-        if 'schema' in response:
-            yield ''
-            for line in convert_json_schema(
-                    response['schema'], directive=':>json'):
-                yield '{indent}{line}'.format(**locals())
-            yield ''
-
-    yield ''
-
-
-def convert_json_schema(schema, directive=':<json'):
+from urllib import parse
+
+from sphinxcontrib.openapi import (
+    _markup, _schemas, _upconvert, openapi30, utils)
+
+
+class _OperationMarkup(openapi30._OperationMarkup):
+    """Render operations of specs converted from OpenAPI 2.0.
+
+    Along with whatever OpenAPI 3.0 operations have, fields of JSON bodies
+    of requests and successful responses are rendered, and statuses are
+    sorted, the way OpenAPI 2.0 operations have always been rendered.
     """
-    Convert json schema to `:<json` sphinx httpdomain.
+
+    def order_responses(self, responses):
+        return sorted(responses, key=lambda r: r.status)
+
+    def _json_fields(self, media_types, directive):
+        # Media types of a body share the schema of the original body.
+        for media_type in media_types:
+            if media_type.content_type in _upconvert.FORM_MEDIA_TYPES:
+                continue
+            if media_type.schema is not None:
+                return [_markup.InlineFields([
+                    ('{} {}'.format(directive, field), text)
+                    for field, text in json_schema_fields(
+                        media_type.schema, max_depth=self.max_depth,
+                        schemas=self.generated.schemas)
+                ])]
+            break
+        return []
+
+    def render_request(self, operation, buckets):
+        # print the json body params
+        return self._json_fields(operation.request_body, '<json') + \
+            super().render_request(operation, buckets)
+
+    def render_trailer(self, operation, buckets):
+        blocks = []
+        for response in buckets.successful:
+            blocks.extend(self._json_fields(response.content, '>json'))
+        return blocks + super().render_trailer(operation, buckets)
+
+
+def _ref_name(ref):
+    """Return a name of a schema a given JSON reference refers to."""
+    token = ref.rsplit('/', 1)[-1]
+    return parse.unquote(token).replace('~1', '/').replace('~0', '~')
+
+
+def json_schema_fields(schema, max_depth=utils._DEFAULT_SCHEMA_DEPTH,
+                       schemas=None):
+    """
+    Return fields of a json schema, along with their texts.
+
+    Fields are 2-tuples (field, text), i.e: ('integer user.age', 'the age
+    of user (required)'), sorted by names of the fields.
+
+    Arrays and objects nested deeper than ``max_depth`` are rendered as
+    fields of their own, without going into their items or properties.
+    Composed schemas are looked up in ``schemas`` cache, if passed.
     """
 
     output = []
+    if schemas is None:
+        schemas = _schemas.Schemas()
 
-    def _convert(schema, name='', required=False):
+    def _convert(schema, name='', required=False, depth=max_depth):
         """
-        Fill the output list, with 2-tuple (name, template)
+        Fill the output list, with 4-tuple (name, template, field, text)
 
-        i.e: ('user.age', 'str user.age: the age of user')
+        i.e: ('user.age', 'str user.age: the age of user', 'str user.age',
+              'the age of user')
 
         This allow to sort output by field name
         """
 
+        schema = schemas.effective(schema)
         type_ = schema.get('type', 'any')
         required_properties = schema.get('required', ())
-        if type_ == 'object' and schema.get('properties'):
+        expand = depth > 0
+        if '$ref' in schema:
+            # A reference back to a schema that is being rendered, i.e. a
+            # recursive type. Its name is used as a field type instead of
+            # rendering it again and again.
+            type_ = _ref_name(schema['$ref'])
+            expand = False
+
+        if expand and type_ == 'object' and schema.get('properties'):
             for prop, next_schema in schema.get('properties', {}).items():
                 _convert(
                     next_schema, '{name}.{prop}'.format(**locals()),
-                    (prop in required_properties))
+                    (prop in required_properties), depth - 1)
 
-        elif type_ == 'array':
-            _convert(schema['items'], name + '[]')
+        elif expand and type_ == 'array':
+            _convert(schema['items'], name + '[]', depth=depth - 1)
 
         else:
             if name:
@@ -126,138 +120,73 @@ def convert_json_schema(schema, directive=':<json'):
                 else:
                     constraints = ''
 
+                field = '{type_} {name}'.format(**locals())
                 if schema.get('description', ''):
                     if constraints:
-                        output.append((
-                            name,
-                            '{type_} {name}:'
-                            ' {schema[description]}'
-                            ' {constraints}'.format(**locals())))
+                        text = '{schema[description]} {constraints}'.format(
+                            **locals())
                     else:
-                        output.append((
-                            name,
-                            '{type_} {name}:'
-                            ' {schema[description]}'.format(**locals())))
-
+                        text = schema['description']
                 else:
-                    if constraints:
-                        output.append(
-                            (name,
-                             '{type_} {name}:'
-                             ' {constraints}'.format(**locals())))
-                    else:
-                        output.append(
-                            (name,
-                             '{type_} {name}:'.format(**locals())))
+                    text = constraints
+
+                template = '{field}:'.format(**locals())
+                if text:
+                    template = '{template} {text}'.format(**locals())
+                output.append((name, template, field, text))
 
     _convert(schema)
 
-    for _, render in sorted(output):
-        yield '{} {}'.format(directive, render)
+    for _, _, field, text in sorted(output):
+        yield field, text
 
 
-def is_2xx_response(status):
-    try:
-        status = int(status)
-        return 200 <= status < 300
-    except ValueError:
-        pass
-    return False
+def convert_json_schema(schema, directive=':<json',
+                        max_depth=utils._DEFAULT_SCHEMA_DEPTH, schemas=None):
+    """
+    Convert json schema to `:<json` sphinx httpdomain.
 
+    Arrays and objects nested deeper than ``max_depth`` are rendered as
+    fields of their own, without going into their items or properties.
+    Composed schemas are looked up in ``schemas`` cache, if passed.
+    """
 
-def _header(title):
-    yield title
-    yield '=' * len(title)
-    yield ''
+    for field, text in json_schema_fields(schema, max_depth, schemas):
+        if text:
+            yield '{} {}: {}'.format(directive, field, text)
+        else:
+            yield '{} {}:'.format(directive, field)
 
 
-def openapihttpdomain(spec, **options):
-    if 'examples' in options:
-        raise ValueError(
-            'Rendering examples is not supported for OpenAPI v2.x specs.')
+is_2xx_response = _markup.is_2xx_response
 
-    if 'request' in options:
-        raise ValueError(
-            'The :request: option is not supported for OpenAPI v2.x specs.')
 
-    generators = []
+def openapihttpdomain_chunks(spec, render_cache=None, **options):
+    """Render a given spec into chunks of markup.
 
+    Each chunk is either a header of a group of operations or an operation.
+    Chunks are rendered one by one, as they are consumed.
+    """
     # OpenAPI spec may contain JSON references, common properties, etc.
     # Trying to render the spec "As Is" will require to put multiple
     # if-s around the code. In order to simplify flow, let's make the
     # spec to have only one (expected) schema, i.e. normalize it.
-    utils.normalize_spec(spec, **options)
-
-    # Paths list to be processed
-    paths = []
-
-    # If 'paths' are passed we've got to ensure they exist within an OpenAPI
-    # spec; otherwise raise error and ask user to fix that.
-    if 'paths' in options:
-        if not set(options['paths']).issubset(spec['paths']):
-            raise ValueError(
-                'One or more paths are not defined in the spec: %s.' % (
-                    ', '.join(set(options['paths']) - set(spec['paths'])),
-                )
-            )
-        paths = options['paths']
-
-    # Check against regular expressions to be included
-    if 'include' in options:
-        for i in options['include']:
-            ir = re.compile(i)
-            for path in spec['paths']:
-                if ir.match(path):
-                    paths.append(path)
-
-    # If no include nor paths option, then take full path
-    if 'include' not in options and 'paths' not in options:
-        paths = spec['paths']
-
-    # Remove paths matching regexp
-    if 'exclude' in options:
-        _paths = []
-        for e in options['exclude']:
-            er = re.compile(e)
-            for path in paths:
-                if not er.match(path):
-                    _paths.append(path)
-        paths = _paths
-
-    if 'group' in options:
-        groups = collections.OrderedDict(
-            [(x['name'], []) for x in spec.get('tags', {})]
-            )
-
-        for endpoint in paths:
-            for method, properties in spec['paths'][endpoint].items():
-                if options.get('methods') and method not in options.get('methods'):
-                    continue
-                key = properties.get('tags', [''])[0]
-                groups.setdefault(key, []).append(_httpresource(
-                    endpoint,
-                    method,
-                    properties,
-                    utils.get_text_converter(options),
-                    ))
-
-        for key in groups.keys():
-            if key:
-                generators.append(_header(key))
-            else:
-                generators.append(_header('default'))
-
-            generators.extend(groups[key])
-    else:
-        for endpoint in paths:
-            for method, properties in spec['paths'][endpoint].items():
-                if options.get('methods') and method not in options.get('methods'):
-                    continue
-                generators.append(_httpresource(
-                    endpoint,
-                    method,
-                    properties,
-                    utils.get_text_converter(options),
-                    ))
-
-    return iter(itertools.chain(*generators))
+    spec = utils._normalized(spec, options.get('uri', ''), options=options)
+
+    # The spec is rendered the same way OpenAPI 3.0 specs are, once it's
+    # converted. The conversion is done once per spec.
+    return openapi30.render_chunks(
+        _upconvert.get_openapi3(spec), render_cache, options,
+        markup=_OperationMarkup)
+
+
+def openapihttpdomain_items(spec, **options):
+    """Render a given spec into headers and resources, one by one."""
+    spec = utils._normalized(spec, options.get('uri', ''), options=options)
+    return openapi30.render_items(
+        _upconvert.get_openapi3(spec), options, markup=_OperationMarkup)
+
+
+def openapihttpdomain(spec, render_cache=None, **options):
+    return itertools.chain.from_iterable(
+        openapihttpdomain_chunks(spec, render_cache, **options))
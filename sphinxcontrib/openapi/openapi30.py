@@ -8,7 +8,6 @@
     :license: BSD, see LICENSE for details.
 """
 
-import copy
 import collections
 from datetime import datetime
 import itertools
@@ -19,7 +18,7 @@ from http.client import responses as http_status_codes
 
 from sphinx.util import logging
 
-from sphinxcontrib.openapi import utils
+from sphinxcontrib.openapi import _markup, _model, _rendered, _schemas, utils
 
 
 LOG = logging.getLogger(__name__)
@@ -50,53 +49,42 @@ _TYPE_MAPPING = {
 
 _READONLY_PROPERTY = object()  # sentinel for values not included in requests
 
+_GET_REQUEST_MEDIA_TYPE = _model.MediaType(
+    content_type='',
+    schema=None,
+    example=None,
+    examples={'Example request': {'value': ''}},
+)
 
-def _dict_merge(dct, merge_dct):
-    """Recursive dict merge.
 
-    Inspired by :meth:``dict.update()``, instead of updating only top-level
-    keys, dict_merge recurses down into dicts nested to an arbitrary depth,
-    updating keys. The ``merge_dct`` is merged into ``dct``.
-
-    From https://gist.github.com/angstwad/bf22d1822c38a92ec0a9
-
-    Arguments:
-        dct: dict onto which the merge is executed
-        merge_dct: dct merged into dct
-    """
-    for k, v in merge_dct.items():
-        if (k in dct and isinstance(dct[k], dict)
-                and isinstance(merge_dct[k], collections.Mapping)):
-            _dict_merge(dct[k], merge_dct[k])
-        else:
-            dct[k] = merge_dct[k]
-
-
-def _parse_schema(schema, method):
+def _parse_schema(schema, method, max_depth=utils._DEFAULT_SCHEMA_DEPTH,
+                  schemas=None):
     """
     Convert a Schema Object to a Python object.
 
     Args:
         schema: An ``OrderedDict`` representing the schema object.
+        max_depth: How deep arrays and objects are expanded, deeper ones
+            are rendered empty.
+        schemas: A cache of composed schemas of the spec.
     """
+    if schemas is None:
+        schemas = _schemas.Schemas()
+
+    if '$ref' in schema:
+        # A reference back to a schema that is being expanded, i.e. a
+        # recursive type. It's rendered as is instead of looping forever.
+        return collections.OrderedDict([('$ref', schema['$ref'])])
+
     if method and schema.get('readOnly', False):
         return _READONLY_PROPERTY
 
     # allOf: Must be valid against all of the subschemas
-    if 'allOf' in schema:
-        schema_ = copy.deepcopy(schema['allOf'][0])
-        for x in schema['allOf'][1:]:
-            _dict_merge(schema_, x)
-
-        return _parse_schema(schema_, method)
-
     # anyOf: Must be valid against any of the subschemas
-    # TODO(stephenfin): Handle anyOf
-
     # oneOf: Must be valid against exactly one of the subschemas
-    if 'oneOf' in schema:
-        # we only show the first one since we can't show everything
-        return _parse_schema(schema['oneOf'][0], method)
+    composed = schemas.compose(schema)
+    if composed is not schema:
+        return _parse_schema(composed, method, max_depth, schemas)
 
     if 'enum' in schema:
         # we only show the first one since we can't show everything
@@ -105,13 +93,18 @@ def _parse_schema(schema, method):
     schema_type = schema.get('type', 'object')
 
     if schema_type == 'array':
+        if max_depth <= 0:
+            return []
+
         # special case oneOf so that we can show examples for all possible
         # combinations
         if 'oneOf' in schema['items']:
             return [
-                _parse_schema(x, method) for x in schema['items']['oneOf']]
+                _parse_schema(x, method, max_depth - 1, schemas)
+                for x in schema['items']['oneOf']]
 
-        return [_parse_schema(schema['items'], method)]
+        return [
+            _parse_schema(schema['items'], method, max_depth - 1, schemas)]
 
     if schema_type == 'object':
         if method and 'properties' in schema and \
@@ -119,9 +112,12 @@ def _parse_schema(schema, method):
                     for v in schema['properties'].values()):
             return _READONLY_PROPERTY
 
+        if max_depth <= 0:
+            return collections.OrderedDict()
+
         results = []
         for name, prop in schema.get('properties', {}).items():
-            result = _parse_schema(prop, method)
+            result = _parse_schema(prop, method, max_depth - 1, schemas)
             if result != _READONLY_PROPERTY:
                 results.append((name, result))
 
@@ -133,23 +129,82 @@ def _parse_schema(schema, method):
     return _TYPE_MAPPING[(schema_type, None)]  # unrecognized format
 
 
-def _example(media_type_objects, method=None, endpoint=None, status=None,
-             nb_indent=0):
+def _example_lines(value):
+    if not isinstance(value, str):
+        value = json.dumps(value, indent=4, separators=(',', ': '))
+    return tuple(value.splitlines())
+
+
+class _GeneratedExamples(object):
+    """Examples generated out of schemas of a spec.
+
+    Schemas such as errors or pages are usually shared by many operations,
+    so examples are generated and serialized once per schema. Requests and
+    responses have different examples, since read-only properties are not
+    sent in requests. Examples are passed to ``account`` callable, if any,
+    since the cache holds them.
+    """
+
+    def __init__(self, schemas, account=None):
+        self.schemas = schemas
+        self._account = account
+        self._examples = {}
+
+    def _entry(self, schema, method, max_depth):
+        key = (id(schema), bool(method), max_depth)
+        try:
+            return self._examples[key]
+        except KeyError:
+            pass
+
+        # The schema is kept along, so its identity is not reused by
+        # another object as long as the cache is alive.
+        entry = self._examples[key] = [
+            schema, _parse_schema(schema, method, max_depth, self.schemas), None]
+        if self._account is not None:
+            self._account(entry[1])
+        return entry
+
+    def get(self, schema, method, max_depth):
+        """Return an example for a given schema."""
+        return self._entry(schema, method, max_depth)[1]
+
+    def lines(self, schema, method, max_depth):
+        """Return serialized lines of an example for a given schema."""
+        entry = self._entry(schema, method, max_depth)
+        if entry[2] is None:
+            entry[2] = _example_lines(entry[1])
+            if self._account is not None:
+                self._account(entry[2])
+        return entry[2]
+
+
+def _build_generated_examples(spec):
+    return _GeneratedExamples(_schemas.get_schemas(spec), spec.account)
+
+
+def _examples(media_types, method=None, endpoint=None, status=None,
+              max_depth=utils._DEFAULT_SCHEMA_DEPTH, generated=None):
     """
     Format examples in `Media Type Object` openapi v3 to HTTP request or
     HTTP response example.
-    If method and endpoint is provided, this function prints a request example
-    else status should be provided to print a response example.
+    If method and endpoint is provided, this function returns a request
+    example else status should be provided to return a response example.
 
     Arguments:
-        media_type_objects (Dict[str, Dict]): Dict containing
-            Media Type Objects.
+        media_types (Iterable[MediaType]): Media types of a request or
+            a response.
         method: The HTTP method to use in example.
         endpoint: The HTTP route to use in example.
         status: The HTTP status to use in example.
+        max_depth: How deep schemas are expanded to generate examples.
+        generated: A cache of examples generated out of the spec schemas.
+
+    Returns:
+        Iterable[_markup.Code]: Code blocks of the examples.
     """
-    indent = '   '
-    extra_indent = indent * nb_indent
+    if generated is None:
+        generated = _GeneratedExamples(_schemas.Schemas())
 
     if method is not None:
         method = method.upper()
@@ -161,14 +216,15 @@ def _example(media_type_objects, method=None, endpoint=None, status=None,
         except (ValueError, KeyError):
             status_text = '-'
 
-    # Provide request samples for GET requests
+    # Provide request samples for GET requests.
     if method == 'GET':
-        media_type_objects[''] = {
-            'examples': {'Example request': {'value': ''}}}
+        media_types = itertools.chain(media_types, [_GET_REQUEST_MEDIA_TYPE])
 
-    for content_type, content in media_type_objects.items():
-        examples = content.get('examples')
-        example = content.get('example')
+    for media_type in media_types:
+        content_type = media_type.content_type
+        examples = media_type.examples
+        example = media_type.example
+        example_lines = None
 
         if examples is None:
             examples = {}
@@ -177,7 +233,9 @@ def _example(media_type_objects, method=None, endpoint=None, status=None,
                         None:
                     LOG.info('skipping non-JSON example generation.')
                     continue
-                example = _parse_schema(content['schema'], method=method)
+                example = generated.get(media_type.schema, method, max_depth)
+                example_lines = generated.lines(
+                    media_type.schema, method, max_depth)
 
             if method is None:
                 examples['Example response'] = {
@@ -188,270 +246,196 @@ def _example(media_type_objects, method=None, endpoint=None, status=None,
                     'value': example,
                 }
 
-        for example in examples.values():
-            if not isinstance(example['value'], str):
-                example['value'] = json.dumps(
-                    example['value'], indent=4, separators=(',', ': '))
-
         for example_name, example in examples.items():
+            lines = example_lines
+            if lines is None:
+                lines = _example_lines(example['value'])
+
             if 'summary' in example:
                 example_title = '{example_name} - {example[summary]}'.format(
                     **locals())
             else:
                 example_title = example_name
 
-            yield ''
-            yield '{extra_indent}**{example_title}:**'.format(**locals())
-            yield ''
-            yield '{extra_indent}.. sourcecode:: http'.format(**locals())
-            yield ''
-
             # Print http request example
             if method:
-                yield '{extra_indent}{indent}{method} {endpoint} HTTP/1.1' \
-                    .format(**locals())
-                yield '{extra_indent}{indent}Host: example.com' \
-                    .format(**locals())
+                code = ['{method} {endpoint} HTTP/1.1'.format(**locals()),
+                        'Host: example.com']
                 if content_type:
-                    yield '{extra_indent}{indent}Content-Type: {content_type}'\
-                        .format(**locals())
+                    code.append(
+                        'Content-Type: {content_type}'.format(**locals()))
 
             # Print http response example
             else:
-                yield '{extra_indent}{indent}HTTP/1.1 {status} {status_text}' \
-                    .format(**locals())
-                yield '{extra_indent}{indent}Content-Type: {content_type}' \
-                    .format(**locals())
+                code = ['HTTP/1.1 {status} {status_text}'.format(**locals()),
+                        'Content-Type: {content_type}'.format(**locals())]
+
+            code.append('')
+            code.extend(lines)
+            yield _markup.Code(example_title, 'http', code)
+
+
+class _OperationMarkup(_markup.OperationMarkup):
+
+    def __init__(self, convert, render_examples, render_request, max_depth,
+                 generated):
+        super().__init__(convert)
+        self.render_examples = render_examples
+        self.render_request_body = render_request
+        self.max_depth = max_depth
+        self.generated = generated
+
+    def param_type(self, param):
+        return param.schema['type']
+
+    def render_query_param(self, operation, param, buckets):
+        if not param.required:
+            return []
+
+        example = self.generated.get(
+            param.schema, operation.method, self.max_depth)
+        if param.example is not _model.MISSING:
+            example = param.example
+        if param.explode and isinstance(example, list):
+            for v in example:
+                buckets.query_examples.append((param.name, v))
+        elif param.explode and isinstance(example, dict):
+            for k, v in example.items():
+                buckets.query_examples.append((k, v))
+        else:
+            buckets.query_examples.append((param.name, example))
+        return ['(Required)']
+
+    def render_request(self, operation, buckets):
+        blocks = []
+
+        # print request content
+        if self.render_request_body:
+            for media_type in operation.request_body:
+                if media_type.content_type != 'application/json':
+                    continue
+                req_properties = json.dumps(
+                    self.generated.schemas.effective(
+                        media_type.schema)['properties'],
+                    indent=2, separators=(',', ':'))
+                blocks.append(_markup.Code(
+                    'Request body', 'json', req_properties.splitlines()))
+
+        # print request example
+        if self.render_examples:
+            endpoint = operation.path
+            if buckets.query_examples:
+                endpoint = endpoint + "?" + \
+                    parse.urlencode(buckets.query_examples)
+
+            blocks.extend(_examples(
+                operation.request_body,
+                operation.method,
+                endpoint=endpoint,
+                max_depth=self.max_depth,
+                generated=self.generated))
+        return blocks
+
+    def render_response(self, response):
+        # print response example
+        if self.render_examples:
+            return list(_examples(
+                response.content, status=response.status,
+                max_depth=self.max_depth, generated=self.generated))
+        return []
+
+    def render_request_header(self, param):
+        return ['(Required)'] if param.required else []
 
-            yield ''
-            for example_line in example['value'].splitlines():
-                yield '{extra_indent}{indent}{example_line}'.format(**locals())
-            if example['value'].splitlines():
-                yield ''
+    def render_trailer(self, operation, buckets):
+        return [
+            _markup.Admonition(
+                'Callback: ' + cb_name,
+                [self.render(cb_operation) for cb_operation in cb_operations])
+            for cb_name, cb_operations in operation.callbacks
+        ]
 
 
-def _httpresource(endpoint, method, properties, convert, render_examples,
-                  render_request):
+def _httpresource(operation, markup):
     # https://github.com/OAI/OpenAPI-Specification/blob/3.0.2/versions/3.0.0.md#operation-object
-    parameters = properties.get('parameters', [])
-    responses = properties['responses']
-    query_param_examples = []
-    indent = '   '
-
-    yield '.. http:{0}:: {1}'.format(method, endpoint)
-    yield '   :synopsis: {0}'.format(properties.get('summary', 'null'))
-    yield ''
-
-    if 'summary' in properties:
-        for line in properties['summary'].splitlines():
-            yield '{indent}**{line}**'.format(**locals())
-        yield ''
-
-    if 'description' in properties:
-        for line in convert(properties['description']).splitlines():
-            yield '{indent}{line}'.format(**locals())
-        yield ''
-
-    # print request's path params
-    for param in filter(lambda p: p['in'] == 'path', parameters):
-        yield indent + ':param {type} {name}:'.format(
-            type=param['schema']['type'],
-            name=param['name'])
-
-        for line in convert(param.get('description', '')).splitlines():
-            yield '{indent}{indent}{line}'.format(**locals())
-
-    # print request's query params
-    for param in filter(lambda p: p['in'] == 'query', parameters):
-        yield indent + ':query {type} {name}:'.format(
-            type=param['schema']['type'],
-            name=param['name'])
-        for line in convert(param.get('description', '')).splitlines():
-            yield '{indent}{indent}{line}'.format(**locals())
-        if param.get('required', False):
-            yield '{indent}{indent}(Required)'.format(**locals())
-            example = _parse_schema(param['schema'], method)
-            example = param.get('example', example)
-            if param.get('explode', False) and isinstance(example, list):
-                for v in example:
-                    query_param_examples.append((param['name'], v))
-            elif param.get('explode', False) and isinstance(example, dict):
-                for k, v in example.items():
-                    query_param_examples.append((k, v))
-            else:
-                query_param_examples.append((param['name'], example))
-
-    # print request content
-    if render_request:
-        request_content = properties.get('requestBody', {}).get('content', {})
-        if request_content and 'application/json' in request_content:
-            schema = request_content['application/json']['schema']
-            req_properties = json.dumps(schema['properties'], indent=2,
-                                        separators=(',', ':'))
-            yield '{indent}**Request body:**'.format(**locals())
-            yield ''
-            yield '{indent}.. sourcecode:: json'.format(**locals())
-            yield ''
-            for line in req_properties.splitlines():
-                # yield indent + line
-                yield '{indent}{indent}{line}'.format(**locals())
-                # yield ''
-
-    # print request example
-    if render_examples:
-        endpoint_examples = endpoint
-        if query_param_examples:
-            endpoint_examples = endpoint + "?" + \
-                parse.urlencode(query_param_examples)
+    return _markup.to_lines(markup.render(operation))
 
-        # print request example
-        request_content = properties.get('requestBody', {}).get('content', {})
-        for line in _example(
-                request_content,
-                method,
-                endpoint=endpoint_examples,
-                nb_indent=1):
-            yield line
-
-    # print response status codes
-    for status, response in responses.items():
-        yield '{indent}:status {status}:'.format(**locals())
-        for line in convert(response['description']).splitlines():
-            yield '{indent}{indent}{line}'.format(**locals())
 
-        # print response example
-        if render_examples:
-            for line in _example(
-                    response.get('content', {}), status=status, nb_indent=2):
-                yield line
-
-    # print request header params
-    for param in filter(lambda p: p['in'] == 'header', parameters):
-        yield indent + ':reqheader {name}:'.format(**param)
-        for line in convert(param.get('description', '')).splitlines():
-            yield '{indent}{indent}{line}'.format(**locals())
-        if param.get('required', False):
-            yield '{indent}{indent}(Required)'.format(**locals())
-
-    # print response headers
-    for status, response in responses.items():
-        for headername, header in response.get('headers', {}).items():
-            yield indent + ':resheader {name}:'.format(name=headername)
-            for line in convert(header['description']).splitlines():
-                yield '{indent}{indent}{line}'.format(**locals())
-
-    for cb_name, cb_specs in properties.get('callbacks', {}).items():
-        yield ''
-        yield indent + '.. admonition:: Callback: ' + cb_name
-        yield ''
-
-        for cb_endpoint in cb_specs.keys():
-            for cb_method, cb_properties in cb_specs[cb_endpoint].items():
-                for line in _httpresource(
-                        cb_endpoint,
-                        cb_method,
-                        cb_properties,
-                        convert=convert,
-                        render_examples=render_examples,
-                        render_request=render_request):
-                    if line:
-                        yield indent+indent+line
-                    else:
-                        yield ''
-
-    yield ''
-
-
-def _header(title):
-    yield title
-    yield '=' * len(title)
-    yield ''
-
-
-def openapihttpdomain(spec, **options):
-    generators = []
+def _groups(spec, options):
+    # https://github.com/OAI/OpenAPI-Specification/blob/3.0.2/versions/3.0.0.md#paths-object
+    if 'group' in options:
+        return _model.group_operations(spec, options).items()
+    return [(None, _model.select_operations(spec, options))]
+
+
+def _operation_markup(spec, options, markup):
+    return markup(
+        utils.get_text_converter(options),
+        render_examples='examples' in options,
+        render_request='request' in options,
+        max_depth=utils.get_schema_depth(options),
+        generated=spec.derive('examples', _build_generated_examples))
+
+
+def render_chunks(spec, render_cache, options, markup=_OperationMarkup):
+    """Render a given normalized OpenAPI 3.0 spec into chunks of markup.
+
+    Operations are rendered by a given subclass of :class:`_OperationMarkup`,
+    so specs converted from OpenAPI 2.0 are rendered the way they used to.
+    """
+    operation_markup = _operation_markup(spec, options, markup)
+
+    def _render(operation):
+        return _httpresource(operation, operation_markup)
+
+    def _chunks():
+        for key, operations in _groups(spec, options):
+            if key is not None:
+                yield _markup.to_lines(_markup.Header(key or 'default'))
+
+            for operation in operations:
+                yield _rendered.render_operation(
+                    render_cache, spec, operation, options, _render)
 
+    return _chunks()
+
+
+def render_items(spec, options, markup=_OperationMarkup):
+    """Render a given normalized OpenAPI 3.0 spec into blocks of markup.
+
+    Each item is either a :class:`_markup.Header` of a group of operations
+    or a :class:`_markup.Resource` describing an operation.
+    """
+    operation_markup = _operation_markup(spec, options, markup)
+
+    for key, operations in _groups(spec, options):
+        if key is not None:
+            yield _markup.Header(key or 'default')
+
+        for operation in operations:
+            yield operation_markup.render(operation)
+
+
+def openapihttpdomain_chunks(spec, render_cache=None, **options):
+    """Render a given spec into chunks of markup.
+
+    Each chunk is either a header of a group of operations or an operation.
+    Chunks are rendered one by one, as they are consumed.
+    """
     # OpenAPI spec may contain JSON references, common properties, etc.
     # Trying to render the spec "As Is" will require to put multiple
     # if-s around the code. In order to simplify flow, let's make the
     # spec to have only one (expected) schema, i.e. normalize it.
-    utils.normalize_spec(spec, **options)
-
-    # Paths list to be processed
-    paths = []
-
-    # If 'paths' are passed we've got to ensure they exist within an OpenAPI
-    # spec; otherwise raise error and ask user to fix that.
-    if 'paths' in options:
-        if not set(options['paths']).issubset(spec['paths']):
-            raise ValueError(
-                'One or more paths are not defined in the spec: %s.' % (
-                    ', '.join(set(options['paths']) - set(spec['paths'])),
-                )
-            )
-        paths = options['paths']
-
-    # Check against regular expressions to be included
-    if 'include' in options:
-        for i in options['include']:
-            ir = re.compile(i)
-            for path in spec['paths']:
-                if ir.match(path):
-                    paths.append(path)
-
-    # If no include nor paths option, then take full path
-    if 'include' not in options and 'paths' not in options:
-        paths = spec['paths']
-
-    # Remove paths matching regexp
-    if 'exclude' in options:
-        _paths = []
-        for e in options['exclude']:
-            er = re.compile(e)
-            for path in paths:
-                if not er.match(path):
-                    _paths.append(path)
-        paths = _paths
-
-    render_request = False
-    if 'request' in options:
-        render_request = True
-
-    convert = utils.get_text_converter(options)
+    spec = utils._normalized(spec, options.get('uri', ''), options=options)
+    return render_chunks(spec, render_cache, options)
 
-    # https://github.com/OAI/OpenAPI-Specification/blob/3.0.2/versions/3.0.0.md#paths-object
-    if 'group' in options:
-        groups = collections.OrderedDict(
-            [(x['name'], []) for x in spec.get('tags', {})]
-            )
-
-        for endpoint in paths:
-            for method, properties in spec['paths'][endpoint].items():
-                key = properties.get('tags', [''])[0]
-                groups.setdefault(key, []).append(_httpresource(
-                    endpoint,
-                    method,
-                    properties,
-                    convert,
-                    render_examples='examples' in options,
-                    render_request=render_request))
-
-        for key in groups.keys():
-            if key:
-                generators.append(_header(key))
-            else:
-                generators.append(_header('default'))
 
-            generators.extend(groups[key])
-    else:
-        for endpoint in paths:
-            for method, properties in spec['paths'][endpoint].items():
-                generators.append(_httpresource(
-                    endpoint,
-                    method,
-                    properties,
-                    convert,
-                    render_examples='examples' in options,
-                    render_request=render_request))
-
-    return iter(itertools.chain(*generators))
+def openapihttpdomain_items(spec, **options):
+    """Render a given spec into headers and resources, one by one."""
+    spec = utils._normalized(spec, options.get('uri', ''), options=options)
+    return render_items(spec, options)
+
+
+def openapihttpdomain(spec, render_cache=None, **options):
+    return itertools.chain.from_iterable(
+        openapihttpdomain_chunks(spec, render_cache, **options))
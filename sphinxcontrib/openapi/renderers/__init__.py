@@ -2,9 +2,11 @@
 
 from . import abc
 from ._httpdomain_old import HttpdomainOldRenderer
+from ._httpdomain import HttpdomainRenderer
 
 
 __all__ = [
     "abc",
     "HttpdomainOldRenderer",
+    "HttpdomainRenderer",
 ]
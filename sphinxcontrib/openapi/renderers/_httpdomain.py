@@ -0,0 +1,351 @@
+"""Renderer that builds httpdomain nodes out of operations of a spec.
+
+:class:`~._httpdomain_old.HttpdomainOldRenderer` produces reStructuredText
+that is parsed back into nodes afterwards. Most of that markup is structure
+the renderer has just produced: directives, field lists and code blocks with
+examples, and the parser goes through each of them line by line, once per
+nesting level. This renderer builds the structure right away out of the very
+blocks the markup is produced from (see :mod:`sphinxcontrib.openapi._markup`),
+and passes only free-form text, such as descriptions, to the parser. The
+result is the same node tree either way.
+"""
+
+from docutils import nodes
+from docutils.parsers.rst import directives
+from docutils.statemachine import StringList
+from sphinx.directives import ObjectDescription
+from sphinx.util.nodes import nested_parse_with_titles
+
+from ._httpdomain_old import HttpdomainOldRenderer
+from .abc import append_parsed
+from .. import _markup
+
+
+_SOURCE = "<openapi>"
+
+
+def _is_line(text):
+    return "".join(text.splitlines()) == text
+
+
+def _is_field_name(name):
+    # Names of fields are read back from the markup as they are, unless they
+    # hold colons, backslashes or backquotes, or start or end with spaces.
+    return (
+        bool(name)
+        and name == name.strip()
+        and _is_line(name)
+        and not any(char in name for char in ":\\`")
+    )
+
+
+def _is_enumerator(word):
+    # Arabic numbers, letters and Roman numerals enumerate lists.
+    number = word[:-1]
+    return word[-1:] in (".", ")") and (
+        number.isdigit() or len(number) == 1 or set(number.lower()) <= set("ivxlcdm")
+    )
+
+
+def _is_paragraph(lines):
+    """Tell whether given lines of text surely make a single paragraph.
+
+    Block markup starts with punctuation or indentation, or with enumerators
+    of lists, so lines that start with letters or digits and do not end with
+    a literal block marker are nothing but a paragraph.
+    """
+    if not lines or _is_enumerator(lines[0].split(" ", 1)[0]):
+        return False
+    if lines[-1].rstrip().endswith("::"):
+        return False
+    return all(line[:1].isalnum() for line in lines)
+
+
+def _expects_literal(lines):
+    # Lines that follow a literal block marker are quoted literal blocks as
+    # long as they start with punctuation, as fields and titles do.
+    lines = [line for line in lines if line.strip()]
+    return bool(lines) and lines[-1].rstrip().endswith("::")
+
+
+def _has_adornment(lines):
+    """Tell whether given lines may make titles or transitions.
+
+    Whether content of directives may hold them depends on the version of
+    Sphinx, so lines that are nothing but a repeated punctuation character
+    are left for the parser.
+    """
+    for line in lines:
+        line = line.strip()
+        if line and line == line[0] * len(line) and not line[0].isalnum():
+            return True
+    return False
+
+
+def _common_indent(lines):
+    return min(
+        (len(line) - len(line.lstrip()) for line in lines if line.strip()),
+        default=0,
+    )
+
+
+def _content(lines):
+    """Return lines of an indented block, the way the parser reads them.
+
+    Blank lines that surround the block are stripped, and so is the
+    indentation the block's lines share.
+    """
+    start, end = 0, len(lines)
+    while start < end and not lines[start].strip():
+        start += 1
+    while end > start and not lines[end - 1].strip():
+        end -= 1
+    indent = _common_indent(lines[start:end])
+    content = StringList()
+    for offset, line in enumerate(lines[start:end]):
+        content.append(line[indent:], _SOURCE, start + offset)
+    return content
+
+
+class HttpdomainRenderer(HttpdomainOldRenderer):
+    """Render OpenAPI specs via httpdomain directives built in place.
+
+    The output is the same as the one of ``httpdomain:old`` renderer, and
+    the options are the same too.
+    """
+
+    renders_operations = True
+
+    def __init__(self, state, options, render_cache=None):
+        super().__init__(state, options, render_cache)
+        self._directives = {}
+
+    def render(self, spec):
+        # Content of descriptions is injected via 'transform_content()' hook
+        # that appeared in Sphinx 3.0.
+        if not hasattr(ObjectDescription, "transform_content"):
+            return super().render(spec)
+
+        spec, module = self._normalized(spec)
+        node = nodes.section()
+        node.document = self._state.document
+
+        for item in module.openapihttpdomain_items(spec, **self._options):
+            parsed = nodes.section()
+            parsed.document = self._state.document
+
+            if isinstance(item, _markup.Resource) and self._is_buildable(item):
+                parsed += self._build_resource(item)
+            else:
+                # Headers start sections, so they are parsed, and so are
+                # operations the markup would not describe as they are.
+                markup = StringList()
+                for line in _markup.to_lines(item):
+                    markup.append(line, _SOURCE)
+                nested_parse_with_titles(self._state, markup, parsed)
+
+            # Operations that follow a header end up in its section.
+            append_parsed(node, parsed.children)
+        return node.children
+
+    def _resource_directive(self, method):
+        try:
+            return self._directives[method]
+        except KeyError:
+            pass
+
+        env = self._state.document.settings.env
+        base = env.get_domain("http").directive(method)
+        if base is not None:
+
+            class _ResourceDirective(base):
+                def transform_content(self, contentnode):
+                    super().transform_content(contentnode)
+                    self.build_content(contentnode)
+
+            base = _ResourceDirective
+        self._directives[method] = base
+        return base
+
+    def _is_buildable(self, resource):
+        """Tell whether nodes of a given resource are the ones of its markup.
+
+        Pieces of markup such as paths or names of fields are single lines,
+        and some of them have to be within limits of what the parser reads
+        back, e.g. names of fields may not hold colons, and so is text that
+        expects a literal block. Otherwise, the markup is not what it's meant
+        to be, and it's left for the parser. So is text that may hold titles
+        or transitions, since it's parsed the way the running Sphinx parses
+        content of directives.
+        """
+        if (
+            self._resource_directive(resource.method) is None
+            or not resource.path.strip()
+            or not _is_line(resource.path)
+            or not _is_line(resource.synopsis)
+        ):
+            return False
+
+        for index, block in enumerate(resource.blocks, 1):
+            if isinstance(block, _markup.Strong):
+                if _has_adornment(["**%s**" % line for line in block.lines]):
+                    return False
+            elif isinstance(block, _markup.Text):
+                if _has_adornment(block.lines):
+                    return False
+                if index < len(resource.blocks) and _expects_literal(block.lines):
+                    return False
+            elif isinstance(block, _markup.Field):
+                if (
+                    not _is_field_name(block.name)
+                    or block.blocks
+                    and _expects_literal(block.lines)
+                    or not all(_is_line(code.title) for code in block.blocks)
+                ):
+                    return False
+            elif isinstance(block, _markup.InlineFields):
+                for name, text in block.fields:
+                    if not _is_field_name(name) or not _is_line(text):
+                        return False
+            elif isinstance(block, _markup.Code):
+                if not _is_line(block.title):
+                    return False
+            elif isinstance(block, _markup.Admonition):
+                if not _is_line(block.title) or not all(
+                    self._is_buildable(nested) for nested in block.resources
+                ):
+                    return False
+        return True
+
+    def _build_resource(self, resource):
+        # Options are read as they are, once leading spaces are stripped.
+        synopsis = resource.synopsis.lstrip(" ")
+        directive = self._resource_directive(resource.method)(
+            "http:%s" % resource.method,
+            [resource.path.strip()],
+            {"synopsis": synopsis if synopsis.strip() else None},
+            StringList(),
+            self._state.state_machine.abs_line_number(),
+            0,
+            "",
+            self._state,
+            self._state.state_machine,
+        )
+        directive.build_content = lambda contentnode: self._build_blocks(
+            resource.blocks, contentnode
+        )
+        return directive.run()
+
+    def _build_blocks(self, blocks, parent):
+        for block in blocks:
+            if isinstance(block, _markup.Strong):
+                self._build_strong(block.lines, parent)
+            elif isinstance(block, _markup.Text):
+                self._build_text(block.lines, parent)
+            elif isinstance(block, _markup.Field):
+                self._build_field(block, self._field_list(parent))
+            elif isinstance(block, _markup.InlineFields):
+                field_list = self._field_list(parent)
+                for name, text in block.fields:
+                    text = text.lstrip(" ")
+                    self._build_field(
+                        _markup.Field(name, [text] if text else [], ()), field_list
+                    )
+            elif isinstance(block, _markup.Code):
+                self._build_code(block, parent)
+            else:
+                self._build_admonition(block, parent)
+
+    def _field_list(self, parent):
+        # Fields go on with a field list that precedes them, even the one
+        # that ends a description, since they are separated by blank lines
+        # only.
+        if len(parent) and isinstance(parent[-1], nodes.field_list):
+            return parent[-1]
+        field_list = nodes.field_list()
+        parent += field_list
+        return field_list
+
+    def _build_paragraph(self, text, parent):
+        textnodes, messages = self._state.inline_text(text, 0)
+        parent += nodes.paragraph(text, "", *textnodes)
+        parent += messages
+
+    def _build_strong(self, lines, parent):
+        # Lines that are nothing but asterisks turn into something else.
+        if lines and all(line.strip("*") for line in lines):
+            self._build_paragraph("\n".join("**%s**" % line for line in lines), parent)
+        elif lines:
+            self._build_text(["**%s**" % line for line in lines], parent)
+
+    def _build_text(self, lines, parent):
+        if _is_paragraph(lines):
+            self._build_paragraph("\n".join(lines).rstrip(), parent)
+        elif any(line.strip() for line in lines):
+            content = StringList()
+            for offset, line in enumerate(lines):
+                content.append(line, _SOURCE, offset)
+            self._state.nested_parse(content, 0, parent)
+
+    def _build_field(self, field, field_list):
+        name_nodes, messages = self._state.inline_text(field.name, 0)
+        field_node = nodes.field()
+        field_node += nodes.field_name(field.name, "", *name_nodes)
+
+        # The body is indented as deep as its shallowest line, that is the
+        # one of titles of code blocks, if there are any.
+        if field.blocks:
+            lines = list(field.lines)
+        else:
+            lines = _content(field.lines).data
+        field_body = nodes.field_body("\n".join(lines), *messages)
+        field_node += field_body
+        field_list += field_node
+
+        self._build_text(lines, field_body)
+        for code in field.blocks:
+            self._build_code(code, field_body)
+
+    def _build_code(self, code, parent):
+        self._build_paragraph("**%s:**" % code.title, parent)
+
+        directive_cls, messages = directives.directive(
+            "sourcecode", self._state.memo.language, self._state.document
+        )
+        directive = directive_cls(
+            "sourcecode",
+            [code.language],
+            {},
+            _content(code.lines),
+            self._state.state_machine.abs_line_number(),
+            0,
+            "",
+            self._state,
+            self._state.state_machine,
+        )
+        parent += messages
+        parent += directive.run()
+
+    def _build_admonition(self, admonition, parent):
+        directive_cls, messages = directives.directive(
+            "admonition", self._state.memo.language, self._state.document
+        )
+        # The admonition is built with no content, and resources are built
+        # into it afterwards.
+        directive = directive_cls(
+            "admonition",
+            [admonition.title],
+            {},
+            StringList([""], _SOURCE),
+            self._state.state_machine.abs_line_number(),
+            0,
+            "",
+            self._state,
+            self._state.state_machine,
+        )
+        parent += messages
+        for node in directive.run():
+            if isinstance(node, nodes.admonition):
+                for resource in admonition.resources:
+                    node += self._build_resource(resource)
+            parent += node
@@ -19,6 +19,12 @@ class HttpdomainOldRenderer(abc.RestructuredTextRenderer):
         "exclude": lambda s: s.split(),
         # Endpoints to be included based on HTTP method names.
         "methods": lambda s: s.split(),
+        # Endpoints to be included based on tags. Tags must be line delimited,
+        # since they may contain whitespaces.
+        "tags": lambda s: [tag.strip() for tag in s.splitlines() if tag.strip()],
+        # Operations to be rendered based on their IDs. IDs must be whitespace
+        # delimited.
+        "operation-ids": lambda s: s.split(),
         # Render the request body structure when passed.
         "request": directives.flag,
         # Render request/response examples when passed.
@@ -28,27 +34,52 @@ class HttpdomainOldRenderer(abc.RestructuredTextRenderer):
         "group": directives.flag,
         # Markup format to render OpenAPI descriptions.
         "format": str,
+        # How deep nested schemas are rendered.
+        "schema-depth": directives.positive_int,
     }
 
-    def __init__(self, state, options):
+    # Nothing but operations selected by options is rendered, so documents
+    # need to be rebuilt only if these operations are changed. Such renderers
+    # are given a cache of markup of operations by the directive. The flag
+    # is looked up in the class itself, so subclasses have to opt in too.
+    renders_operations = True
+
+    def __init__(self, state, options, render_cache=None):
         self._state = state
         self._options = options
+        self._render_cache = render_cache
 
-    def render_restructuredtext_markup(self, spec):
+    def _normalized(self, spec):
+        """Return a given spec normalized, and a module rendering it."""
         # OpenAPI spec may contain JSON references, common properties, etc.
         # Trying to render the spec "As Is" will require to put multiple if-s
         # around the code. In order to simplify rendering flow, let's make it
-        # have only one (expected) schema, i.e. normalize it.
-        utils.normalize_spec(spec, **self._options)
+        # have only one (expected) schema, i.e. normalize it. Normalization
+        # is skipped for specs that have been normalized once already, and
+        # only paths to be rendered are normalized otherwise.
+        spec = utils._normalized(
+            spec, self._options.get("uri", ""), options=self._options
+        )
 
         # We support both OpenAPI 2.0 (f.k.a. Swagger) and OpenAPI 3.0.0, so
         # determine which version we are parsing here.
         spec_version = spec.get("openapi", spec.get("swagger", "2.0"))
         if spec_version.startswith("2."):
-            openapihttpdomain = openapi20.openapihttpdomain
+            return spec, openapi20
         elif spec_version.startswith("3."):
-            openapihttpdomain = openapi30.openapihttpdomain
+            return spec, openapi30
         else:
             raise ValueError("Unsupported OpenAPI version (%s)" % spec_version)
 
-        yield from openapihttpdomain(spec, **self._options)
+    def render_restructuredtext_chunks(self, spec):
+        spec, module = self._normalized(spec)
+
+        # Markup of operations that have been rendered already is reused, if
+        # there's a cache to look it up in.
+        return module.openapihttpdomain_chunks(
+            spec, render_cache=self._render_cache, **self._options
+        )
+
+    def render_restructuredtext_markup(self, spec):
+        for chunk in self.render_restructuredtext_chunks(spec):
+            yield from chunk
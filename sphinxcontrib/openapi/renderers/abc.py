@@ -36,11 +36,42 @@ class RestructuredTextRenderer(Renderer):
     """
 
     def render(self, spec):
-        viewlist = ViewList()
-        for line in self.render_restructuredtext_markup(spec):
-            viewlist.append(line, "<openapi>")
-
         node = nodes.section()
         node.document = self._state.document
-        nested_parse_with_titles(self._state, viewlist, node)
+
+        # Chunks are parsed one by one, so neither the whole markup nor the
+        # whole markup along with its nodes are kept in memory at once.
+        for chunk in self.render_restructuredtext_chunks(spec):
+            viewlist = ViewList()
+            for line in chunk:
+                viewlist.append(line, "<openapi>")
+
+            parsed = nodes.section()
+            parsed.document = self._state.document
+            nested_parse_with_titles(self._state, viewlist, parsed)
+            append_parsed(node, parsed.children)
         return node.children
+
+    def render_restructuredtext_chunks(self, spec):
+        """Render a given spec into chunks of markup to be parsed one by one.
+
+        Nodes parsed out of a chunk are placed as if the chunk is parsed
+        along with preceding ones, see :func:`append_parsed`. The whole
+        markup is a single chunk by default.
+        """
+        return [self.render_restructuredtext_markup(spec)]
+
+
+def append_parsed(node, children):
+    """Append nodes parsed out of a chunk of markup to a given node.
+
+    Sections are appended to the node itself, while other nodes end up in
+    the last (innermost) section if there's one, just as if the chunk is a
+    continuation of the markup parsed into the node so far.
+    """
+    for child in list(children):
+        parent = node
+        if not isinstance(child, nodes.section):
+            while len(parent) and isinstance(parent[-1], nodes.section):
+                parent = parent[-1]
+        parent += child
@@ -9,15 +9,167 @@
 """
 
 import collections
+import copy
+import functools
+import json
+import re
+from urllib import parse, request
+
+from sphinxcontrib.openapi import _cache
 
-import jsonschema
 try:
     from m2r import convert as convert_markdown
 except ImportError:
     convert_markdown = None
 
 
-def _resolve_refs(uri, spec):
+def _fetch_json(url):
+    with request.urlopen(url) as response:
+        return json.loads(response.read().decode('utf-8'))
+
+
+class _RefResolver(object):
+    """Resolve JSON references within a document.
+
+    Each reference target is resolved only once: resolved targets are
+    memoized by their absolute URI, and so are JSON pointer lookups. So
+    no matter how many times a target is referred, it's looked up and
+    walked through only once. Nothing but the nodes passed to
+    :meth:`resolve` and the targets they refer to is ever visited.
+
+    References back to their own ancestors (i.e. recursive schemas) are
+    left as they are, so the result never contains cycles. Renderers are
+    expected to treat such references as back-references.
+
+    External documents are fetched using ``handlers``, a mapping of URI
+    scheme to a callable that accepts a URL and returns a document.
+    Documents that are served via other schemes are expected to be JSON.
+    """
+
+    def __init__(self, uri, document, handlers=()):
+        self._base_uri, _ = parse.urldefrag(uri)
+        self._handlers = dict(handlers)
+        self._documents = {self._base_uri: document}
+        self._pointers = {}
+        self._targets = {}
+        self._walking = set()
+        self._visited = set()
+
+    def _get_document(self, url):
+        try:
+            return self._documents[url]
+        except KeyError:
+            pass
+
+        fetch = self._handlers.get(parse.urlsplit(url).scheme, _fetch_json)
+        document = self._documents[url] = fetch(url)
+        return document
+
+    def _lookup(self, url, pointer):
+        try:
+            return self._pointers[url, pointer]
+        except KeyError:
+            pass
+
+        node = self._get_document(url)
+        for token in filter(None, parse.unquote(pointer).split('/')):
+            token = token.replace('~1', '/').replace('~0', '~')
+            try:
+                if isinstance(node, list):
+                    token = int(token)
+                node = node[token]
+            except (TypeError, LookupError, ValueError):
+                raise ValueError(
+                    'Unresolvable JSON pointer: %r in %r' % (pointer, url))
+
+        self._pointers[url, pointer] = node
+        return node
+
+    def _follow(self, base_uri, ref):
+        """Return the target of a reference and the URL of its document.
+
+        Chains of references are followed till the end.
+        """
+        uri = parse.urljoin(base_uri, ref)
+        chain = []
+        while uri not in self._targets:
+            if uri in chain:
+                raise ValueError('Circular JSON reference: %r' % uri)
+            chain.append(uri)
+
+            url, pointer = parse.urldefrag(uri)
+            target = self._lookup(url, pointer)
+            if not isinstance(target, dict) or not isinstance(
+                    target.get('$ref'), str):
+                self._targets[uri] = (target, url)
+                break
+            uri = parse.urljoin(url, target['$ref'])
+
+        resolved = self._targets[uri]
+        for uri in chain:
+            self._targets[uri] = resolved
+        return resolved
+
+    def resolve(self, node, base_uri=None):
+        """Return a given node with references resolved.
+
+        The node is modified in-place unless it's a reference itself, in
+        which case the reference target is returned.
+        """
+        if base_uri is None:
+            base_uri = self._base_uri
+
+        if isinstance(node, dict) and isinstance(node.get('$ref'), str):
+            node, base_uri = self._follow(base_uri, node['$ref'])
+
+        if not isinstance(node, (dict, list)) or id(node) in self._visited:
+            return node
+
+        # Specs may be nested deeper than Python's recursion limit allows,
+        # hence the explicit stack. Each entry holds a node being walked
+        # through, i.e. an ancestor of nodes above it, and its children yet
+        # to be walked through.
+        visited, walking = self._visited, self._walking
+        visited.add(id(node))
+        walking.add(id(node))
+        stack = [(node, base_uri, _children(node))]
+
+        while stack:
+            parent, base_uri, children = stack[-1]
+            for key, child in children:
+                child_uri = base_uri
+                if isinstance(child, dict):
+                    ref = child.get('$ref')
+                    if isinstance(ref, str):
+                        target, child_uri = self._follow(base_uri, ref)
+                        # A reference to one of its own ancestors, i.e. a
+                        # cycle. It's left as is.
+                        if id(target) in walking:
+                            continue
+                        parent[key] = child = target
+                elif not isinstance(child, list):
+                    continue
+
+                if id(child) in visited or not isinstance(child, (dict, list)):
+                    continue
+
+                visited.add(id(child))
+                walking.add(id(child))
+                stack.append((child, child_uri, _children(child)))
+                break
+            else:
+                stack.pop()
+                walking.discard(id(parent))
+        return node
+
+
+def _children(node):
+    if isinstance(node, dict):
+        return iter(node.items())
+    return enumerate(node)
+
+
+def _resolve_refs(uri, spec, handlers=()):
     """Resolve JSON references in a given dictionary.
 
     OpenAPI spec may contain JSON references to its nodes or external
@@ -28,32 +180,98 @@ def _resolve_refs(uri, spec):
         https://tools.ietf.org/html/draft-pbryan-zyp-json-ref-02
 
     The input spec is modified in-place despite being returned from
-    the function.
+    the function. Custom functions to retrieve external documents may
+    be passed via ``handlers``, a mapping of URI scheme to a callable.
     """
-    resolver = jsonschema.RefResolver(uri, spec)
-
-    def _do_resolve(node):
-        if isinstance(node, collections.Mapping) and '$ref' in node:
-            with resolver.resolving(node['$ref']) as resolved:
-                return resolved
-        elif isinstance(node, collections.Mapping):
-            for k, v in node.items():
-                node[k] = _do_resolve(v)
-        elif isinstance(node, (list, tuple)):
-            for i in range(len(node)):
-                node[i] = _do_resolve(node[i])
-        return node
+    return _RefResolver(uri, spec, handlers).resolve(spec)
 
-    return _do_resolve(spec)
 
+# Top-level collections of reusable objects. They are used via references
+# only, so it's enough to resolve references to them from the rest of the
+# spec.
+_REUSABLE_OBJECTS = {
+    'components',
+    # OpenAPI 2.0 (f.k.a. Swagger)
+    'definitions',
+    'parameters',
+    'responses',
+    'securityDefinitions',
+}
 
-def normalize_spec(spec, **options):
-    # OpenAPI spec may contain JSON references, so we need resolve them
-    # before we access the actual values trying to build an httpdomain
-    # markup. Since JSON references may be relative, it's crucial to
-    # pass a document URI in order to properly resolve them.
-    spec = _resolve_refs(options.get('uri', ''), spec)
 
+def _resolve_used_refs(uri, spec, handlers=()):
+    """Resolve JSON references in a spec except unused reusable objects.
+
+    Specs may define thousands of reusable objects (e.g. schemas) while
+    just a fraction of them is used by the rest of the spec, and what's
+    more, by the paths to be rendered. Resolving references in the unused
+    ones is a waste of time.
+    """
+    resolver = _RefResolver(uri, spec, handlers)
+    for key, value in spec.items():
+        if key not in _REUSABLE_OBJECTS:
+            spec[key] = resolver.resolve(value)
+
+
+class _NormalizedSpec(collections.OrderedDict):
+    """OpenAPI spec that went through normalization already.
+
+    Normalization is expensive for big specs, so normalized specs are
+    marked with this type in order to skip normalizing them again.
+    """
+
+    def __reduce__(self):
+        # Derived structures are cheap to rebuild compared to loading, so
+        # there's no need to persist them.
+        return self.__class__, (), None, None, iter(self.items())
+
+    def derive(self, key, build, *args):
+        """Return a structure derived from the spec, building it only once.
+
+        Derived structures are shared by all users of the spec, so they
+        must not be modified. They live as long as the spec does, so their
+        sizes are counted along with the spec's, see :meth:`track_size`.
+        """
+        derived = vars(self).setdefault('_derived', {})
+        try:
+            return derived[key]
+        except KeyError:
+            value = derived[key] = build(self, *args)
+            self._track_derived(value)
+            return value
+
+    def _track_derived(self, value):
+        track = vars(self).get('_track_size')
+        if track is None:
+            return
+        # Specs derived from the spec (e.g. converted ones) have structures
+        # derived from them too.
+        if isinstance(value, _NormalizedSpec):
+            value.track_size(track)
+        track(_cache.sizeof(value))
+
+    def track_size(self, track):
+        """Report sizes of data derived from the spec to a given callable.
+
+        Sizes of structures derived so far are reported right away, and the
+        ones of structures derived later are reported once they're built.
+        """
+        vars(self)['_track_size'] = track
+        for value in vars(self).get('_derived', {}).values():
+            self._track_derived(value)
+
+    def account(self, obj):
+        """Count a given object derived from the spec along with the spec.
+
+        Derived structures that grow once they're built (e.g. caches) count
+        what they've grown by this way.
+        """
+        track = vars(self).get('_track_size')
+        if track is not None:
+            track(_cache.sizeof(obj))
+
+
+def _push_common_parameters(spec):
     # OpenAPI spec may contain common endpoint's parameters top-level.
     # In order to do not place if-s around the code to handle special
     # cases, let's normalize the spec and push common parameters inside
@@ -61,8 +279,228 @@ def normalize_spec(spec, **options):
     for endpoint in spec['paths'].values():
         parameters = endpoint.pop('parameters', [])
         for method in endpoint.values():
-            method.setdefault('parameters', [])
-            method['parameters'].extend(parameters)
+            # Parameters lists may be shared with a spec that's been pruned,
+            # so they are not extended in place.
+            method['parameters'] = method.get('parameters', []) + parameters
+
+
+@functools.lru_cache(maxsize=256)
+def _compile_patterns(patterns):
+    """Compile regular expressions, once for each tuple of them.
+
+    Patterns are compiled one by one rather than joined, since they may
+    hold global flags or backreferences.
+    """
+    return tuple(re.compile(pattern) for pattern in patterns)
+
+
+def _matches_any(patterns, path):
+    return any(pattern.match(path) for pattern in patterns)
+
+
+_PATH_TEMPLATE = re.compile(r'{[^}/]*}')
+
+
+def _path_key(path):
+    # Path templates are looked up regardless of their parameter names.
+    return tuple(_PATH_TEMPLATE.sub('{}', segment) for segment in path.split('/'))
+
+
+class _PathTrie(object):
+    """Index of paths by their segments.
+
+    Paths are looked up either by a path with possibly differently named
+    templated parameters (e.g. ``/users/{user_id}`` finds ``/users/{id}``),
+    or by a prefix (e.g. ``/billing/**`` finds ``/billing`` and all the
+    paths under it). Looking up a prefix costs the number of paths under it.
+    """
+
+    def __init__(self, paths):
+        self._order = {}
+        # A node is a pair of its children keyed by segments, and paths
+        # that end at the node.
+        self._root = ({}, [])
+        for path in paths:
+            self._order[path] = len(self._order)
+            node = self._root
+            for segment in _path_key(path):
+                node = node[0].setdefault(segment, ({}, []))
+            node[1].append(path)
+
+    def __sizeof__(self):
+        return (
+            object.__sizeof__(self)
+            + _cache.sizeof(self._order)
+            + _cache.sizeof(self._root))
+
+    def _find(self, path):
+        node = self._root
+        for segment in _path_key(path):
+            node = node[0].get(segment)
+            if node is None:
+                return None
+        return node
+
+    def match(self, pattern):
+        """Return paths matching a given pattern in the order they are defined.
+
+        Returns an empty list if there are no such paths.
+        """
+        if pattern.endswith('/**'):
+            node = self._find(pattern[:-len('/**')])
+            if node is None:
+                return []
+
+            matched, stack = [], [node]
+            while stack:
+                node = stack.pop()
+                matched.extend(node[1])
+                stack.extend(node[0].values())
+            return sorted(matched, key=self._order.__getitem__)
+
+        node = self._find(pattern)
+        return list(node[1]) if node is not None else []
+
+
+def _build_path_trie(spec):
+    return _PathTrie(spec['paths'])
+
+
+def _get_path_trie(spec):
+    """Return the trie of paths of a given normalized spec."""
+    return spec.derive('path-trie', _build_path_trie)
+
+
+def _select_paths(paths, options, trie=None):
+    """Return paths to be rendered according to given options.
+
+    Paths are returned in the order they are to be rendered in, each path
+    once. Each path is matched against each kind of patterns once. Paths
+    passed via ``paths`` option that are not defined are looked up in a
+    given trie of paths, which is built if not passed.
+    """
+    selected = []
+
+    # If 'paths' are passed we've got to ensure they exist within an OpenAPI
+    # spec; otherwise raise error and ask user to fix that.
+    if 'paths' in options:
+        undefined = []
+        for path in options['paths']:
+            if path in paths:
+                selected.append(path)
+                continue
+
+            if trie is None:
+                trie = _PathTrie(paths)
+            matched = trie.match(path)
+            if not matched:
+                undefined.append(path)
+            selected.extend(matched)
+
+        if undefined:
+            raise ValueError(
+                'One or more paths are not defined in the spec: %s.' % (
+                    ', '.join(undefined),
+                )
+            )
+
+    # Check against regular expressions to be included
+    if 'include' in options:
+        include = _compile_patterns(tuple(options['include']))
+        selected.extend(path for path in paths if _matches_any(include, path))
+
+    # If no include nor paths option, then take full path
+    if 'include' not in options and 'paths' not in options:
+        selected = paths
+
+    # Remove paths matching regexp
+    exclude = _compile_patterns(tuple(options.get('exclude', ())))
+    return [
+        path for path in collections.OrderedDict.fromkeys(selected)
+        if not _matches_any(exclude, path)
+    ]
+
+
+_HTTP_METHODS = {
+    'get', 'put', 'post', 'delete', 'options', 'head', 'patch', 'trace'}
+
+
+def _pruned(spec, options):
+    """Return a copy of a given spec with only paths to be rendered.
+
+    Path items and operations are copied, so normalizing the copy does not
+    affect the spec. Other nodes are shared though.
+    """
+    selected = set(_select_paths(spec['paths'], options))
+    methods = options.get('methods')
+
+    # Operations selected by IDs are looked up without resolving anything,
+    # so path items that are references themselves are kept just in case.
+    operation_ids = options.get('operation-ids')
+    if operation_ids and 'paths' not in options and 'include' not in options:
+        operation_ids = set(operation_ids)
+        selected = {
+            path for path in selected
+            if '$ref' in spec['paths'][path] or any(
+                isinstance(operation, dict)
+                and operation.get('operationId') in operation_ids
+                for operation in spec['paths'][path].values())
+        }
+
+    pruned = copy.copy(spec)
+    pruned['paths'] = collections.OrderedDict()
+    for path, path_item in spec['paths'].items():
+        if path not in selected:
+            continue
+
+        pruned['paths'][path] = collections.OrderedDict(
+            (key, copy.copy(value) if key in _HTTP_METHODS else value)
+            for key, value in path_item.items()
+            if not methods or key not in _HTTP_METHODS or key in methods
+        )
+    return pruned
+
+
+def _normalized(spec, uri, handlers=(), options=None):
+    """Return a normalized version of a given spec.
+
+    Unlike :func:`normalize_spec`, the result is marked as normalized and
+    thus passing it to :func:`normalize_spec` is a no-op. If rendering
+    ``options`` are passed, only paths and operations selected by them are
+    normalized and kept, as well as objects they refer to. The spec itself
+    is not modified in this case except for the objects being resolved.
+    """
+    if isinstance(spec, _NormalizedSpec):
+        return spec
+
+    if options is not None:
+        spec = _pruned(spec, options)
+
+    _resolve_used_refs(uri, spec, handlers)
+    _push_common_parameters(spec)
+    return _NormalizedSpec(spec)
+
+
+def normalize_spec(spec, **options):
+    if isinstance(spec, _NormalizedSpec):
+        return
+
+    # OpenAPI spec may contain JSON references, so we need resolve them
+    # before we access the actual values trying to build an httpdomain
+    # markup. Since JSON references may be relative, it's crucial to
+    # pass a document URI in order to properly resolve them.
+    _resolve_used_refs(options.get('uri', ''), spec)
+    _push_common_parameters(spec)
+
+
+# Schemas are rarely nested deeper than that, yet graphs of schemas that
+# refer to each other may expand into huge trees if rendered in full.
+_DEFAULT_SCHEMA_DEPTH = 16
+
+
+def get_schema_depth(options):
+    """Decide on how deep schemas are rendered."""
+    return options.get('schema-depth', _DEFAULT_SCHEMA_DEPTH)
 
 
 def get_text_converter(options):
@@ -0,0 +1,176 @@
+"""Compare rendering time of httpdomain renderers on a large spec.
+
+Usage: python tests/benchmark_render.py [number-of-paths]
+
+Each renderer renders the same generated spec, with examples, into a fresh
+Sphinx project. Both time spent by renderers and the whole time of reading
+sources are reported, since the latter includes Sphinx transforms that run
+no matter which renderer is used.
+"""
+
+import json
+import sys
+import tempfile
+import textwrap
+import time
+
+import py
+from sphinx.application import Sphinx
+
+from sphinxcontrib.openapi import renderers
+
+
+_RENDERERS = {
+    "httpdomain:old": renderers.HttpdomainOldRenderer,
+    "httpdomain": renderers.HttpdomainRenderer,
+}
+
+
+def _generate_spec(nb_paths):
+    pet = {
+        "type": "object",
+        "properties": {
+            "id": {"type": "integer", "readOnly": True},
+            "name": {"type": "string"},
+            "tags": {"type": "array", "items": {"type": "string"}},
+            "owner": {
+                "type": "object",
+                "properties": {
+                    "name": {"type": "string"},
+                    "email": {"type": "string", "format": "email"},
+                },
+            },
+        },
+    }
+    paths = {}
+    for index in range(nb_paths):
+        paths["/resources%d/{id}" % index] = {
+            "parameters": [
+                {
+                    "name": "id",
+                    "in": "path",
+                    "description": "Resource identifier.",
+                    "schema": {"type": "integer"},
+                }
+            ],
+            "get": {
+                "summary": "Get resource %d" % index,
+                "description": "Returns a *resource* by its ID.",
+                "parameters": [
+                    {
+                        "name": "fields",
+                        "in": "query",
+                        "description": "Fields to return.",
+                        "schema": {"type": "string"},
+                    }
+                ],
+                "responses": {
+                    "200": {
+                        "description": "The resource.",
+                        "headers": {"ETag": {"description": "Version."}},
+                        "content": {
+                            "application/json": {
+                                "schema": {"$ref": "#/components/schemas/Pet"},
+                            },
+                        },
+                    },
+                    "404": {"description": "No such resource."},
+                },
+            },
+            "put": {
+                "summary": "Update resource %d" % index,
+                "requestBody": {
+                    "content": {
+                        "application/json": {
+                            "schema": {"$ref": "#/components/schemas/Pet"},
+                        },
+                    },
+                },
+                "responses": {"204": {"description": "Updated."}},
+            },
+        }
+
+    return {
+        "openapi": "3.0.0",
+        "info": {"title": "Benchmark", "version": "1.0"},
+        "paths": paths,
+        "components": {"schemas": {"Pet": pet}},
+    }
+
+
+def _build(spec, renderer):
+    tmpdir = py.path.local(tempfile.mkdtemp())
+    src = tmpdir.ensure("src", dir=True)
+    src.join("spec.json").write_text(json.dumps(spec), "utf-8")
+    src.join("conf.py").write_text(
+        textwrap.dedent(
+            """
+        extensions = ['sphinxcontrib.openapi']
+        master_doc = 'index'
+    """
+        ),
+        "utf-8",
+    )
+    src.join("index.rst").write_text(
+        ".. openapi:%s:: spec.json\n   :examples:\n" % renderer, "utf-8"
+    )
+
+    app = Sphinx(
+        srcdir=src.strpath,
+        confdir=src.strpath,
+        outdir=tmpdir.join("out").strpath,
+        doctreedir=tmpdir.join("doctrees").strpath,
+        buildername="dummy",
+        status=None,
+        warning=sys.stderr,
+    )
+
+    rendering = []
+    render = _RENDERERS[renderer].render
+
+    def _timed_render(self, spec):
+        started = time.perf_counter()
+        try:
+            return render(self, spec)
+        finally:
+            rendering.append(time.perf_counter() - started)
+
+    _RENDERERS[renderer].render = _timed_render
+    try:
+        started = time.perf_counter()
+        list(app.builder.read())
+        elapsed = time.perf_counter() - started
+    finally:
+        _RENDERERS[renderer].render = render
+
+    tmpdir.remove()
+    return sum(rendering), elapsed
+
+
+def main():
+    nb_paths = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    spec = _generate_spec(nb_paths)
+
+    # Warm up, so imports and such are not counted.
+    _build(_generate_spec(1), "httpdomain:old")
+
+    timings = {}
+    print("%-16s %10s %10s" % ("", "rendering", "reading"))
+    for renderer in ("httpdomain:old", "httpdomain"):
+        timings[renderer] = min(_build(spec, renderer) for _ in range(3))
+        print("%-16s %9.3fs %9.3fs" % ((renderer,) + timings[renderer]))
+
+    print(
+        "%-16s %9.2fx %9.2fx"
+        % (
+            ("speedup",)
+            + tuple(
+                old / new
+                for old, new in zip(timings["httpdomain:old"], timings["httpdomain"])
+            )
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
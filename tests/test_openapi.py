@@ -9,14 +9,31 @@
 """
 
 import os
+import copy
+import json
+import pickle
 import textwrap
 import collections
 
 import py
 import pytest
-
+import yaml
+from docutils.parsers.rst.states import RSTState
+from sphinx.application import Sphinx
+from sphinxcontrib import httpdomain
+
+from sphinxcontrib.openapi import _cache
+from sphinxcontrib.openapi import _documents
+from sphinxcontrib.openapi import _lazy
+from sphinxcontrib.openapi import _markup
+from sphinxcontrib.openapi import _model
+from sphinxcontrib.openapi import _rendered
+from sphinxcontrib.openapi import _schemas
+from sphinxcontrib.openapi import _upconvert
+from sphinxcontrib.openapi import directive
 from sphinxcontrib.openapi import renderers
 from sphinxcontrib.openapi import openapi20
+from sphinxcontrib.openapi import openapi30
 from sphinxcontrib.openapi import utils
 
 
@@ -652,6 +669,173 @@ class TestOpenApi2HttpDomain(object):
         ''').lstrip()
         assert text == text2
 
+    def test_examples(self):
+        renderer = renderers.HttpdomainOldRenderer(None, {'examples': True})
+        text = '\n'.join(renderer.render_restructuredtext_markup({
+            'swagger': '2.0',
+            'produces': ['application/json'],
+            'paths': {
+                '/pets': {
+                    'get': {
+                        'parameters': [{
+                            'name': 'tags',
+                            'in': 'query',
+                            'required': True,
+                            'type': 'array',
+                            'items': {'type': 'string'},
+                            'collectionFormat': 'multi',
+                            'description': 'Tags to filter by.',
+                        }],
+                        'responses': {
+                            '200': {
+                                'description': 'Pets.',
+                                'schema': {
+                                    'type': 'array',
+                                    'items': {
+                                        'type': 'object',
+                                        'properties': {
+                                            'name': {'type': 'string'},
+                                        },
+                                    },
+                                },
+                            },
+                            '404': {
+                                'description': 'No pets.',
+                                'examples': {'text/plain': 'Not found'},
+                            },
+                        },
+                    },
+                },
+            },
+        }))
+
+        assert text == textwrap.dedent('''
+            .. http:get:: /pets
+               :synopsis: null
+
+               :query array tags:
+                  Tags to filter by.
+                  (Required)
+
+               **Example request:**
+
+               .. sourcecode:: http
+
+                  GET /pets?tags=string HTTP/1.1
+                  Host: example.com
+
+               :status 200:
+                  Pets.
+
+                  **Example response:**
+
+                  .. sourcecode:: http
+
+                     HTTP/1.1 200 OK
+                     Content-Type: application/json
+
+                     [
+                         {
+                             "name": "string"
+                         }
+                     ]
+
+               :status 404:
+                  No pets.
+
+                  **Example response:**
+
+                  .. sourcecode:: http
+
+                     HTTP/1.1 404 Not Found
+                     Content-Type: text/plain
+
+                     Not found
+
+
+               :>json string [].name:
+
+        ''').lstrip()
+
+    def test_file_response_example(self):
+        spec = {
+            'swagger': '2.0',
+            'produces': ['application/json'],
+            'paths': {
+                '/photo': {
+                    'get': {
+                        'responses': {
+                            '200': {
+                                'description': 'Photo.',
+                                'schema': {'type': 'file'},
+                            },
+                        },
+                    },
+                },
+            },
+        }
+        pristine = copy.deepcopy(spec)
+        renderer = renderers.HttpdomainOldRenderer(None, {'examples': True})
+        text = '\n'.join(renderer.render_restructuredtext_markup(spec))
+
+        assert '\n'.join([
+            '   :status 200:',
+            '      Photo.',
+            '',
+            '      **Example response:**',
+            '',
+            '      .. sourcecode:: http',
+            '',
+            '         HTTP/1.1 200 OK',
+            '         Content-Type: application/json',
+            '',
+            '         01010101',
+        ]) in text
+        assert spec == pristine
+
+    def test_request_option(self):
+        renderer = renderers.HttpdomainOldRenderer(None, {'request': True})
+        text = '\n'.join(renderer.render_restructuredtext_markup({
+            'swagger': '2.0',
+            'paths': {
+                '/pets': {
+                    'post': {
+                        'parameters': [{
+                            'name': 'body',
+                            'in': 'body',
+                            'schema': {
+                                'type': 'object',
+                                'properties': {'name': {'type': 'string'}},
+                            },
+                        }],
+                        'responses': {'201': {'description': 'Created.'}},
+                    },
+                },
+            },
+        }))
+
+        assert text == textwrap.dedent('''
+            .. http:post:: /pets
+               :synopsis: null
+
+
+               :<json string name:
+
+
+               **Request body:**
+
+               .. sourcecode:: json
+
+                  {
+                    "name":{
+                      "type":"string"
+                    }
+                  }
+
+               :status 201:
+                  Created.
+        ''').lstrip()
+
 
 class TestOpenApi3HttpDomain(object):
 
@@ -1529,6 +1713,105 @@ class TestOpenApi3HttpDomain(object):
 
         ''').lstrip()
 
+    def test_nested_callbacks(self):
+        renderer = renderers.HttpdomainOldRenderer(None, {'examples': True})
+        text = '\n'.join(renderer.render_restructuredtext_markup({
+            'openapi': '3.0.0',
+            'paths': {
+                '/hooks': {
+                    'post': {
+                        'responses': {'201': {'description': 'Subscribed'}},
+                        'callbacks': {
+                            'event': {
+                                '{$request.body#/url}': {
+                                    'post': {
+                                        'parameters': [{
+                                            'name': 'X-Event',
+                                            'in': 'header',
+                                            'required': True,
+                                            'description': 'Event name.',
+                                        }],
+                                        'responses': {
+                                            '200': {
+                                                'description': 'Delivered',
+                                                'content': {
+                                                    'application/json': {
+                                                        'example': {'ok': True},
+                                                    },
+                                                },
+                                            },
+                                        },
+                                        'callbacks': {
+                                            'ack': {
+                                                '/ack': {
+                                                    'get': {
+                                                        'responses': {
+                                                            '204': {
+                                                                'description':
+                                                                    'Acknowledged',
+                                                            },
+                                                        },
+                                                    },
+                                                },
+                                            },
+                                        },
+                                    },
+                                },
+                            },
+                        },
+                    },
+                },
+            },
+        }))
+        assert text == textwrap.dedent('''
+            .. http:post:: /hooks
+               :synopsis: null
+
+               :status 201:
+                  Subscribed
+
+               .. admonition:: Callback: event
+
+                  .. http:post:: {$request.body#/url}
+                     :synopsis: null
+
+                     :status 200:
+                        Delivered
+
+                        **Example response:**
+
+                        .. sourcecode:: http
+
+                           HTTP/1.1 200 OK
+                           Content-Type: application/json
+
+                           {
+                               "ok": true
+                           }
+
+                     :reqheader X-Event:
+                        Event name.
+                        (Required)
+
+                     .. admonition:: Callback: ack
+
+                        .. http:get:: /ack
+                           :synopsis: null
+
+
+                           **Example request:**
+
+                           .. sourcecode:: http
+
+                              GET /ack HTTP/1.1
+                              Host: example.com
+
+                           :status 204:
+                              Acknowledged
+
+
+        ''').lstrip()
+
     def test_method_option(self):
         spec = collections.defaultdict(collections.OrderedDict)
         spec['paths']['/resource_a'] = {
@@ -1571,6 +1854,91 @@ class TestOpenApi3HttpDomain(object):
                   ok
         ''').lstrip()
 
+    def test_recursive_schema(self):
+        renderer = renderers.HttpdomainOldRenderer(
+            None, {'examples': True, 'request': True})
+        text = '\n'.join(renderer.render_restructuredtext_markup({
+            'openapi': '3.0.0',
+            'paths': {
+                '/nodes': {
+                    'post': {
+                        'requestBody': {
+                            'content': {
+                                'application/json': {
+                                    'schema': {
+                                        '$ref': '#/components/schemas/Node',
+                                    },
+                                },
+                            },
+                        },
+                        'responses': {'201': {'description': 'created'}},
+                    },
+                },
+            },
+            'components': {
+                'schemas': {
+                    'Node': {
+                        'type': 'object',
+                        'properties': {
+                            'name': {'type': 'string'},
+                            'children': {
+                                'type': 'array',
+                                'items': {
+                                    '$ref': '#/components/schemas/Node',
+                                },
+                            },
+                        },
+                    },
+                },
+            },
+        }))
+
+        assert textwrap.indent(textwrap.dedent('''
+            **Request body:**
+
+            .. sourcecode:: json
+
+               {
+                 "name":{
+                   "type":"string"
+                 },
+                 "children":{
+                   "type":"array",
+                   "items":{
+                     "$ref":"#/components/schemas/Node"
+                   }
+                 }
+               }
+        '''), '   ') in text
+        assert textwrap.indent(textwrap.dedent('''
+            {
+                "name": "string",
+                "children": [
+                    {
+                        "$ref": "#/components/schemas/Node"
+                    }
+                ]
+            }
+        '''), '      ') in text
+
+    def test_schema_depth_option(self):
+        schema = {
+            'type': 'object',
+            'properties': {
+                'a': {
+                    'type': 'object',
+                    'properties': {
+                        'b': {'type': 'array', 'items': {'type': 'string'}},
+                    },
+                },
+            },
+        }
+
+        assert openapi30._parse_schema(schema, None, max_depth=2) == {
+            'a': {'b': []}}
+        assert openapi30._parse_schema(schema, None, max_depth=1) == {
+            'a': {}}
+
 
 class TestResolveRefs(object):
 
@@ -1623,6 +1991,135 @@ class TestResolveRefs(object):
             }
         }
 
+    def test_ref_chain_resolving(self):
+        data = {
+            'a': {'$ref': '#/b'},
+            'b': {'$ref': '#/c'},
+            'c': {'d': 1},
+            'e': {'$ref': '#/a'},
+        }
+
+        resolved = utils._resolve_refs('', data)
+        assert resolved == {'a': {'d': 1}, 'b': {'d': 1}, 'c': {'d': 1},
+                            'e': {'d': 1}}
+        assert resolved['e'] is resolved['c']
+
+    def test_targets_are_resolved_once(self, monkeypatch):
+        data = {
+            'defs': {'a': {'b': {'$ref': '#/defs/c'}}, 'c': {'d': 1}},
+            'x': [{'$ref': '#/defs/a'}, {'$ref': '#/defs/a'}],
+        }
+        resolver = utils._RefResolver('', data)
+        lookups = []
+        lookup = resolver._lookup
+        monkeypatch.setattr(
+            resolver, '_lookup',
+            lambda *args: lookups.append(args) or lookup(*args))
+
+        resolver.resolve(data['x'])
+        assert data['x'][0] is data['x'][1] is data['defs']['a']
+        assert data['defs']['a'] == {'b': {'d': 1}}
+        assert lookups == [('', '/defs/a'), ('', '/defs/c')]
+
+    def test_unused_reusable_objects_are_not_resolved(self):
+        spec = utils._normalized({
+            'openapi': '3.0.0',
+            'paths': {
+                '/': {
+                    'get': {
+                        'responses': {
+                            '200': {'$ref': '#/components/responses/ok'},
+                        },
+                    },
+                },
+            },
+            'components': {
+                'responses': {
+                    'ok': {'description': {'$ref': '#/components/x/ok'}},
+                    'unused': {'$ref': '#/components/x/unused'},
+                },
+                'x': {'ok': 'ok'},
+            },
+        }, '')
+
+        assert spec['paths']['/']['get']['responses']['200'] == {
+            'description': 'ok'}
+        assert spec['components']['responses']['unused'] == {
+            '$ref': '#/components/x/unused'}
+
+    def test_external_document_refs_are_relative_to_it(self, tmpdir):
+        tmpdir.ensure('schemas', dir=True).join('pet.json').write_text(
+            json.dumps({
+                'Pet': {'properties': {'tag': {'$ref': 'tag.json#/Tag'}}},
+            }), 'utf-8')
+        tmpdir.join('schemas', 'tag.json').write_text(
+            json.dumps({'Tag': {'type': 'string'}}), 'utf-8')
+
+        data = {'pet': {'$ref': 'schemas/pet.json#/Pet'}}
+        resolved = utils._resolve_refs(
+            'file://%s' % tmpdir.join('spec.yml').strpath, data)
+
+        assert resolved == {
+            'pet': {'properties': {'tag': {'type': 'string'}}}}
+
+    def test_recursive_ref_is_kept(self):
+        data = {
+            'defs': {
+                'Node': {
+                    'properties': {
+                        'children': {
+                            'items': {'$ref': '#/defs/Node'},
+                        },
+                    },
+                },
+            },
+            'node': {'$ref': '#/defs/Node'},
+        }
+
+        resolved = utils._resolve_refs('', data)
+        assert resolved['node'] is resolved['defs']['Node']
+        assert resolved['node'] == {
+            'properties': {
+                'children': {'items': {'$ref': '#/defs/Node'}},
+            },
+        }
+
+    def test_deeply_nested_spec(self):
+        data = node = {}
+        for _ in range(10000):
+            node['a'] = {}
+            node = node['a']
+        node['b'] = {'$ref': '#/c'}
+        data['c'] = 1
+
+        utils._resolve_refs('', data)
+        assert node == {'b': 1}
+
+    def test_only_references_are_written(self):
+        class _ReadOnly(dict):
+            def __setitem__(self, key, value):
+                raise AssertionError('%r must not be written' % key)
+
+        data = {
+            'a': _ReadOnly(b=_ReadOnly(c=[1, 2]), d='e'),
+            'f': {'g': {'$ref': '#/a/d'}},
+        }
+
+        utils._resolve_refs('', data)
+        assert data['f'] == {'g': 'e'}
+
+    def test_circular_ref_chain(self):
+        with pytest.raises(ValueError) as excinfo:
+            utils._resolve_refs('', {'a': {'$ref': '#/b'}, 'b': {'$ref': '#/a'}})
+
+        assert 'Circular JSON reference' in str(excinfo.value)
+
+    def test_unresolvable_ref(self):
+        with pytest.raises(ValueError) as excinfo:
+            utils._resolve_refs('', {'a': {'$ref': '#/b/c'}})
+
+        assert 'Unresolvable JSON pointer' in str(excinfo.value)
+
     def test_noproperties(self):
         renderer = renderers.HttpdomainOldRenderer(None, {'examples': True})
         text = '\n'.join(renderer.render_restructuredtext_markup({
@@ -1683,7 +2180,1801 @@ class TestResolveRefs(object):
         ''').lstrip()
 
 
-def test_openapi2_examples(tmpdir, run_sphinx):
+class TestLoadSpec(object):
+
+    text = textwrap.dedent('''
+        {
+            "openapi": "3.0.0",
+            "paths": {
+                "/b": {"get": {"x-float": 1.5E+3, "x-str": 1e5}},
+                "/a": {"get": {"x-int": 42, "x-nan": NaN, "x-null": null}}
+            }
+        }
+    ''')
+
+    def test_json_is_loaded_as_yaml(self):
+        spec = directive._load_spec(self.text)
+
+        assert spec == yaml.load(self.text, directive._YamlOrderedLoader)
+        assert list(spec['paths']) == ['/b', '/a']
+        assert isinstance(spec['paths'], collections.OrderedDict)
+
+    def test_yaml_is_loaded_as_before(self):
+        text = textwrap.dedent('''
+            openapi: 3.0.0
+            paths:
+              /b: {get: {x-float: 1.5E+3}}
+              /a:
+                get:
+                  x-int: 42
+        ''')
+        spec = directive._load_spec(text)
+
+        assert spec == yaml.load(text, directive._YamlOrderedLoader)
+        assert list(spec['paths']) == ['/b', '/a']
+        assert isinstance(spec['paths']['/a'], collections.OrderedDict)
+
+    def test_yaml_flow_mapping(self):
+        text = '{openapi: 3.0.0, paths: {}}'
+
+        assert directive._load_spec(text) == {'openapi': '3.0.0', 'paths': {}}
+
+
+class TestDiskCache(object):
+
+    @pytest.fixture(scope='function')
+    def spec(self, tmpdir):
+        tmpdir.join('common.yml').write_text(textwrap.dedent('''
+            Resource:
+              type: object
+        '''), encoding='utf-8')
+
+        spec = tmpdir.join('spec.yml')
+        spec.write_text(textwrap.dedent('''
+            openapi: 3.0.0
+            paths:
+              /resources:
+                get:
+                  responses:
+                    '200':
+                      description: ok
+                      content:
+                        application/json:
+                          schema:
+                            $ref: 'common.yml#/Resource'
+        '''), encoding='utf-8')
+        return spec
+
+    @pytest.fixture(scope='function')
+    def load(self, tmpdir):
+        cache = _cache.DiskCache(tmpdir.join('cache').strpath)
+
+        def load(spec):
+            return directive._load_normalized_spec(
+                spec.strpath, 'utf-8', 'file://%s' % spec.strpath, cache).value
+        return load
+
+    def test_warm_load(self, spec, load, monkeypatch):
+        cold = load(spec)
+        monkeypatch.setattr(directive, '_load_spec', None)
+        warm = load(spec)
+
+        assert warm == cold
+        assert isinstance(warm, utils._NormalizedSpec)
+        assert warm['paths']['/resources']['get']['responses']['200'][
+            'content']['application/json']['schema'] == {'type': 'object'}
+
+    def test_invalidated_on_change(self, spec, load):
+        load(spec)
+        spec.write_text(
+            spec.read_text('utf-8').replace('ok', 'changed'), 'utf-8')
+
+        assert load(spec)['paths']['/resources']['get']['responses']['200'][
+            'description'] == 'changed'
+
+    def test_invalidated_on_dependency_change(self, tmpdir, spec, load):
+        load(spec)
+        common = tmpdir.join('common.yml')
+        common.write_text(
+            common.read_text('utf-8').replace('object', 'string'), 'utf-8')
+
+        assert load(spec)['paths']['/resources']['get']['responses']['200'][
+            'content']['application/json']['schema'] == {'type': 'string'}
+
+    def test_remote_dependency_is_fetched(self, tmpdir, load, monkeypatch):
+        documents = {'http://example.com/ext.json': {'S': {'type': 'object'}}}
+        monkeypatch.setattr(
+            _documents, '_fetch',
+            lambda url: json.dumps(documents[url]).encode('utf-8'))
+        spec = tmpdir.join('remote.yml')
+        spec.write_text(textwrap.dedent('''
+            openapi: 3.0.0
+            paths:
+              /resources:
+                get:
+                  responses:
+                    '200':
+                      description: ok
+                      content:
+                        application/json:
+                          schema:
+                            $ref: 'http://example.com/ext.json#/S'
+        '''), encoding='utf-8')
+
+        def schema():
+            return load(spec)['paths']['/resources']['get']['responses'][
+                '200']['content']['application/json']['schema']
+
+        assert schema() == {'type': 'object'}
+        documents['http://example.com/ext.json']['S']['type'] = 'string'
+        assert schema() == {'type': 'string'}
+
+    def test_broken_entry_is_ignored(self, tmpdir, spec, load):
+        load(spec)
+        for entry in tmpdir.join('cache').listdir():
+            entry.write_binary(b'garbage')
+
+        assert load(spec)['openapi'] == '3.0.0'
+
+    def test_unwritable_directory_is_skipped(self, tmpdir, spec, monkeypatch):
+        # A file is in place of the directory, so nothing can be written
+        # there, even by root.
+        tmpdir.join('cache').write_binary(b'')
+        warnings = []
+        monkeypatch.setattr(
+            _cache.LOG, 'warning', lambda *args: warnings.append(args))
+
+        cache = _cache.DiskCache(tmpdir.join('cache', 'entries').strpath)
+        cache.set('key', 'value')
+
+        assert cache.get('key') is None
+        assert len(warnings) == 1
+
+    def test_unpicklable_value_is_skipped(self, tmpdir, monkeypatch):
+        warnings = []
+        monkeypatch.setattr(
+            _cache.LOG, 'warning', lambda *args: warnings.append(args))
+
+        cache = _cache.DiskCache(tmpdir.strpath)
+        cache.set('key', lambda: None)
+
+        assert cache.get('key') is None
+        assert tmpdir.listdir() == []
+        assert len(warnings) == 1
+
+    def test_sphinx_build(self, tmpdir, spec, run_sphinx):
+        spec.move(tmpdir.join('src', 'spec.yml'))
+        tmpdir.join('common.yml').move(tmpdir.join('src', 'common.yml'))
+        run_sphinx('spec.yml')
+
+        assert tmpdir.join('out', '.doctrees', 'openapi').listdir()
+        assert '/resources' in tmpdir.join('out', 'index.html').read_text(
+            'utf-8')
+
+    def test_normalize_is_noop(self, spec, load):
+        normalized = load(spec)
+        utils.normalize_spec(normalized, uri='')
+
+        assert normalized['paths']['/resources']['get']['parameters'] == []
+
+
+class TestDocumentStore(object):
+
+    @pytest.fixture(scope='function')
+    def parsed(self):
+        return []
+
+    @pytest.fixture(scope='function')
+    def store(self, parsed):
+        def parser(data):
+            parsed.append(data)
+            return directive._load_document(data)
+        return _documents.DocumentStore(parser, 1)
+
+    @pytest.fixture(scope='function')
+    def spec(self, tmpdir):
+        tmpdir.ensure('schemas', dir=True).join('pet.yml').write_text(
+            textwrap.dedent('''
+                Pet:
+                  properties:
+                    tag:
+                      $ref: 'tag.json#/Tag'
+            '''), 'utf-8')
+        tmpdir.join('schemas', 'tag.json').write_text(
+            json.dumps({'Tag': {'type': 'string'}}), 'utf-8')
+        return {
+            'pet': {'$ref': 'schemas/pet.yml#/Pet'},
+            'missing': {'$ref': 'missing.json#/Missing'},
+            'remote': {'$ref': 'ftp://example.com/spec.json'},
+        }
+
+    def test_prefetch(self, tmpdir, store, spec):
+        url = 'file://%s' % tmpdir.join('spec.yml').strpath
+        prefetched = store.prefetch(spec, url)
+
+        pet = prefetched['file://%s' % tmpdir.join('schemas', 'pet.yml')]
+        assert pet.path == tmpdir.join('schemas', 'pet.yml').strpath
+        assert pet.value == {'Pet': {'properties': {'tag': {
+            '$ref': 'tag.json#/Tag'}}}}
+        assert prefetched[
+            'file://%s' % tmpdir.join('schemas', 'tag.json')
+        ].value == {'Tag': {'type': 'string'}}
+        assert isinstance(
+            prefetched['file://%s' % tmpdir.join('missing.json')], IOError)
+        assert len(prefetched) == 3
+
+    def test_parsed_once(self, tmpdir, store, parsed):
+        url = 'file://%s' % tmpdir.join('spec.json').strpath
+        tmpdir.join('spec.json').write_text('{"a": {"b": 1}}', 'utf-8')
+
+        first, second = store.load(url), store.load(url)
+        assert first.value == second.value == {'a': {'b': 1}}
+        assert first.value is not second.value
+        assert len(parsed) == 1
+
+        tmpdir.join('spec.json').write_text('{"a": {"b": 2}}', 'utf-8')
+        assert store.load(url).value == {'a': {'b': 2}}
+        assert len(parsed) == 2
+
+    def test_disk_cache(self, tmpdir, store, parsed):
+        url = 'file://%s' % tmpdir.join('spec.json').strpath
+        tmpdir.join('spec.json').write_text('{"a": 1}', 'utf-8')
+        cache = _cache.DiskCache(tmpdir.join('cache').strpath)
+
+        store.load(url, cache)
+        other = _documents.DocumentStore(None, 1)
+        assert other.load(url, cache).value == {'a': 1}
+        assert len(parsed) == 1
+
+    def test_disk_cache_entry_is_replaced(self, tmpdir, store, parsed):
+        url = 'file://%s' % tmpdir.join('spec.json').strpath
+        cache = _cache.DiskCache(tmpdir.join('cache').strpath)
+
+        for value in range(3):
+            tmpdir.join('spec.json').write_text('{"a": %d}' % value, 'utf-8')
+            assert store.load(url, cache).value == {'a': value}
+        assert len(tmpdir.join('cache').listdir()) == 1
+
+        other = _documents.DocumentStore(None, 1)
+        assert other.load(url, cache).value == {'a': 2}
+        assert len(parsed) == 3
+
+    def test_mirror(self, tmpdir, store):
+        tmpdir.ensure('mirror', 'example.com', 'specs', dir=True).join(
+            'pet.json').write_text('{"Pet": {}}', 'utf-8')
+        store.mirror = tmpdir.join('mirror').strpath
+
+        document = store.load('https://example.com/specs/pet.json')
+        assert document.value == {'Pet': {}}
+        assert document.path == tmpdir.join(
+            'mirror', 'example.com', 'specs', 'pet.json').strpath
+
+    def test_normalize(self, tmpdir, spec, monkeypatch):
+        monkeypatch.setattr(directive, '_DOCUMENTS', _documents.DocumentStore(
+            directive._load_document, 1))
+        del spec['missing'], spec['remote']
+        spec['paths'] = {}
+        files = {}
+
+        normalized = directive._normalize(
+            spec, 'file://%s' % tmpdir.join('spec.yml').strpath, files)
+        assert normalized == {
+            'pet': {'properties': {'tag': {'type': 'string'}}},
+            'paths': {},
+        }
+        assert sorted(files) == [
+            tmpdir.join('schemas', 'pet.yml').strpath,
+            tmpdir.join('schemas', 'tag.json').strpath,
+        ]
+
+
+class TestMemoryCache(object):
+
+    def test_lru_eviction(self):
+        cache = _cache.MemoryCache(limit=10)
+        cache.set('a', 'A', 4)
+        cache.set('b', 'B', 4)
+        cache.get('a')
+        cache.set('c', 'C', 4)
+
+        assert list(cache) == ['a', 'c']
+        assert cache.size == 8
+
+    def test_last_entry_is_kept(self):
+        cache = _cache.MemoryCache(limit=10)
+        cache.set('a', 'A', 4)
+        cache.set('b', 'B', 42)
+
+        assert list(cache) == ['b']
+        assert cache.get('b') == 'B'
+
+    def test_resize(self):
+        cache = _cache.MemoryCache()
+        cache.set('a', 'A', 4)
+        cache.set('b', 'B', 4)
+        cache.resize(5)
+
+        assert list(cache) == ['b']
+
+    def test_grow(self):
+        cache = _cache.MemoryCache(limit=10)
+        cache.set('a', 'A', 4)
+        cache.set('b', 'B', 4)
+        cache.grow('a', 'A', 2)
+        cache.grow('b', 'C', 2)
+        cache.grow('c', 'C', 2)
+        assert list(cache) == ['a', 'b']
+        assert cache.size == 10
+
+        cache.grow('b', 'B', 1)
+        assert list(cache) == ['b']
+        assert cache.size == 5
+
+
+class TestSpecsInMemory(object):
+
+    @pytest.fixture(scope='function')
+    def spec(self, tmpdir, monkeypatch):
+        monkeypatch.setattr(directive, '_SPECS', _cache.MemoryCache())
+        spec = tmpdir.join('spec.yml')
+        spec.write_text('openapi: 3.0.0\npaths: {}\n', encoding='utf-8')
+        return spec
+
+    def get(self, spec):
+        return directive._get_normalized_spec(
+            spec.strpath, 'utf-8', 'file://%s' % spec.strpath, None)
+
+    def test_reused(self, spec):
+        assert self.get(spec) is self.get(spec)
+
+    def test_reloaded_on_change(self, spec):
+        first = self.get(spec)
+        spec.write_text('openapi: 3.0.1\npaths: {}\n', encoding='utf-8')
+
+        assert self.get(spec)['openapi'] == '3.0.1'
+        assert first['openapi'] == '3.0.0'
+
+    def test_touched_is_reused(self, spec):
+        first = self.get(spec)
+        spec.setmtime(spec.mtime() + 10)
+
+        assert self.get(spec) is first
+
+    def test_derived_are_counted(self, spec):
+        spec.write_text(json.dumps({
+            'openapi': '3.0.0',
+            'paths': {'/a': {'get': {'responses': {'200': {
+                'description': 'ok',
+                'content': {'application/json': {'schema': {'allOf': [
+                    {'properties': {'a': {'type': 'string'}}},
+                    {'properties': {'b': {'type': 'string'}}},
+                ]}}},
+            }}}}},
+        }), encoding='utf-8')
+        normalized = self.get(spec)
+        size = directive._SPECS.size
+
+        list(openapi30.openapihttpdomain(normalized, examples=True))
+        assert directive._SPECS.size > size
+
+        # Structures derived already are not counted again.
+        size = directive._SPECS.size
+        list(openapi30.openapihttpdomain(normalized, examples=True))
+        assert directive._SPECS.size == size
+
+    def test_derived_are_bounded(self, spec):
+        normalized = self.get(spec)
+        key = (spec.strpath, 'utf-8', 'file://%s' % spec.strpath)
+        directive._SPECS.resize(directive._SPECS.size + 100)
+        directive._SPECS.set('other', None, 0)
+        assert key in directive._SPECS
+
+        normalized.derive('derived', lambda spec: list(range(100)))
+        assert key not in directive._SPECS
+
+    def test_unused_are_evicted(self, spec):
+        self.get(spec)
+        key = (spec.strpath, 'utf-8', 'file://%s' % spec.strpath)
+
+        env = type('Env', (object, ), {})()
+        directive._note_spec(env, 'index', key)
+        directive._evict_unused_specs(None, env)
+        assert key in directive._SPECS
+
+        directive._purge_doc(None, env, 'index')
+        directive._evict_unused_specs(None, env)
+        assert key not in directive._SPECS
+
+    def test_find_directives(self):
+        assert directive._find_directives(textwrap.dedent('''
+            Title
+            =====
+
+            .. openapi:: specs/a.yml
+               :encoding: utf-8
+               :paths:
+                  /a
+
+            .. note::
+
+               .. openapi:httpdomain:: b.yml
+               .. openapi:: c.yml
+                  :group:
+
+            .. image:: d.png
+        ''')) == [
+            ('specs/a.yml', {'encoding': 'utf-8', 'paths': ''}),
+            ('b.yml', {}),
+            ('c.yml', {'group': ''}),
+        ]
+
+    def test_prewarmed_before_parallel_read(self, tmpdir, monkeypatch):
+        src = tmpdir.ensure('src', dir=True)
+        src.join('spec.yml').write_text(
+            'openapi: 3.0.0\npaths: {}\n', encoding='utf-8')
+        src.join('conf.py').write_text(
+            "extensions = ['sphinxcontrib.openapi']\n", encoding='utf-8')
+        docnames = ['doc%d' % index for index in range(8)]
+        src.join('index.rst').write_text(
+            '.. toctree::\n\n   %s\n' % '\n   '.join(docnames), 'utf-8')
+        for docname in docnames:
+            src.join(docname + '.rst').write_text(
+                '%s\n====\n\n.. openapi:: spec.yml\n' % docname, 'utf-8')
+
+        # Workers are separate processes, so loads are logged to a file.
+        loads = tmpdir.join('loads')
+        load_spec = directive._load_spec
+
+        def _load_spec(text):
+            with open(loads.strpath, 'a') as stream:
+                stream.write('%d\n' % os.getpid())
+            return load_spec(text)
+
+        monkeypatch.setattr(directive, '_load_spec', _load_spec)
+        app = Sphinx(
+            srcdir=src.strpath,
+            confdir=src.strpath,
+            outdir=tmpdir.join('out').strpath,
+            doctreedir=tmpdir.join('doctrees').strpath,
+            buildername='dummy',
+            status=None,
+            warning=None,
+            parallel=2)
+        # Documents are read in parallel only if all extensions allow that,
+        # and domains are able to merge their data.
+        for extension in app.extensions.values():
+            monkeypatch.setattr(extension, 'parallel_read_safe', True)
+        monkeypatch.setattr(
+            httpdomain.HTTPDomain, 'merge_domaindata',
+            lambda self, docnames, otherdata: None)
+        app.build()
+
+        assert loads.readlines() == ['%d\n' % os.getpid()]
+
+
+class TestLazyLoading(object):
+
+    spec = collections.OrderedDict([
+        ('openapi', '3.0.0'),
+        ('info', {'title': 'Lazy', 'version': '1.0'}),
+        ('paths', collections.OrderedDict([
+            ('/a', {
+                'get': {
+                    'description': 'multi\nline',
+                    'responses': {
+                        '200': {
+                            'description': 'ok',
+                            'content': {
+                                'application/json': {
+                                    'schema': {
+                                        '$ref': '#/components/schemas/A',
+                                    },
+                                },
+                            },
+                        },
+                    },
+                },
+            }),
+            ('/b', {
+                'get': {
+                    'responses': {
+                        '200': {
+                            'description': 'ok',
+                            'content': {
+                                'application/json': {
+                                    'schema': {
+                                        '$ref': '#/components/schemas/C',
+                                    },
+                                },
+                            },
+                        },
+                    },
+                },
+            }),
+            ('/c/{id}', {
+                'get': {'responses': {'200': {'description': 'ok'}}},
+            }),
+        ])),
+        ('components', {
+            'schemas': collections.OrderedDict([
+                ('A', {
+                    'type': 'object',
+                    'properties': {
+                        'b': {'$ref': '#/components/schemas/B'},
+                    },
+                }),
+                ('B', {'type': 'string', 'enum': ['x', 'y']}),
+                ('C', {'type': 'integer'}),
+            ]),
+        }),
+    ])
+
+    @pytest.fixture(scope='function', params=['json', 'yaml'])
+    def text(self, request):
+        if request.param == 'json':
+            return json.dumps(self.spec, indent=2)
+        return yaml.safe_dump(
+            json.loads(json.dumps(self.spec)), default_flow_style=False)
+
+    def index(self, text):
+        return _lazy.SpecIndex(
+            text, directive._YamlOrderedCLoader, directive._JSON_DECODER)
+
+    def test_paths(self, text):
+        assert self.index(text).paths == ['/a', '/b', '/c/{id}']
+
+    def test_materialize(self, text):
+        spec = self.index(text).materialize(['/a', '/x'])
+
+        assert spec == {
+            'openapi': '3.0.0',
+            'info': self.spec['info'],
+            'paths': {'/a': self.spec['paths']['/a']},
+            'components': {
+                'schemas': {
+                    'A': self.spec['components']['schemas']['A'],
+                    'B': self.spec['components']['schemas']['B'],
+                },
+            },
+        }
+
+    def test_render(self, text):
+        renderer = renderers.HttpdomainOldRenderer(
+            None, {'include': ['/[ab]'], 'examples': True})
+
+        lazy = self.index(text).materialize(['/a', '/b'])
+        full = directive._load_spec(text)
+
+        assert list(renderer.render_restructuredtext_markup(lazy)) == \
+            list(renderer.render_restructuredtext_markup(full))
+
+    def test_anchors_are_not_indexed(self):
+        with pytest.raises(ValueError):
+            self.index(textwrap.dedent('''
+                paths:
+                  /a: &a
+                    get: {}
+                  /b: *a
+            '''))
+
+    def test_get_lazy_spec(self, tmpdir, monkeypatch):
+        monkeypatch.setattr(directive, '_SPECS', _cache.MemoryCache())
+        path = tmpdir.join('spec.json')
+        path.write_text(json.dumps(self.spec), encoding='utf-8')
+
+        keys, spec = directive._get_lazy_spec(
+            path.strpath, 'utf-8', 'file://%s' % path.strpath,
+            {'paths': ['/c/{id}']})
+
+        assert list(spec['paths']) == ['/c/{id}']
+        assert spec['components'] == {'schemas': {}}
+        assert keys == [
+            ('index', path.strpath, 'utf-8'),
+            (path.strpath, 'utf-8', 'file://%s' % path.strpath, ('/c/{id}',),
+             ()),
+        ]
+
+    def test_get_lazy_spec_exclude(self, tmpdir, monkeypatch):
+        monkeypatch.setattr(directive, '_SPECS', _cache.MemoryCache())
+        path = tmpdir.join('spec.json')
+        path.write_text(json.dumps(self.spec), encoding='utf-8')
+
+        _, spec = directive._get_lazy_spec(
+            path.strpath, 'utf-8', 'file://%s' % path.strpath,
+            {'include': ['/'], 'exclude': ['/c']})
+
+        assert list(spec['paths']) == ['/a', '/b']
+
+
+class TestSelection(object):
+
+    paths = ['/a', '/a/b', '/c', '/c/d']
+
+    @pytest.mark.parametrize('options, expected', [
+        ({}, ['/a', '/a/b', '/c', '/c/d']),
+        ({'paths': ['/c', '/a']}, ['/c', '/a']),
+        ({'paths': ['/c'], 'include': ['/a', '/c']}, ['/c', '/a', '/a/b', '/c/d']),
+        ({'exclude': ['/a/', '/c/']}, ['/a', '/c']),
+        ({'include': ['/a', '/c'], 'exclude': ['/c/', '/a$']}, ['/a/b', '/c']),
+        ({'include': []}, []),
+    ])
+    def test_select_paths(self, options, expected):
+        assert utils._select_paths(self.paths, options) == expected
+
+    @pytest.mark.parametrize('pattern, expected', [
+        ('/users/{user_id}', ['/users/{id}']),
+        ('/users/{user_id}/keys/{name}.json', ['/users/{id}/keys/{key}.json']),
+        ('/users/**', ['/users', '/users/{id}', '/users/{id}/keys/{key}.json']),
+        ('/**', [
+            '/users', '/billing/invoices', '/users/{id}',
+            '/users/{id}/keys/{key}.json',
+        ]),
+        ('/billing', []),
+        ('/users/{id}/keys', []),
+    ])
+    def test_path_trie(self, pattern, expected):
+        trie = utils._PathTrie([
+            '/users', '/billing/invoices', '/users/{id}',
+            '/users/{id}/keys/{key}.json',
+        ])
+        assert trie.match(pattern) == expected
+
+    def test_paths_are_looked_up_in_trie(self):
+        assert utils._select_paths(
+            self.paths, {'paths': ['/c/**', '/a']}) == ['/c', '/c/d', '/a']
+
+        with pytest.raises(ValueError) as excinfo:
+            utils._select_paths(self.paths, {'paths': ['/e/**', '/a', '/f']})
+        assert str(excinfo.value) == (
+            'One or more paths are not defined in the spec: /e/**, /f.')
+
+    def test_patterns_are_compiled_once(self):
+        assert utils._compile_patterns(('/a', '/b')) \
+            is utils._compile_patterns(('/a', '/b'))
+
+    @pytest.mark.parametrize('patterns, expected', [
+        (['(?i)/USERS'], ['/users']),
+        (['/(a)\\1', '/(b)\\1'], ['/aa', '/bb']),
+    ])
+    def test_patterns_are_matched_on_their_own(self, patterns, expected):
+        paths = ['/users', '/aa', '/ab', '/bb']
+
+        assert utils._select_paths(paths, {'include': patterns}) == expected
+        assert utils._select_paths(paths, {'exclude': patterns}) == [
+            path for path in paths if path not in expected]
+
+    def test_select_operations(self):
+        spec = utils._normalized({
+            'openapi': '3.0.0',
+            'paths': {
+                path: {
+                    'get': {'responses': {}},
+                    'post': {'responses': {}},
+                }
+                for path in self.paths
+            },
+        }, '')
+        options = {'include': ['/c'], 'methods': ['post']}
+
+        operations = _model.select_operations(spec, options)
+        assert [(op.path, op.method) for op in operations] == [
+            ('/c', 'post'), ('/c/d', 'post')]
+        assert all(
+            a is b for a, b in zip(
+                _model.select_operations(spec, dict(options)), operations))
+
+        # Selections are not kept along with the spec, unlike operations.
+        assert [
+            key for key in vars(spec)['_derived'] if isinstance(key, tuple)
+        ] == [('operations', '/c'), ('operations', '/c/d')]
+
+    @pytest.fixture
+    def tagged_spec(self):
+        return utils._normalized({
+            'openapi': '3.0.0',
+            'tags': [{'name': 'pets'}, {'name': 'unused'}],
+            'paths': collections.OrderedDict([
+                ('/a', {
+                    'get': {'tags': ['users', 'pets'], 'responses': {}},
+                    'post': {'responses': {}},
+                }),
+                ('/b', {'get': {'tags': ['pets'], 'responses': {}}}),
+                ('/c', {'get': {'tags': ['users'], 'responses': {}}}),
+            ]),
+        }, '')
+
+    @pytest.mark.parametrize('options, expected', [
+        ({'tags': ['pets']}, [('/a', 'get'), ('/b', 'get')]),
+        ({'tags': ['users', 'pets']}, [('/a', 'get'), ('/b', 'get'), ('/c', 'get')]),
+        ({'tags': ['users'], 'exclude': ['/a']}, [('/c', 'get')]),
+        ({'tags': ['pets'], 'paths': ['/b', '/a']}, [('/b', 'get'), ('/a', 'get')]),
+        ({'tags': ['unused']}, []),
+    ])
+    def test_select_operations_by_tags(self, tagged_spec, options, expected):
+        operations = _model.select_operations(tagged_spec, options)
+        assert [(op.path, op.method) for op in operations] == expected
+
+    def test_select_operations_by_undefined_tags(self, tagged_spec):
+        with pytest.raises(ValueError) as excinfo:
+            _model.select_operations(tagged_spec, {'tags': ['pet', 'users', 'x']})
+        assert str(excinfo.value) == (
+            'One or more tags are not defined in the spec: pet, x.')
+
+    def test_tag_index(self, tagged_spec):
+        index = _model.get_tag_index(tagged_spec)
+        assert {
+            tag: [(op.path, op.method) for _, op in tagged]
+            for tag, tagged in index.items()
+        } == {
+            'users': [('/a', 'get'), ('/c', 'get')],
+            'pets': [('/a', 'get'), ('/b', 'get')],
+        }
+        assert _model.get_tag_index(tagged_spec) is index
+
+    @pytest.mark.parametrize('options, expected', [
+        ({'operation-ids': ['listB', 'getA']}, [('/b', 'get'), ('/a', 'get')]),
+        ({'operation-ids': ['getA', 'getA']}, [('/a', 'get')]),
+        ({'operation-ids': ['getA', 'listB'], 'tags': ['users']}, [('/a', 'get')]),
+        ({'operation-ids': ['getA', 'listB'], 'exclude': ['/a']}, [('/b', 'get')]),
+        ({'operation-ids': ['getA'], 'methods': ['post']}, []),
+    ])
+    def test_select_operations_by_ids(self, tagged_spec, options, expected):
+        tagged_spec['paths']['/a']['get']['operationId'] = 'getA'
+        tagged_spec['paths']['/b']['get']['operationId'] = 'listB'
+
+        operations = _model.select_operations(tagged_spec, options)
+        assert [(op.path, op.method) for op in operations] == expected
+
+    def test_select_operations_by_undefined_ids(self, tagged_spec):
+        with pytest.raises(ValueError) as excinfo:
+            _model.select_operations(tagged_spec, {'operation-ids': ['getA']})
+        assert str(excinfo.value) == (
+            'One or more operation IDs are not defined in the spec: getA.')
+
+    def test_operation_is_found_without_building_others(self, tagged_spec):
+        tagged_spec['paths']['/c']['get']['operationId'] = 'getC'
+
+        operations = _model.select_operations(
+            tagged_spec, {'operation-ids': ['getC']})
+        assert [(op.path, op.method) for op in operations] == [('/c', 'get')]
+        assert _model.get_operation_id_index(tagged_spec) == {
+            'getC': ('/c', 'get')}
+        assert ('operations', '/a') not in vars(tagged_spec)['_derived']
+
+    def test_group_operations(self, tagged_spec):
+        groups = _model.group_operations(tagged_spec, {'methods': ['get']})
+        assert [
+            (tag, [(op.path, op.method) for op in group])
+            for tag, group in groups.items()
+        ] == [
+            ('pets', [('/b', 'get')]),
+            ('unused', []),
+            ('users', [('/a', 'get'), ('/c', 'get')]),
+        ]
+
+
+class TestPruning(object):
+
+    @pytest.fixture
+    def spec(self):
+        return {
+            'openapi': '3.0.0',
+            'paths': {
+                '/a': {
+                    'parameters': [
+                        {'name': 'q', 'in': 'query', 'schema': {'type': 'string'}},
+                    ],
+                    'get': {'responses': {'200': {'description': 'ok'}}},
+                    'put': {'responses': {'200': {'description': 'ok'}}},
+                },
+                '/b': {
+                    'get': {'responses': {'$ref': '#/components/missing'}},
+                },
+            },
+        }
+
+    def test_unselected_paths_are_not_normalized(self, spec):
+        normalized = utils._normalized(spec, '', options={'paths': ['/a']})
+        assert list(normalized['paths']) == ['/a']
+
+        with pytest.raises(ValueError):
+            utils._normalized(spec, '')
+
+    def test_unselected_methods_are_not_normalized(self, spec):
+        normalized = utils._normalized(
+            spec, '', options={'exclude': ['/b'], 'methods': ['put']})
+        assert list(normalized['paths']) == ['/a']
+        assert list(normalized['paths']['/a']) == ['put']
+        assert normalized['paths']['/a']['put']['parameters'] == [
+            {'name': 'q', 'in': 'query', 'schema': {'type': 'string'}}]
+
+    def test_unselected_operation_ids_are_not_normalized(self, spec):
+        spec['paths']['/a']['put']['operationId'] = 'updateA'
+        normalized = utils._normalized(
+            spec, '', options={'operation-ids': ['updateA']})
+        assert list(normalized['paths']) == ['/a']
+
+    def test_spec_is_not_modified(self, spec):
+        pristine = copy.deepcopy(spec)
+        renderer = renderers.HttpdomainOldRenderer(None, {'paths': ['/a']})
+        first = list(renderer.render_restructuredtext_markup(spec))
+        second = list(renderer.render_restructuredtext_markup(spec))
+
+        assert first == second
+        assert spec == pristine
+
+    def test_operation_parameters_are_not_shared(self, spec):
+        spec['paths']['/a']['get']['parameters'] = [
+            {'name': 'r', 'in': 'query', 'schema': {'type': 'string'}}]
+        pristine = copy.deepcopy(spec)
+
+        normalized = utils._normalized(spec, '', options={'paths': ['/a']})
+        assert len(normalized['paths']['/a']['get']['parameters']) == 2
+        assert spec == pristine
+
+    def test_rendered_twice_the_same(self, spec):
+        spec['paths']['/a']['get']['parameters'] = [
+            {'name': 'r', 'in': 'query', 'schema': {'type': 'string'}}]
+        renderer = renderers.HttpdomainOldRenderer(None, {'paths': ['/a']})
+        first = list(renderer.render_restructuredtext_markup(spec))
+        second = list(renderer.render_restructuredtext_markup(spec))
+
+        assert first == second
+        assert first.count('   :query string q:') == 2
+
+    @pytest.mark.parametrize('normalize', [False, True])
+    def test_methods_option(self, spec, normalize):
+        del spec['paths']['/b']
+        if normalize:
+            spec = utils._normalized(spec, '')
+
+        renderer = renderers.HttpdomainOldRenderer(None, {'methods': ['put']})
+        text = '\n'.join(renderer.render_restructuredtext_markup(spec))
+
+        assert '.. http:put:: /a' in text
+        assert '.. http:get:: /a' not in text
+
+
+class TestModel(object):
+
+    spec = {
+        'paths': {
+            '/resources/{kind}': {
+                'parameters': [
+                    {'name': 'kind', 'in': 'path', 'type': 'string'},
+                ],
+                'get': {
+                    'tags': ['resources'],
+                    'operationId': 'listResources',
+                    'parameters': [
+                        {'name': 'limit', 'in': 'query', 'type': 'integer'},
+                        {'name': 'X-Trace', 'in': 'header', 'type': 'string'},
+                        {'name': 'page', 'in': 'query', 'type': 'integer'},
+                    ],
+                    'responses': {
+                        '200': {
+                            'description': 'ok',
+                            'headers': {'ETag': {'description': 'etag'}},
+                        },
+                    },
+                },
+            },
+        },
+    }
+
+    def test_operation(self):
+        spec = utils._normalized(copy.deepcopy(self.spec), '')
+        operation = _model.get_operations(spec, '/resources/{kind}')['get']
+
+        assert operation.path == '/resources/{kind}'
+        assert operation.method == 'get'
+        assert operation.tags == ('resources', )
+        assert operation.operation_id == 'listResources'
+        assert operation.summary is None
+        assert [p.name for p in operation.parameters_in('query')] == \
+            ['limit', 'page']
+        assert [p.name for p in operation.parameters_in('path')] == ['kind']
+        assert operation.parameters_in('body') == ()
+        assert operation.responses[0].status == '200'
+        assert operation.responses[0].headers == (
+            ('ETag', {'description': 'etag'}), )
+
+    def test_built_once(self):
+        spec = utils._normalized(copy.deepcopy(self.spec), '')
+
+        assert _model.get_operations(spec, '/resources/{kind}') is \
+            _model.get_operations(spec, '/resources/{kind}')
+
+    def test_immutable(self):
+        spec = utils._normalized(copy.deepcopy(self.spec), '')
+        operation = _model.get_operations(spec, '/resources/{kind}')['get']
+
+        with pytest.raises(AttributeError):
+            operation.summary = 'Changed'
+        with pytest.raises(AttributeError):
+            operation.extra = 'Extra'
+
+    def test_derived_are_not_pickled(self):
+        spec = utils._normalized(copy.deepcopy(self.spec), '')
+        _model.get_operations(spec, '/resources/{kind}')
+
+        restored = pickle.loads(pickle.dumps(spec))
+        assert restored == spec
+        assert isinstance(restored, utils._NormalizedSpec)
+        assert not vars(restored)
+
+
+class TestUpconvert(object):
+
+    spec = {
+        'swagger': '2.0',
+        'tags': [{'name': 'pets'}],
+        'consumes': ['application/xml'],
+        'produces': ['application/json', 'application/xml'],
+        'paths': {
+            '/pets': {
+                'post': {
+                    'tags': ['pets'],
+                    'parameters': [
+                        {
+                            'name': 'tags',
+                            'in': 'query',
+                            'type': 'array',
+                            'items': {'type': 'string'},
+                            'collectionFormat': 'multi',
+                        },
+                        {
+                            'name': 'body',
+                            'in': 'body',
+                            'required': True,
+                            'schema': {'type': 'object'},
+                        },
+                    ],
+                    'responses': {
+                        '201': {
+                            'description': 'Created.',
+                            'headers': {
+                                'Location': {
+                                    'description': 'URL.',
+                                    'type': 'string',
+                                },
+                            },
+                            'schema': {'type': 'object'},
+                            'examples': {'text/plain': 'Created'},
+                        },
+                    },
+                },
+            },
+            '/pets/{id}/photos': {
+                'post': {
+                    'consumes': ['multipart/form-data'],
+                    'parameters': [
+                        {
+                            'name': 'caption',
+                            'in': 'formData',
+                            'type': 'string',
+                            'description': 'Photo caption.',
+                        },
+                        {
+                            'name': 'file',
+                            'in': 'formData',
+                            'required': True,
+                            'type': 'file',
+                        },
+                    ],
+                    'responses': {'201': {'description': 'Uploaded.'}},
+                },
+            },
+        },
+    }
+
+    def test_converted_once(self):
+        spec = utils._normalized(copy.deepcopy(self.spec), '')
+        converted = _upconvert.get_openapi3(spec)
+
+        assert converted is _upconvert.get_openapi3(spec)
+        assert converted['openapi'] == '3.0.0'
+        assert converted['tags'] == [{'name': 'pets'}]
+        assert 'consumes' not in converted
+        assert _upconvert.get_openapi3(converted) is converted
+
+    def test_openapi3_is_not_converted(self):
+        spec = utils._normalized({'openapi': '3.0.0', 'paths': {}}, '')
+        assert _upconvert.get_openapi3(spec) is spec
+
+    def test_operation(self):
+        spec = utils._normalized(copy.deepcopy(self.spec), '')
+        converted = _upconvert.get_openapi3(spec)
+        operation = _model.get_operations(converted, '/pets')['post']
+
+        [param] = operation.parameters_in('query')
+        assert param.schema == {'type': 'array', 'items': {'type': 'string'}}
+        assert param.explode
+        assert operation.parameters_in('body') == ()
+        assert [(m.content_type, m.schema) for m in operation.request_body] \
+            == [('application/xml', {'type': 'object'})]
+
+        [response] = operation.responses
+        assert response.headers == (
+            ('Location', {'description': 'URL.', 'schema': {'type': 'string'}}),
+        )
+        assert [(m.content_type, m.schema, m.example)
+                for m in response.content] == [
+            ('application/json', {'type': 'object'}, None),
+            ('application/xml', {'type': 'object'}, None),
+            ('text/plain', None, 'Created'),
+        ]
+
+    def test_form_data(self):
+        spec = utils._normalized(copy.deepcopy(self.spec), '')
+        converted = _upconvert.get_openapi3(spec)
+        operation = _model.get_operations(
+            converted, '/pets/{id}/photos')['post']
+
+        assert operation.parameters_in('formData') == ()
+        [media_type] = operation.request_body
+        assert media_type.content_type == 'multipart/form-data'
+        assert media_type.schema == {
+            'type': 'object',
+            'properties': {
+                'caption': {'type': 'string', 'description': 'Photo caption.'},
+                'file': {'type': 'string', 'format': 'binary'},
+            },
+            'required': ['file'],
+        }
+
+
+class TestSchemas(object):
+
+    base = {'type': 'object', 'properties': {'a': {'type': 'integer'}}}
+    composed = {
+        'allOf': [base, {'properties': {'b': {'type': 'string'}}}],
+    }
+
+    def test_all_of_is_merged_once(self):
+        schemas = _schemas.Schemas()
+        merged = schemas.compose(self.composed)
+
+        assert merged == {
+            'type': 'object',
+            'properties': {
+                'a': {'type': 'integer'},
+                'b': {'type': 'string'},
+            },
+        }
+        assert schemas.compose(self.composed) is merged
+        assert self.base == {
+            'type': 'object', 'properties': {'a': {'type': 'integer'}}}
+
+    def test_alternatives(self):
+        schemas = _schemas.Schemas()
+        one_of = {'oneOf': [{'anyOf': [self.base]}, {'type': 'string'}]}
+
+        assert schemas.compose(one_of) == {'anyOf': [self.base]}
+        assert schemas.effective(one_of) is self.base
+        assert schemas.effective(self.base) is self.base
+
+    def test_any_of_example(self):
+        assert openapi30._parse_schema({'anyOf': [self.base]}, None) == {
+            'a': 1}
+
+    def test_all_of_fields(self):
+        assert list(openapi20.convert_json_schema(self.composed)) == [
+            ':<json integer a:',
+            ':<json string b:',
+        ]
+
+    def test_subschemas_are_not_modified(self):
+        def _schema(name):
+            return {
+                'type': 'object',
+                'properties': {name: {'type': 'string'}},
+            }
+
+        def _operation(schema):
+            return {'responses': {'200': {
+                'description': 'ok',
+                'content': {'application/json': {'schema': schema}},
+            }}}
+
+        spec = {
+            'openapi': '3.0.0',
+            'paths': collections.OrderedDict([
+                ('/abc', {'get': _operation({'allOf': [
+                    {'$ref': '#/components/schemas/A'},
+                    {'$ref': '#/components/schemas/B'},
+                    {'$ref': '#/components/schemas/C'},
+                ]})}),
+                ('/b', {'get': _operation(
+                    {'$ref': '#/components/schemas/B'})}),
+            ]),
+            'components': {'schemas': {
+                'A': {'type': 'object', 'description': 'Has no properties.'},
+                'B': _schema('b'),
+                'C': _schema('c'),
+            }},
+        }
+        spec = utils._normalized(spec, '')
+        text = '\n'.join(openapi30.openapihttpdomain(spec, examples=None))
+
+        assert text.count('"c": "string"') == 1
+        assert spec['components']['schemas']['B'] == _schema('b')
+
+    def test_shared_by_spec(self):
+        spec = utils._normalized({'swagger': '2.0', 'paths': {}}, '')
+        assert _schemas.get_schemas(spec) is _schemas.get_schemas(spec)
+
+
+class TestGeneratedExamples(object):
+
+    schema = {
+        'type': 'object',
+        'properties': {
+            'id': {'type': 'integer', 'readOnly': True},
+            'name': {'type': 'string'},
+        },
+    }
+
+    def test_requests_and_responses(self):
+        generated = openapi30._GeneratedExamples(_schemas.Schemas())
+
+        response = generated.get(self.schema, None, 16)
+        request = generated.get(self.schema, 'post', 16)
+        assert response == {'id': 1, 'name': 'string'}
+        assert request == {'name': 'string'}
+        assert generated.get(self.schema, None, 16) is response
+        assert generated.lines(self.schema, 'post', 16) == (
+            '{', '    "name": "string"', '}')
+
+    def test_shared_schemas_are_serialized_once(self, monkeypatch):
+        response = {
+            'description': 'ok',
+            'content': {'application/json': {'schema': self.schema}},
+        }
+        spec = {
+            'openapi': '3.0.0',
+            'paths': {
+                # Operations differ, so they are not rendered just once.
+                '/a': {'get': {'summary': 'A', 'responses': {'200': response}}},
+                '/b': {'get': {'summary': 'B', 'responses': {'200': response}}},
+            },
+        }
+        serialized = []
+        example_lines = openapi30._example_lines
+        monkeypatch.setattr(
+            openapi30, '_example_lines',
+            lambda value: serialized.append(value) or example_lines(value))
+
+        renderer = renderers.HttpdomainOldRenderer(None, {'examples': True})
+        text = '\n'.join(renderer.render_restructuredtext_markup(spec))
+
+        assert text.count('"name": "string"') == 2
+        # Once per GET request sample, and once for the response.
+        assert serialized == ['', {'id': 1, 'name': 'string'}, '']
+
+
+class TestOperationMarkup(object):
+
+    def test_param_type_is_abstract(self):
+        class Markup(_markup.OperationMarkup):
+            pass
+
+        with pytest.raises(TypeError, match='param_type'):
+            Markup(lambda text: text)
+
+    def test_subclass(self):
+        class Markup(_markup.OperationMarkup):
+            def param_type(self, param):
+                return 'string'
+
+        assert Markup(lambda text: text).param_type({}) == 'string'
+
+
+class TestRenderCache(object):
+
+    @pytest.fixture(scope='function')
+    def spec(self):
+        resource = {
+            'type': 'object',
+            'properties': {'name': {'type': 'string'}},
+        }
+        return {
+            'openapi': '3.0.0',
+            'paths': {
+                '/a': {'get': {'summary': 'A', 'responses': {'200': {
+                    'description': 'ok',
+                    'content': {'application/json': {'schema': resource}},
+                }}}},
+                '/b': {'get': {
+                    'summary': 'B',
+                    'responses': {'200': {'description': 'ok'}},
+                }},
+            },
+        }
+
+    @pytest.fixture(scope='function')
+    def rendered(self, monkeypatch):
+        rendered = []
+        httpresource = openapi30._httpresource
+
+        def _httpresource(operation, *args, **kwargs):
+            rendered.append(operation.summary)
+            return httpresource(operation, *args, **kwargs)
+
+        monkeypatch.setattr(openapi30, '_httpresource', _httpresource)
+        return rendered
+
+    def _key(self, spec, path, options):
+        spec = utils._normalized(copy.deepcopy(spec), '')
+        operation = _model.get_operations(spec, path)['get']
+        return _rendered.operation_key(spec, operation, options)
+
+    def test_operation_key(self, spec):
+        key = self._key(spec, '/a', {})
+        assert self._key(spec, '/a', {'group': None, 'uri': 'x'}) == key
+        assert self._key(spec, '/a', {'examples': None}) != key
+        assert self._key(spec, '/b', {}) != key
+
+        # Paths are not a part of the content.
+        spec['paths']['/c'] = spec['paths']['/a']
+        assert self._key(spec, '/c', {}) == key
+
+        # Objects an operation refers to are a part of its content.
+        spec['paths']['/a']['get']['responses']['200']['content'][
+            'application/json']['schema']['properties']['name']['type'] = 'integer'
+        assert self._key(spec, '/a', {}) != key
+
+    def test_openapi2_operation_key(self, spec):
+        openapi2 = {'swagger': '2.0', 'paths': {'/b': {'get': {
+            'summary': 'B',
+            'responses': {'200': {'description': 'ok'}},
+        }}}}
+        converted = _upconvert.get_openapi3(
+            utils._normalized(copy.deepcopy(openapi2), ''))
+        operation = _model.get_operations(converted, '/b')['get']
+
+        # Converted operations are the same, yet they are rendered apart.
+        assert converted['paths']['/b'] == \
+            utils._normalized(copy.deepcopy(spec), '')['paths']['/b']
+        assert _rendered.operation_key(converted, operation, {}) != \
+            self._key(spec, '/b', {})
+
+        # Media types declared by the spec are a part of its operations.
+        openapi2['paths']['/b']['get']['responses']['200']['schema'] = {}
+        digest = _rendered.slice_digest(
+            utils._normalized(copy.deepcopy(openapi2), ''), {})
+        openapi2['produces'] = ['application/xml']
+        assert _rendered.slice_digest(
+            utils._normalized(copy.deepcopy(openapi2), ''), {}) != digest
+
+    def test_unchanged_operations_are_not_rendered(self, spec, rendered):
+        cache = _rendered.RenderCache()
+        options = {'examples': None}
+        expected = list(openapi30.openapihttpdomain(
+            copy.deepcopy(spec), **options))
+        del rendered[:]
+
+        text = list(openapi30.openapihttpdomain(
+            copy.deepcopy(spec), render_cache=cache, **options))
+        assert text == expected
+        assert rendered == ['A', 'B']
+
+        spec['paths']['/b']['get']['summary'] = 'Changed'
+        text = list(openapi30.openapihttpdomain(
+            copy.deepcopy(spec), render_cache=cache, **options))
+        assert '   :synopsis: Changed' in text
+        assert rendered == ['A', 'B', 'Changed']
+
+    def test_identical_operations_are_rendered_once(self, spec, rendered):
+        cache = _rendered.RenderCache()
+        other = copy.deepcopy(spec)
+        other['paths'] = {'/v2' + path: path_item
+                          for path, path_item in spec['paths'].items()}
+        expected = list(openapi30.openapihttpdomain(copy.deepcopy(other)))
+        del rendered[:]
+
+        list(openapi30.openapihttpdomain(
+            copy.deepcopy(spec), render_cache=cache, examples=None))
+        list(openapi30.openapihttpdomain(
+            copy.deepcopy(spec), render_cache=cache))
+        text = list(openapi30.openapihttpdomain(
+            copy.deepcopy(other), render_cache=cache))
+        assert text == expected
+        assert '.. http:get:: /v2/a' in text
+        assert rendered == ['A', 'B', 'A', 'B']
+
+    def test_disk_cache(self, tmpdir, spec, rendered):
+        cache = _rendered.RenderCache()
+        cache.disk = _cache.DiskCache(tmpdir.strpath)
+        expected = list(openapi30.openapihttpdomain(
+            copy.deepcopy(spec), render_cache=cache))
+
+        cache = _rendered.RenderCache()
+        cache.disk = _cache.DiskCache(tmpdir.strpath)
+        text = list(openapi30.openapihttpdomain(
+            copy.deepcopy(spec), render_cache=cache))
+        assert text == expected
+        assert rendered == ['A', 'B']
+
+
+class TestIncrementalBuild(object):
+
+    @pytest.fixture(scope='function')
+    def spec(self):
+        return {
+            'openapi': '3.0.0',
+            'paths': {
+                '/a': {'get': {
+                    'summary': 'A',
+                    'responses': {'200': {'description': 'ok'}},
+                }},
+                '/b': {'get': {
+                    'summary': 'B',
+                    'responses': {'200': {'description': 'ok'}},
+                }},
+            },
+        }
+
+    def _build(self, tmpdir, spec, conf=''):
+        src = tmpdir.ensure('src', dir=True)
+        src.join('spec.yml').write_text(json.dumps(spec), 'utf-8')
+        src.join('conf.py').write_text(textwrap.dedent('''
+            extensions = ['sphinxcontrib.openapi']
+            master_doc = 'index'
+        ''') + conf, 'utf-8')
+        for docname, options in [('index', ':paths: /a'),
+                                 ('b', ':paths: /b'),
+                                 ('all', ':group:')]:
+            text = '%s\n%s\n\n.. openapi:: spec.yml\n   %s\n' % (
+                docname, '=' * len(docname), options)
+            if not src.join(docname + '.rst').check() \
+                    or src.join(docname + '.rst').read_text('utf-8') != text:
+                src.join(docname + '.rst').write_text(text, 'utf-8')
+
+        read = []
+        app = Sphinx(
+            srcdir=src.strpath,
+            confdir=src.strpath,
+            outdir=tmpdir.join('out').strpath,
+            doctreedir=tmpdir.join('doctrees').strpath,
+            buildername='dummy',
+            status=None,
+            warning=None)
+        app.connect(
+            'env-before-read-docs',
+            lambda app, env, docnames: read.extend(sorted(docnames)))
+        app.build()
+        return read
+
+    def test_only_changed_operations_are_reread(self, tmpdir, spec):
+        assert self._build(tmpdir, spec) == ['all', 'b', 'index']
+        assert self._build(tmpdir, spec) == []
+
+        spec['paths']['/b']['get']['summary'] = 'Changed'
+        assert self._build(tmpdir, spec) == ['all', 'b']
+
+        spec['paths']['/c'] = spec['paths']['/a']
+        assert self._build(tmpdir, spec) == ['all']
+
+    def test_markup_is_cached_on_disk_if_enabled(
+            self, tmpdir, spec, monkeypatch):
+        self._build(tmpdir.join('default'), spec)
+        assert directive._RENDERED.disk is None
+
+        # Markup is not rendered again if it's in memory already.
+        monkeypatch.setattr(directive, '_RENDERED', _rendered.RenderCache())
+        self._build(tmpdir.join('enabled'), spec, 'openapi_cache_markup = True')
+        assert directive._RENDERED.disk is not None
+
+        # Besides specs, markup of both operations is stored.
+        default = tmpdir.join('default', 'doctrees', 'openapi').listdir()
+        enabled = tmpdir.join('enabled', 'doctrees', 'openapi').listdir()
+        assert len(enabled) == len(default) + 2
+
+    def test_cache_dir(self, tmpdir, spec, monkeypatch):
+        # Specs are loaded by directives, rather than prewarmed.
+        monkeypatch.setattr(directive, '_prewarm_specs', lambda *args: None)
+        self._build(tmpdir, spec, 'openapi_cache_dir = "cache"')
+
+        assert tmpdir.join('src', 'cache').listdir()
+        assert not tmpdir.join('doctrees', 'openapi').check()
+
+    def test_subclassed_renderer_depends_on_spec(self, tmpdir, spec):
+        conf = textwrap.dedent('''
+            from sphinxcontrib.openapi import renderers
+
+            class Renderer(renderers.HttpdomainOldRenderer):
+                pass
+
+            openapi_renderers = {'custom': Renderer}
+            openapi_default_renderer = 'custom'
+        ''')
+        assert self._build(tmpdir, spec, conf) == ['all', 'b', 'index']
+
+        spec['paths']['/b']['get']['summary'] = 'Changed'
+        assert self._build(tmpdir, spec, conf) == ['all', 'b', 'index']
+
+    def test_removed_operations_are_reported(self, tmpdir, spec):
+        self._build(tmpdir, spec)
+
+        del spec['paths']['/b']
+        with pytest.raises(ValueError, match='/b'):
+            self._build(tmpdir, spec)
+
+
+class TestHttpdomainRenderer(object):
+
+    spec3 = {
+        'openapi': '3.0.0',
+        'tags': [{'name': 'pets'}, {'name': 'stores'}],
+        'paths': collections.OrderedDict([
+            ('/pets/{id}', {
+                'parameters': [
+                    {
+                        'name': 'id',
+                        'in': 'path',
+                        'description': 'Pet *identifier*.',
+                        'schema': {'type': 'integer'},
+                    },
+                ],
+                'get': {
+                    'tags': ['pets'],
+                    'summary': 'Get a pet',
+                    'description': textwrap.dedent('''
+                        Returns a pet.
+
+                        * first
+                        * second
+
+                        .. note:: Pets may `bite`_.
+                    '''),
+                    'parameters': [
+                        {
+                            'name': 'fields',
+                            'in': 'query',
+                            'required': True,
+                            'description': 'Fields to return.',
+                            'schema': {'type': 'array', 'items': {
+                                'type': 'string'}},
+                            'explode': True,
+                        },
+                        {
+                            'name': 'X-Request-Id',
+                            'in': 'header',
+                            'required': True,
+                            'description': 'Request ID.',
+                            'schema': {'type': 'string'},
+                        },
+                    ],
+                    'responses': collections.OrderedDict([
+                        ('200', {
+                            'description': 'A pet.',
+                            'headers': {
+                                'ETag': {'description': 'Pet version.'},
+                            },
+                            'content': {
+                                'application/json': {
+                                    'schema': {
+                                        '$ref': '#/components/schemas/Pet',
+                                    },
+                                },
+                            },
+                        }),
+                        ('404', {'description': 'No `such pet.'}),
+                    ]),
+                },
+                'put': {
+                    'tags': ['pets', 'stores'],
+                    'summary': 'Update *a* pet',
+                    'requestBody': {
+                        'content': {
+                            'application/json': {
+                                'schema': {'$ref': '#/components/schemas/Pet'},
+                                'examples': {
+                                    'cat': {
+                                        'summary': 'A cat',
+                                        'value': {'name': 'Tom'},
+                                    },
+                                },
+                            },
+                        },
+                    },
+                    'responses': {
+                        'default': {'description': 'Details follow::'},
+                    },
+                    'callbacks': {
+                        'updated': {
+                            '{$request.body#/url}': {
+                                'post': {
+                                    'summary': 'Pet updated',
+                                    'responses': {
+                                        '204': {'description': 'ok'},
+                                    },
+                                },
+                            },
+                        },
+                    },
+                },
+            }),
+            ('/stores', {
+                'get': {
+                    'summary': 'List stores',
+                    'description': ':param x: not really a field',
+                    'responses': {'200': {'description': 'Stores.'}},
+                },
+            }),
+        ]),
+        'components': {
+            'schemas': {
+                'Pet': {
+                    'type': 'object',
+                    'properties': {
+                        'id': {'type': 'integer', 'readOnly': True},
+                        'name': {'type': 'string'},
+                    },
+                },
+            },
+        },
+    }
+
+    spec2 = {
+        'swagger': '2.0',
+        'paths': {
+            '/pets': {
+                'post': {
+                    'summary': 'Create a pet',
+                    'parameters': [
+                        {
+                            'name': 'body',
+                            'in': 'body',
+                            'schema': {
+                                'type': 'object',
+                                'properties': {
+                                    'name': {'type': 'string'},
+                                    'tags': {
+                                        'type': 'array',
+                                        'items': {'type': 'string'},
+                                    },
+                                },
+                            },
+                        },
+                        {'name': 'dry', 'in': 'query', 'type': 'boolean'},
+                    ],
+                    'responses': {
+                        '201': {
+                            'description': 'Created.',
+                            'schema': {
+                                'type': 'object',
+                                'properties': {'id': {'type': 'integer'}},
+                            },
+                        },
+                        '400': {'description': 'Invalid.'},
+                    },
+                },
+            },
+        },
+    }
+
+    def _doctrees(self, tmpdir, spec, options,
+                  renderers=('httpdomain:old', 'httpdomain')):
+        src = tmpdir.ensure('src', dir=True)
+        out = tmpdir.ensure('out', dir=True)
+        src.join('spec.yml').write_text(json.dumps(spec), 'utf-8')
+        src.join('conf.py').write_text(textwrap.dedent('''
+            from sphinxcontrib.openapi import renderers
+
+            class UnchunkedRenderer(renderers.HttpdomainOldRenderer):
+                def render_restructuredtext_chunks(self, spec):
+                    chunks = super().render_restructuredtext_chunks(spec)
+                    return [[line for chunk in chunks for line in chunk]]
+
+            extensions = ['sphinxcontrib.openapi']
+            master_doc = 'index'
+            openapi_renderers = {'unchunked': UnchunkedRenderer}
+        '''), 'utf-8')
+        src.join('index.rst').write_text(textwrap.dedent('''
+            .. toctree::
+
+               old
+               new
+        '''), 'utf-8')
+
+        for docname, renderer in zip(('old', 'new'), renderers):
+            src.join(docname + '.rst').write_text(
+                '%s\n%s\n\n.. openapi:%s:: spec.yml\n%s' % (
+                    docname, '=' * len(docname), renderer, ''.join(
+                        '   :%s: %s\n' % (key, value)
+                        for key, value in options.items())),
+                'utf-8')
+
+        app = Sphinx(
+            srcdir=src.strpath,
+            confdir=src.strpath,
+            outdir=out.strpath,
+            doctreedir=out.join('.doctrees').strpath,
+            buildername='html',
+            status=None,
+            warning=None)
+        app.build()
+
+        return [
+            app.env.get_doctree(docname)[0].children[1:]
+            for docname in ('old', 'new')[:len(renderers)]
+        ]
+
+    @pytest.mark.parametrize('options', [
+        {},
+        {'examples': '', 'request': '', 'group': ''},
+        {'examples': '', 'format': 'markdown'},
+    ])
+    def test_same_as_old_renderer(self, tmpdir, options):
+        old, new = self._doctrees(tmpdir, self.spec3, options)
+        assert [node.pformat() for node in new] == \
+            [node.pformat() for node in old]
+
+    @pytest.mark.parametrize('options', [{}, {'examples': ''}])
+    def test_unusual_markup_same_as_old_renderer(self, tmpdir, options):
+        ok = {'application/json': {'example': {'ok': True}}}
+        spec = {
+            'openapi': '3.0.0',
+            'paths': collections.OrderedDict([
+                ('/a', {'get': {
+                    'summary': '*',
+                    'description': '1. first\n2. second',
+                    'parameters': [{
+                        'name': 'q',
+                        'in': 'query',
+                        'description': '  Indented\n  text.',
+                        'schema': {'type': 'string'},
+                    }],
+                    'responses': {
+                        '200': {'description': 'OK.', 'content': ok},
+                        '404': {'description': '  Indented.', 'content': ok},
+                    },
+                }}),
+                ('/b', {'get': {
+                    'summary': '  Spaced out  ',
+                    'responses': {
+                        '200': {'description': 'Term\n   Def'},
+                        '404': {'description': 'Follows::', 'content': ok},
+                    },
+                }}),
+                ('/c', {'get': {
+                    'description': 'Follows::',
+                    'parameters': [{
+                        'name': 'a:b',
+                        'in': 'query',
+                        'schema': {'type': 'string'},
+                    }],
+                    'responses': {'200': {'description': 'OK.'}},
+                }}),
+                ('/d', {'get': {
+                    'description': 'Before.\n\n-----\n\nAfter.',
+                    'responses': {'200': {'description': '-----'}},
+                }}),
+            ]),
+        }
+        old, new = self._doctrees(tmpdir, spec, options)
+        assert [node.pformat() for node in new] == \
+            [node.pformat() for node in old]
+
+    @pytest.mark.parametrize('options', [{}, {'examples': '', 'request': ''}])
+    def test_openapi2_same_as_old_renderer(self, tmpdir, options):
+        old, new = self._doctrees(tmpdir, self.spec2, options)
+        assert [node.pformat() for node in new] == \
+            [node.pformat() for node in old]
+        assert 'Request JSON Object' in ''.join(node.astext() for node in new)
+
+    @pytest.mark.parametrize('renderer', ['httpdomain:old', 'httpdomain'])
+    def test_same_as_parsed_at_once(self, tmpdir, renderer):
+        unchunked, chunked = self._doctrees(
+            tmpdir, self.spec3, {'group': ''}, ('unchunked', renderer))
+        assert [node.pformat() for node in chunked] == \
+            [node.pformat() for node in unchunked]
+        assert [node['ids'] for node in chunked] == \
+            [['pets'], ['stores'], ['default']]
+
+    def test_parsed_in_chunks(self, tmpdir, monkeypatch):
+        chunks = []
+        nested_parse_with_titles = renderers.abc.nested_parse_with_titles
+
+        def spy(state, content, node):
+            chunks.append(list(content))
+            return nested_parse_with_titles(state, content, node)
+
+        monkeypatch.setattr(renderers.abc, 'nested_parse_with_titles', spy)
+        self._doctrees(tmpdir, self.spec3, {'group': ''}, ('httpdomain:old',))
+
+        # Each header and each operation is parsed on its own.
+        assert [chunk[0] for chunk in chunks] == [
+            'pets',
+            '.. http:get:: /pets/{id}',
+            '.. http:put:: /pets/{id}',
+            'stores',
+            'default',
+            '.. http:get:: /stores',
+        ]
+
+    def test_structure_is_not_parsed(self, tmpdir, monkeypatch):
+        parsed = []
+        nested_parse = RSTState.nested_parse
+
+        def spy(state, block, input_offset, node, *args, **kwargs):
+            if state.document.settings.env.docname == 'new':
+                parsed.append(list(block))
+            return nested_parse(state, block, input_offset, node, *args, **kwargs)
+
+        monkeypatch.setattr(RSTState, 'nested_parse', spy)
+        self._doctrees(tmpdir, self.spec3, {'examples': ''})
+
+        parsed = '\n'.join(line for block in parsed for line in block)
+        assert 'Returns a pet.' in parsed
+        assert ':query array fields:' not in parsed
+        assert 'HTTP/1.1 200 OK' not in parsed
+
+
+@pytest.mark.parametrize('options', [
+    {},
+    {'examples': True, 'request': True, 'group': True},
+    {'examples': True, 'paths': ['/resources'], 'include': ['/resources/']},
+])
+def test_render_has_no_side_effects(options):
+    spec = utils._normalized({
+        'openapi': '3.0.0',
+        'paths': {
+            '/resources': {
+                'get': {
+                    'requestBody': {
+                        'content': {
+                            'application/json': {
+                                'schema': {'$ref': '#/components/schemas/R'},
+                                'examples': {'sample': {'value': {'a': 1}}},
+                            },
+                        },
+                    },
+                    'responses': {
+                        '200': {
+                            'description': 'ok',
+                            'content': {
+                                'application/json': {
+                                    'schema': {
+                                        '$ref': '#/components/schemas/R',
+                                    },
+                                },
+                            },
+                        },
+                    },
+                },
+            },
+            '/resources/{id}': {
+                'parameters': [
+                    {'name': 'id', 'in': 'path', 'schema': {'type': 'string'}},
+                ],
+                'get': {
+                    'responses': {'200': {'description': 'ok'}},
+                },
+            },
+        },
+        'components': {
+            'schemas': {
+                'R': {'type': 'object', 'properties': {'a': {'type': 'integer'}}},
+            },
+        },
+    }, '')
+    pristine = copy.deepcopy(spec)
+    initial_options = copy.deepcopy(options)
+
+    renderer = renderers.HttpdomainOldRenderer(None, options)
+    first = list(renderer.render_restructuredtext_markup(spec))
+    second = list(renderer.render_restructuredtext_markup(spec))
+
+    assert first == second
+    assert spec == pristine
+    assert options == initial_options
+
+
+@pytest.mark.parametrize('render_examples', [False, True])
+def test_openapi2_examples(tmpdir, run_sphinx, render_examples):
     spec = os.path.join(
         os.path.abspath(os.path.dirname(__file__)),
         'OpenAPI-Specification',
@@ -1692,12 +3983,12 @@ def test_openapi2_examples(tmpdir, run_sphinx):
         'json',
         'uber.json')
     py.path.local(spec).copy(tmpdir.join('src', 'test-spec.yml'))
+    run_sphinx('test-spec.yml', options={'examples': render_examples})
 
-    with pytest.raises(ValueError) as excinfo:
-        run_sphinx('test-spec.yml', options={'examples': True})
+    rendered_html = tmpdir.join('out', 'index.html').read_text('utf-8')
 
-    assert str(excinfo.value) == (
-        'Rendering examples is not supported for OpenAPI v2.x specs.')
+    assert ('<strong>Example response:</strong>' in rendered_html) \
+        == render_examples
 
 
 @pytest.mark.parametrize('render_examples', [False, True])
@@ -1814,3 +4105,39 @@ class TestConvertJsonSchema(object):
             :<json string name: The name of user (required)'''.strip('\n'))
 
         assert result == expected
+
+
+def test_convert_json_schema_recursive():
+    node = {
+        'type': 'object',
+        'properties': {
+            'name': {'type': 'string'},
+            'children': {
+                'type': 'array',
+                'items': {'$ref': '#/definitions/Node'},
+            },
+        },
+    }
+
+    assert list(openapi20.convert_json_schema(node)) == [
+        ':<json Node children[]:',
+        ':<json string name:',
+    ]
+
+
+def test_convert_json_schema_max_depth():
+    schema = {
+        'type': 'object',
+        'properties': {
+            'a': {
+                'type': 'object',
+                'properties': {'b': {'type': 'string'}},
+            },
+            'c': {'type': 'string'},
+        },
+    }
+
+    assert list(openapi20.convert_json_schema(schema, max_depth=1)) == [
+        ':<json object a:',
+        ':<json string c:',
+    ]